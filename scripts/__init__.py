@@ -0,0 +1,15 @@
+"""
+MICOM time series workflow, installed as the `micom_time_series` package.
+
+The scripts import each other by their file names (`from results_store import ...`) so they
+keep running as `python <script>.py` from this folder. Importing the package puts its folder
+on `sys.path`, so the same imports resolve in the installed package without installing every
+script as a top-level module of site-packages.
+"""
+
+import os
+import sys
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+if PACKAGE_DIR not in sys.path:
+    sys.path.insert(0, PACKAGE_DIR)
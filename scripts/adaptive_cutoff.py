@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Adaptive Abundance Cutoffs for MICOM Community Models
+-----------------------------------------------------
+
+Purpose:
+`build()` applies one abundance cutoff to every sample, so the size of each community
+model (and therefore its solve time) is whatever that cutoff happens to produce. Samples
+with 150+ genera end up dominating batch wall time. This script chooses a per-sample
+abundance cutoff so that every model stays within a budget, given either as a maximum
+number of taxa or as an estimated solve time, and records how much abundance was dropped.
+
+Workflow (calibrate):
+1. Build full models (default cutoff) for a calibration subset of samples.
+2. Grow each calibration sample on its own and time it.
+3. Fit a power-law solve time model, solve_time = a * n_taxa ** b.
+4. Choose per-sample cutoffs for the budget, build pruned models and grow them.
+5. Report the dropped abundance and the change in predicted growth rates.
+
+Workflow (plan):
+1. Choose per-sample cutoffs for the budget for all samples of a subject.
+2. Save the cutoff plan (no models are built).
+
+The same cutoffs are applied in `simulate_growth_rates_edited.py` with
+`--max_taxa` or `--max_solve_time` (plus `--solve_time_model`).
+
+Inputs:
+- QIIME2 feature table and taxonomy for a subject (as in simulate_growth_rates_edited.py).
+- A model database and a diet (calibrate only).
+
+Outputs:
+- `adaptive_cutoffs.csv`: per-sample cutoff, taxa kept/dropped and dropped abundance.
+- `solve_time_model.json`: fitted solve time model (calibrate only).
+- `calibration_growth_comparison.csv`: per-taxon growth rates of full vs. pruned models
+  (calibrate only).
+- `calibration_summary.csv`: per-sample Spearman correlation and mean absolute change in
+  growth rates together with the dropped abundance (calibrate only).
+
+Usage:
+    python adaptive_cutoff.py plan --subject_id F01 --max_taxa 60 --out_dir ../data/adaptive_cutoff/
+    python adaptive_cutoff.py calibrate --subject_id F01 \
+        --model_name agora201_refseq216_genus_1.qza --solver gurobi \
+        --diet_fp ../data/diets/western_diet_gut_agora.qza --tradeoff 0.5 \
+        --max_taxa 60 --calibrate_n 5 --out_dir ../data/adaptive_cutoff/
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import json
+import time
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from diet_registry import load_diet
+
+
+def load_solve_time_model(model_fp):
+    """
+    Load a solve time model written by `fit_solve_time_model`.
+
+    Parameters:
+    model_fp (str): Path to solve_time_model.json.
+
+    Returns:
+    dict: {"a": float, "b": float} for solve_time = a * n_taxa ** b (seconds).
+    """
+    with open(model_fp) as fh:
+        return json.load(fh)
+
+
+def fit_solve_time_model(timings):
+    """
+    Fit solve_time = a * n_taxa ** b by least squares on the log-log scale.
+
+    Parameters:
+    timings (pandas.DataFrame): Columns n_taxa and solve_time (seconds), one row per sample.
+
+    Returns:
+    dict: {"a": float, "b": float, "n_samples": int}
+    """
+    timings = timings[(timings["n_taxa"] > 0) & (timings["solve_time"] > 0)]
+    if len(timings) < 2 or timings["n_taxa"].nunique() < 2:
+        raise ValueError("Need at least two samples with different numbers of taxa to fit a solve time model.")
+    b, log_a = np.polyfit(np.log(timings["n_taxa"]), np.log(timings["solve_time"]), 1)
+    return {"a": float(np.exp(log_a)), "b": float(b), "n_samples": int(len(timings))}
+
+
+def max_taxa_for_budget(max_taxa=None, max_solve_time=None, solve_time_model=None):
+    """
+    Translate a budget into the maximum number of taxa allowed per sample.
+
+    Parameters:
+    max_taxa (int, optional): Maximum number of taxa per community model.
+    max_solve_time (float, optional): Maximum estimated solve time per sample in seconds.
+    solve_time_model (dict, optional): Fitted model from `fit_solve_time_model`.
+        Required if max_solve_time is given.
+
+    Returns:
+    int: The number of taxa allowed (the stricter of the two budgets).
+    """
+    if max_taxa is None and max_solve_time is None:
+        raise ValueError("Specify at least one of max_taxa or max_solve_time.")
+    limits = []
+    if max_taxa is not None:
+        limits.append(int(max_taxa))
+    if max_solve_time is not None:
+        if solve_time_model is None:
+            raise ValueError("A solve time model is required to budget by solve time (run `calibrate` first).")
+        a, b = solve_time_model["a"], solve_time_model["b"]
+        limits.append(int(np.floor((max_solve_time / a) ** (1.0 / b))))
+    return max(1, min(limits))
+
+
+def choose_sample_cutoffs(subject_micom, n_max, min_cutoff=0.0001, solve_time_model=None, db_manifest=None):
+    """
+    Choose the smallest per-sample abundance cutoff that keeps at most n_max taxa.
+
+    Parameters:
+    subject_micom (pandas.DataFrame): Long-format taxonomy from `qiime_to_micom`.
+    n_max (int): Maximum number of taxa per sample (see `max_taxa_for_budget`).
+    min_cutoff (float): Cutoff used when a sample is already within budget (the build default).
+    solve_time_model (dict, optional): If given, estimated solve times are reported.
+    db_manifest (pandas.DataFrame, optional): Manifest of the model database. If given, only
+        taxa with a model in the database count against the budget (as `found_taxa`, the
+        quantity the solve time model is fitted on); taxa build() drops anyway are ignored.
+
+    Returns:
+    pandas.DataFrame: One row per sample_id with cutoff, n_taxa_before, n_taxa_after
+    and dropped_abundance (relative abundance removed by the adaptive cutoff).
+    """
+    if db_manifest is not None:
+        from estimate_model_coverage import match_taxa
+        matched = match_taxa(subject_micom, db_manifest, min_cutoff)
+        taxonomy = matched.loc[matched["found"], ["sample_id", "abundance"]]
+    else:
+        taxonomy = subject_micom[["sample_id", "abundance"]].copy()
+        taxonomy["abundance"] = taxonomy["abundance"] / taxonomy.groupby("sample_id")["abundance"].transform("sum")
+        taxonomy = taxonomy[taxonomy["abundance"] > min_cutoff]
+    taxonomy = taxonomy.sort_values(["sample_id", "abundance"], ascending=[True, False])
+    taxonomy["rank"] = taxonomy.groupby("sample_id").cumcount()
+
+    # the cutoff is the abundance of the first taxon outside the budget; ties at the boundary are dropped too
+    boundary = taxonomy[taxonomy["rank"] == n_max].set_index("sample_id")["abundance"]
+    plan = taxonomy.groupby("sample_id").agg(n_taxa_before=("abundance", "size"),
+                                             abundance_before=("abundance", "sum"))
+    plan["cutoff"] = boundary.reindex(plan.index).fillna(min_cutoff).clip(lower=min_cutoff)
+    kept = taxonomy[taxonomy["abundance"] > plan["cutoff"].reindex(taxonomy["sample_id"]).values]
+    plan["n_taxa_after"] = kept.groupby("sample_id").size().reindex(plan.index).fillna(0).astype(int)
+    plan["dropped_abundance"] = plan["abundance_before"] - kept.groupby("sample_id")["abundance"].sum().reindex(plan.index).fillna(0)
+    plan = plan.drop(columns="abundance_before")
+
+    if solve_time_model is not None:
+        a, b = solve_time_model["a"], solve_time_model["b"]
+        plan["est_solve_time_before"] = a * plan["n_taxa_before"] ** b
+        plan["est_solve_time_after"] = a * plan["n_taxa_after"] ** b
+
+    return plan.reset_index()
+
+
+def apply_sample_cutoffs(subject_micom, plan):
+    """
+    Remove taxa at or below each sample's adaptive cutoff.
+
+    Parameters:
+    subject_micom (pandas.DataFrame): Long-format taxonomy from `qiime_to_micom`.
+    plan (pandas.DataFrame): Output of `choose_sample_cutoffs`.
+
+    Returns:
+    pandas.DataFrame: The pruned taxonomy, ready for `build()`.
+    """
+    relative = subject_micom["abundance"] / subject_micom.groupby("sample_id")["abundance"].transform("sum")
+    cutoffs = plan.set_index("sample_id")["cutoff"].reindex(subject_micom["sample_id"]).values
+    return subject_micom[relative.values > cutoffs].reset_index(drop=True)
+
+
+def time_sample_growth(manifest, model_folder, medium, tradeoff):
+    """
+    Grow each sample in a manifest on its own and record its wall time.
+
+    Returns:
+    tuple: (growth rates for all samples, timings with sample_id, n_taxa and solve_time)
+    """
+    from micom.workflows import grow
+
+    growth_list = []
+    timings = []
+    for _, row in manifest.iterrows():
+        start = time.perf_counter()
+        growth = grow(manifest[manifest.sample_id == row["sample_id"]], model_folder,
+                      medium=medium, tradeoff=tradeoff, threads=1, presolve=True)
+        timings.append({"sample_id": row["sample_id"],
+                        "n_taxa": row["found_taxa"],
+                        "solve_time": time.perf_counter() - start})
+        growth_list.append(growth.growth_rates)
+    return pd.concat(growth_list, ignore_index=True), pd.DataFrame(timings)
+
+
+def compare_growth(growth_full, growth_pruned, plan):
+    """
+    Compare predicted growth rates of full and pruned community models.
+
+    Returns:
+    tuple: (per-taxon comparison, per-sample summary)
+    """
+    comparison = pd.merge(growth_full[["sample_id", "taxon", "abundance", "growth_rate"]],
+                          growth_pruned[["sample_id", "taxon", "growth_rate"]],
+                          on=["sample_id", "taxon"], how="left", suffixes=("_full", "_pruned"))
+    comparison["pruned"] = comparison["growth_rate_pruned"].isna()
+    comparison["abs_diff"] = (comparison["growth_rate_full"] - comparison["growth_rate_pruned"]).abs()
+
+    kept = comparison[~comparison["pruned"]]
+    summary = kept.groupby("sample_id").agg(n_taxa_compared=("taxon", "size"),
+                                            mean_abs_diff=("abs_diff", "mean"),
+                                            max_abs_diff=("abs_diff", "max"))
+    summary["spearman"] = kept.groupby("sample_id")[["growth_rate_full", "growth_rate_pruned"]] \
+        .apply(lambda df: df["growth_rate_full"].corr(df["growth_rate_pruned"], method="spearman"))
+    summary = pd.merge(summary.reset_index(), plan, on="sample_id", how="left")
+    return comparison, summary
+
+
+def plan_cutoffs(subject_id, qza_dir, max_taxa, max_solve_time, solve_time_model_fp, out_dir, model_fp=None):
+    """
+    Choose per-sample cutoffs for one subject and save the plan (counting only the taxa of
+    the model database at `model_fp`, if given).
+    """
+    # simulate_growth_rates_edited imports this module, so import its helpers here
+    from grow_helpers import load_subject_data
+    from estimate_model_coverage import load_model_db_manifest
+
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    solve_time_model = load_solve_time_model(solve_time_model_fp) if solve_time_model_fp else None
+    n_max = max_taxa_for_budget(max_taxa, max_solve_time, solve_time_model)
+
+    subject_micom = load_subject_data(subject_id, qza_dir)
+    db_manifest = load_model_db_manifest(model_fp) if model_fp else None
+    plan = choose_sample_cutoffs(subject_micom, n_max, solve_time_model=solve_time_model, db_manifest=db_manifest)
+    plan_csv = os.path.join(out_dir, f"{subject_id}_adaptive_cutoffs.csv")
+    plan.to_csv(plan_csv, index=False)
+    print(f"Keeping at most {n_max} taxa per sample; "
+          f"{(plan['n_taxa_after'] < plan['n_taxa_before']).sum()} of {len(plan)} samples pruned, "
+          f"median dropped abundance {plan['dropped_abundance'].median():.4f}")
+    print(f"Adaptive cutoffs saved to {plan_csv}")
+
+
+def calibrate(subject_id, qza_dir, model_name, model_dir, solver, threads,
+              diet_fp, tradeoff, max_taxa, max_solve_time, calibrate_n, out_dir):
+    """
+    Fit the solve time model and measure the effect of pruning on a calibration subset.
+    """
+    from micom.workflows import build, complete_community_medium
+
+    from grow_helpers import load_subject_data, add_suggested_metabolites
+    from estimate_model_coverage import load_model_db_manifest
+
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    model_fp = os.path.join(model_dir, model_name)
+
+    subject_micom = load_subject_data(subject_id, qza_dir)
+    # spread the calibration subset over the whole series
+    sample_ids = subject_micom["sample_id"].unique()
+    picks = sample_ids[np.unique(np.linspace(0, len(sample_ids) - 1, calibrate_n).astype(int))]
+    subject_micom = subject_micom[subject_micom["sample_id"].isin(picks)].reset_index(drop=True)
+
+    full_out = os.path.join(out_dir, f"pickled_{subject_id}_{Path(model_name).stem}_full")
+    pruned_out = os.path.join(out_dir, f"pickled_{subject_id}_{Path(model_name).stem}_pruned")
+
+    print(f"Building full models for {len(picks)} calibration samples...")
+    manifest_full = build(subject_micom, out_folder=full_out, model_db=model_fp,
+                          solver=solver, threads=threads)
+
+    diet_og = load_diet(diet_fp).reset_index(drop=True)
+    diet_sugg = complete_community_medium(manifest_full, model_folder=full_out, medium=diet_og,
+                                          community_growth=0.1, min_growth=0.001,
+                                          minimize_components=True, max_import=1,
+                                          threads=threads).reset_index(drop=True)
+    diet_new = add_suggested_metabolites(diet_og, diet_sugg,
+                                         added_metab_out=os.path.join(out_dir, f"added_metabolites_{subject_id}_calibration.csv"))
+
+    print("Timing growth of the full models...")
+    growth_full, timings = time_sample_growth(manifest_full, full_out, diet_new, tradeoff)
+    solve_time_model = fit_solve_time_model(timings)
+    timings.to_csv(os.path.join(out_dir, "calibration_timings.csv"), index=False)
+    with open(os.path.join(out_dir, "solve_time_model.json"), "w") as fh:
+        json.dump(solve_time_model, fh, indent=2)
+    print(f"Solve time model: {solve_time_model['a']:.4g} * n_taxa ^ {solve_time_model['b']:.3f} seconds")
+
+    n_max = max_taxa_for_budget(max_taxa, max_solve_time, solve_time_model)
+    # the model is fitted on found_taxa, so the budget only counts taxa the database can match
+    plan = choose_sample_cutoffs(subject_micom, n_max, solve_time_model=solve_time_model,
+                                 db_manifest=load_model_db_manifest(model_fp))
+    plan.to_csv(os.path.join(out_dir, f"{subject_id}_adaptive_cutoffs.csv"), index=False)
+
+    print(f"Building pruned models (at most {n_max} taxa per sample)...")
+    manifest_pruned = build(apply_sample_cutoffs(subject_micom, plan), out_folder=pruned_out,
+                            model_db=model_fp, solver=solver, threads=threads)
+    growth_pruned, timings_pruned = time_sample_growth(manifest_pruned, pruned_out, diet_new, tradeoff)
+    plan = pd.merge(plan, timings_pruned[["sample_id", "solve_time"]], on="sample_id", how="left")
+    plan = pd.merge(plan, timings[["sample_id", "solve_time"]], on="sample_id", how="left",
+                    suffixes=("_pruned", "_full"))
+
+    comparison, summary = compare_growth(growth_full, growth_pruned, plan)
+    comparison.to_csv(os.path.join(out_dir, "calibration_growth_comparison.csv"), index=False)
+    summary.to_csv(os.path.join(out_dir, "calibration_summary.csv"), index=False)
+    print(f"Median Spearman correlation full vs. pruned: {summary['spearman'].median():.3f}")
+    print(f"Calibration results saved to {out_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Choose per-sample abundance cutoffs to meet a model size or solve time budget")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    budget = argparse.ArgumentParser(add_help=False)
+    budget.add_argument("--subject_id",
+                        required=True,
+                        help="subject ID to process")
+    budget.add_argument("--qza_dir",
+                        default="../data/qiime_outputs/",
+                        help="Path to .qza feature table")
+    budget.add_argument("--max_taxa",
+                        type=int,
+                        default=None,
+                        help="Maximum number of taxa per community model")
+    budget.add_argument("--max_solve_time",
+                        type=float,
+                        default=None,
+                        help="Maximum estimated solve time per sample (seconds)")
+    budget.add_argument("--out_dir",
+                        default="../data/adaptive_cutoff/",
+                        help="Directory to save the cutoff plan and calibration report")
+
+    plan_parser = subparsers.add_parser("plan", parents=[budget],
+                                        help="Choose per-sample cutoffs without building any models")
+    plan_parser.add_argument("--solve_time_model",
+                             default=None,
+                             help="solve_time_model.json from `calibrate` (needed for --max_solve_time)")
+    plan_parser.add_argument("--model_dir",
+                             default="../data/models/",
+                             help="Path to model directory")
+    plan_parser.add_argument("--model_name",
+                             default=None,
+                             help="Model database (e.g. agora103_genus.qza); only its taxa count against the budget")
+
+    calibrate_parser = subparsers.add_parser("calibrate", parents=[budget],
+                                             help="Fit the solve time model and compare full vs. pruned growth rates")
+    calibrate_parser.add_argument("--model_dir",
+                                  default="../data/models/",
+                                  help="Path to model directory")
+    calibrate_parser.add_argument("--model_name",
+                                  required=True,
+                                  help="Name of .qza file for GSMM (e.g. agora103_genus.qza)")
+    calibrate_parser.add_argument("--solver",
+                                  default="osqp",
+                                  help="Specify solver (e.g. osqp, gurobi, cplex)")
+    calibrate_parser.add_argument("--threads",
+                                  type=int,
+                                  default=1,
+                                  help="Specify number of threads for building models")
+    calibrate_parser.add_argument("--diet_fp",
+                                  required=True,
+                                  help="Path to qiime defined medium .qza (e.g. western diet gut agora)")
+    calibrate_parser.add_argument("--tradeoff",
+                                  type=float,
+                                  default=0.5,
+                                  help="Cooperative tradeoff (value between 0-1)")
+    calibrate_parser.add_argument("--calibrate_n",
+                                  type=int,
+                                  default=5,
+                                  help="Number of samples (spread over the series) in the calibration subset")
+
+    args = parser.parse_args()
+
+    if args.command == "plan":
+        plan_cutoffs(args.subject_id, args.qza_dir,
+                     args.max_taxa, args.max_solve_time,
+                     args.solve_time_model, args.out_dir,
+                     os.path.join(args.model_dir, args.model_name) if args.model_name else None)
+    else:
+        calibrate(args.subject_id, args.qza_dir,
+                  args.model_name, args.model_dir,
+                  args.solver, args.threads,
+                  args.diet_fp, args.tradeoff,
+                  args.max_taxa, args.max_solve_time,
+                  args.calibrate_n, args.out_dir)
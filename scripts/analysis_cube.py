@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Memory-Mapped Analysis Cube
+---------------------------
+
+Purpose:
+Notebooks such as growth_rate_sim_vs_real.ipynb and M01_micom_visualizations.ipynb re-read
+dozens of growth CSVs and re-pivot them every time they start. This module materializes all
+simulated and observed values once as dense float32 arrays on disk and opens them with
+`numpy.memmap`, so any notebook or script can open the cube instantly and slice it without
+reading more than the slice:
+
+    growth_rate[combo, subject, taxon, day]   simulated growth rate
+    abundance[combo, subject, taxon, day]     relative abundance used by MICOM
+    clr_change[subject, taxon, day]           observed CLR change (actual growth rate)
+
+A combo is one (model_db, solver, diet, tradeoff) parameter combination. It is the outermost
+axis, so a new combo is appended to the end of the files and existing data is never
+rewritten. The axis labels, the combos and the signature of every stored run live in the
+sidecar `index.json`. Taxa are genus names without the "g__" prefix (as in
+combine_sim_and_real_data.py) and days are sample IDs (epoch times).
+
+Workflow:
+1. `create` fixes the subject, taxon and day axes from the results store and the observed
+   CLR tables, writes `clr_change` and appends every stored run.
+2. `append` adds new runs (and rewrites the block of runs that changed) in place; runs of
+   subjects and values whose taxon or day are not on the axes are skipped with a warning
+   (recreate to add them).
+3. `AnalysisCube(cube_dir)` opens the arrays read-only; `sel()` slices by labels and
+   `to_frame()` returns a long table.
+
+Inputs:
+- A results store (see results_store.py) and the actual CLR growth rate CSVs.
+
+Outputs:
+- `<cube_dir>/index.json`, `growth_rate.f32`, `abundance.f32`, `clr_change.f32`.
+
+Usage:
+    python analysis_cube.py create --store_dir ../data/results_store/ --cube_dir ../data/analysis_cube/
+    python analysis_cube.py append --store_dir ../data/results_store/ --cube_dir ../data/analysis_cube/
+
+    # in a notebook (from the scripts folder)
+    from analysis_cube import AnalysisCube
+    cube = AnalysisCube("../data/analysis_cube/")
+    growth, labels = cube.sel("growth_rate", subject="M01", diet="wd", tradeoff=0.8, model_db="agora201")
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+from results_store import list_runs, read_table, table_signature, PARTITION_COLUMNS
+from combine_sim_and_real_data import load_actual_clr
+
+INDEX_FILE = "index.json"
+DTYPE = "float32"
+COMBO_COLUMNS = ["model_db", "solver", "diet", "tradeoff"]
+COMBO_ARRAYS = ["growth_rate", "abundance"]
+
+
+def array_path(cube_dir, name):
+    """
+    Get the file of one cube array.
+    """
+    return os.path.join(cube_dir, f"{name}.f32")
+
+
+def load_index(cube_dir):
+    """
+    Load the sidecar index (axes, combos and stored run signatures) of a cube.
+    """
+    with open(os.path.join(cube_dir, INDEX_FILE)) as fh:
+        return json.load(fh)
+
+
+def save_index(cube_dir, index):
+    """
+    Write the sidecar index atomically, so readers never see a half-written index.
+    """
+    index_fp = os.path.join(cube_dir, INDEX_FILE)
+    tmp_fp = os.path.join(cube_dir, f".{INDEX_FILE}.tmp-{os.getpid()}")
+    with open(tmp_fp, "w") as fh:
+        json.dump(index, fh)
+    os.replace(tmp_fp, index_fp)
+
+
+def block_shape(index):
+    """
+    Get the shape of one combo block (subject x taxon x day).
+    """
+    return tuple(len(index["axes"][axis]) for axis in ["subject", "taxon", "day"])
+
+
+def run_key(run):
+    """
+    Get the key of a run in the index, e.g. "F01/agora201/gurobi/wd/0.5".
+    """
+    return "/".join(str(float(run[c]) if c == "tradeoff" else run[c]) for c in PARTITION_COLUMNS)
+
+
+def create_cube(cube_dir, store_dir, actual_dir, subject_ids=None):
+    """
+    Create a cube from a results store and the observed CLR tables, then append all stored runs.
+
+    Parameters:
+    cube_dir (str): Output folder (existing cube files are replaced).
+    store_dir (str): Results store with the simulated runs.
+    actual_dir (str): Folder with `<subject>_clr_actual_growth_rates_by_genus.csv` files.
+    subject_ids (list, optional): Subjects to include (default: all subjects in the store).
+
+    Returns:
+    dict: The cube index.
+    """
+    runs = list_runs(store_dir)
+    subjects = sorted(subject_ids or runs["subject_id"].unique())
+    growth = read_table(store_dir, "growth_rates", columns=["taxon", "sample_id"], subject_id=subjects)
+    observed = {s: load_actual_clr(s, actual_dir) for s in subjects
+                if os.path.exists(os.path.join(actual_dir, f"{s}_clr_actual_growth_rates_by_genus.csv"))}
+
+    taxa = set(growth["taxon"].str[3:])
+    days = set(pd.to_numeric(growth["sample_id"]).astype(int))
+    for clr in observed.values():
+        taxa |= set(clr["taxon"])
+        days |= set(clr["sample_id"].astype(int))
+    index = {"axes": {"subject": subjects, "taxon": sorted(taxa), "day": sorted(int(d) for d in days)},
+             "combos": [], "runs": {}, "dtype": DTYPE}
+
+    os.makedirs(cube_dir, exist_ok=True)
+    for name in COMBO_ARRAYS:
+        open(array_path(cube_dir, name), "wb").close()
+    clr_change = np.memmap(array_path(cube_dir, "clr_change"), dtype=DTYPE, mode="w+", shape=block_shape(index))
+    clr_change[:] = np.nan
+    positions = axis_positions(index)
+    for s, clr in observed.items():
+        clr_change[positions["subject"][s], [positions["taxon"][t] for t in clr["taxon"]],
+                   [positions["day"][int(d)] for d in clr["sample_id"]]] = clr["clr_change_abund"].to_numpy()
+    clr_change.flush()
+    save_index(cube_dir, index)
+    print(f"Created cube with {len(subjects)} subjects, {len(index['axes']['taxon'])} taxa and "
+          f"{len(index['axes']['day'])} days in {cube_dir}")
+    append_runs(cube_dir, store_dir)
+    return load_index(cube_dir)
+
+
+def axis_positions(index):
+    """
+    Map the labels of every axis to their positions.
+    """
+    return {axis: {label: i for i, label in enumerate(labels)} for axis, labels in index["axes"].items()}
+
+
+def append_runs(cube_dir, store_dir, overwrite=False):
+    """
+    Append new runs from the results store to the cube without rewriting existing data.
+
+    A run of a new combo appends a block to the end of every combo array; a run of a known
+    combo (or a changed run) is written into its existing block in place.
+
+    Parameters:
+    cube_dir (str): Folder of the cube.
+    store_dir (str): Results store with the simulated runs.
+    overwrite (bool): Rewrite runs even if they are unchanged.
+
+    Returns:
+    int: The number of runs written.
+    """
+    index = load_index(cube_dir)
+    positions = axis_positions(index)
+    shape = block_shape(index)
+    combos = [tuple(c) for c in index["combos"]]
+    runs = list_runs(store_dir)
+    on_axis = runs["subject_id"].isin(index["axes"]["subject"])
+    skipped_subjects = sorted(runs.loc[~on_axis, "subject_id"].unique())
+    runs = runs[on_axis]
+
+    n_written, n_dropped = 0, 0
+    for _, run in runs.iterrows():
+        key = run_key(run)
+        signature = table_signature(store_dir, "growth_rates", run)
+        if not overwrite and index["runs"].get(key) == signature:
+            continue
+        combo = (run["model_db"], run["solver"], run["diet"], float(run["tradeoff"]))
+        if combo not in combos:
+            # new combo: grow every combo array by one NaN block at the end of the file
+            block = np.full(shape, np.nan, dtype=DTYPE).tobytes()
+            for name in COMBO_ARRAYS:
+                with open(array_path(cube_dir, name), "ab") as fh:
+                    fh.write(block)
+            combos.append(combo)
+        c = combos.index(combo)
+
+        growth = read_table(store_dir, "growth_rates", columns=["taxon", "sample_id", "growth_rate", "abundance"],
+                            **{col: run[col] for col in PARTITION_COLUMNS})
+        taxa = growth["taxon"].str[3:].map(positions["taxon"])
+        days = pd.to_numeric(growth["sample_id"]).astype(int).map(positions["day"])
+        known = taxa.notna() & days.notna()
+        n_dropped += int((~known).sum())
+        s = positions["subject"][run["subject_id"]]
+        for name in COMBO_ARRAYS:
+            cube = np.memmap(array_path(cube_dir, name), dtype=DTYPE, mode="r+", shape=(len(combos),) + shape)
+            cube[c, s] = np.nan
+            cube[c, s, taxa[known].astype(int).to_numpy(), days[known].astype(int).to_numpy()] = growth.loc[known, name]
+            cube.flush()
+            del cube
+        index["combos"] = [list(combo) for combo in combos]
+        index["runs"][key] = signature
+        save_index(cube_dir, index)
+        n_written += 1
+
+    print(f"Wrote {n_written} of {len(runs)} runs to the cube ({len(combos)} combos)")
+    if n_dropped:
+        print(f"Warning: dropped {n_dropped} values with a taxon or day that is not on the cube axes "
+              f"(run `create` again to extend the axes)")
+    if skipped_subjects:
+        print(f"Warning: skipped {(~on_axis).sum()} runs of subjects that are not on the cube axes "
+              f"({', '.join(skipped_subjects)}; run `create` again to extend the axes)")
+    return n_written
+
+
+class AnalysisCube:
+    """
+    Read-only, memory-mapped view of an analysis cube.
+
+    Parameters:
+    cube_dir (str): Folder of the cube (see `create_cube`).
+    """
+
+    def __init__(self, cube_dir):
+        self.cube_dir = cube_dir
+        self.index = load_index(cube_dir)
+        self.axes = self.index["axes"]
+        self.combos = pd.DataFrame(self.index["combos"], columns=COMBO_COLUMNS)
+        self.positions = axis_positions(self.index)
+        shape = block_shape(self.index)
+        self.arrays = {name: np.memmap(array_path(cube_dir, name), dtype=DTYPE, mode="r",
+                                       shape=(len(self.combos),) + shape)
+                       for name in COMBO_ARRAYS if len(self.combos)}
+        self.arrays["clr_change"] = np.memmap(array_path(cube_dir, "clr_change"), dtype=DTYPE, mode="r", shape=shape)
+
+    def combo_positions(self, **combo):
+        """
+        Get the positions of the combos matching the given model_db, solver, diet and tradeoff values.
+        """
+        mask = np.ones(len(self.combos), dtype=bool)
+        for col, value in combo.items():
+            if col not in COMBO_COLUMNS:
+                raise ValueError(f"Can only select combos on {', '.join(COMBO_COLUMNS)}, not `{col}`")
+            if value is not None:
+                values = value if isinstance(value, (list, tuple, set)) else [value]
+                values = [float(v) for v in values] if col == "tradeoff" else [str(v) for v in values]
+                mask &= self.combos[col].isin(values).to_numpy()
+        return np.flatnonzero(mask)
+
+    def label_positions(self, axis, labels):
+        """
+        Get the positions of labels on an axis (raises ValueError for unknown labels).
+        """
+        unknown = [label for label in labels if label not in self.positions[axis]]
+        if unknown:
+            raise ValueError(f"Unknown {axis} labels: {', '.join(str(u) for u in unknown)}")
+        return [self.positions[axis][label] for label in labels]
+
+    def _selector(self, axis, labels):
+        """
+        Turn labels into an index: a single label drops the axis, None keeps all (both zero-copy).
+        """
+        if labels is None:
+            return slice(None), self.axes[axis]
+        if isinstance(labels, (list, tuple, set, np.ndarray, pd.Index)):
+            labels = list(labels)
+            return self.label_positions(axis, labels), labels
+        return self.label_positions(axis, [labels])[0], None
+
+    def sel(self, array="growth_rate", subject=None, taxon=None, day=None, **combo):
+        """
+        Slice an array by labels.
+
+        Single labels and None (all) give zero-copy views of the memory map; lists of labels
+        or a combo filter that matches several non-adjacent combos make a copy of the slice.
+
+        Parameters:
+        array (str): "growth_rate", "abundance" or "clr_change".
+        subject, taxon, day: A label, a list of labels or None (all).
+        **combo: model_db, solver, diet and/or tradeoff values (combo arrays only).
+
+        Returns:
+        tuple: (numpy array, dict of the labels of the remaining axes)
+        """
+        data = self.arrays[array]
+        index, labels = [], {}
+        if array in COMBO_ARRAYS:
+            combos = self.combo_positions(**combo)
+            if len(combos) == 1:
+                index.append(int(combos[0]))
+            elif len(combos) == len(self.combos):
+                index.append(slice(None))
+                labels["combo"] = self.combos
+            else:
+                index.append(combos)
+                labels["combo"] = self.combos.iloc[combos].reset_index(drop=True)
+        for axis, value in (("subject", subject), ("taxon", taxon), ("day", day)):
+            selector, axis_labels = self._selector(axis, value)
+            index.append(selector)
+            if axis_labels is not None:
+                labels[axis] = axis_labels
+        # apply list selectors one axis at a time (numpy would broadcast several lists together)
+        lists = [i for i, s in enumerate(index) if isinstance(s, (list, np.ndarray))]
+        basic = tuple(slice(None) if i in lists else s for i, s in enumerate(index))
+        result = data[basic]
+        kept = [i for i, s in enumerate(basic) if not isinstance(s, (int, np.integer))]
+        for i in lists:
+            result = np.take(result, index[i], axis=kept.index(i))
+        return result, labels
+
+    def to_frame(self, array="growth_rate", subject=None, taxon=None, day=None, dropna=True, **combo):
+        """
+        Return a slice as a long table (one row per value), e.g. to plot with seaborn.
+        """
+        if array in COMBO_ARRAYS:
+            combos = self.combo_positions(**combo)
+            frames = [self._frame_block(array, self.arrays[array][c], subject, taxon, day, dropna)
+                      .assign(**self.combos.iloc[c].to_dict()) for c in combos]
+            return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        return self._frame_block(array, self.arrays[array], subject, taxon, day, dropna)
+
+    def _frame_block(self, array, block, subject=None, taxon=None, day=None, dropna=True):
+        """
+        Return one subject x taxon x day block as a long table.
+        """
+        positions, labels = [], []
+        for axis, value in (("subject", subject), ("taxon", taxon), ("day", day)):
+            axis_labels = self.axes[axis] if value is None else list(np.atleast_1d(value))
+            positions.append(self.label_positions(axis, axis_labels))
+            labels.append(axis_labels)
+        values = block[np.ix_(*positions)]
+        frame = pd.DataFrame({"subject_id": np.repeat(labels[0], len(labels[1]) * len(labels[2])),
+                              "taxon": np.tile(np.repeat(labels[1], len(labels[2])), len(labels[0])),
+                              "sample_id": np.tile(labels[2], len(labels[0]) * len(labels[1])),
+                              array: values.ravel()})
+        return frame.dropna(subset=[array]) if dropna else frame
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory-mapped cube of simulated and observed results")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    create_parser = subparsers.add_parser("create", help="Create the cube and append all stored runs")
+    create_parser.add_argument("--actual_dir", default="../data/actual_growth_rates_genus_clr/",
+                               help="Folder with <subject>_clr_actual_growth_rates_by_genus.csv files")
+    create_parser.add_argument("--subject_ids", nargs="+", default=None, help="Subjects to include (default: all)")
+    append_parser = subparsers.add_parser("append", help="Append new or changed runs to the cube")
+    append_parser.add_argument("--overwrite", action="store_true", help="Rewrite unchanged runs too")
+    for sub in (create_parser, append_parser):
+        sub.add_argument("--store_dir", default="../data/results_store/", help="Root folder of the results store")
+        sub.add_argument("--cube_dir", default="../data/analysis_cube/", help="Folder of the cube")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        create_cube(args.cube_dir, args.store_dir, args.actual_dir, args.subject_ids)
+    else:
+        append_runs(args.cube_dir, args.store_dir, args.overwrite)
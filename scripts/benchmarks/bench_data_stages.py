@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Scaling Benchmark of the Data Stages
+------------------------------------
+
+Purpose:
+Measure how the data stages scale with the size of the cohort, and catch performance
+regressions. Every stage runs on synthetic cohorts (see synthetic_cohort.py) of the requested
+sizes, in a fresh process, so its wall time and peak memory (maximum resident set size) are
+not affected by the other stages. Each measurement is appended to a JSON history together
+with the git commit and host, and compared to the median of the earlier measurements of the
+same stage, size and host: a stage that got slower or bigger than the tolerance is reported
+as a regression and the script exits with status 1.
+
+Stages:
+- `generate`: generate the cohort (BIOM table, metadata, taxonomy and per-subject tables).
+- `wrangle`: time_series_data_wrangling.py on all subjects (loads the BIOM table, averages
+  same-day samples, interpolates missing days; needs the biom package).
+- `actual`: the CLR growth rates by genus of calculate_actual_growth_rates_genus_clr.py on
+  every per-subject feature table (the QIIME2 export steps are not included).
+
+Workflow:
+1. For every size (`<n_subjects>x<n_otus>`) and stage, run the stage `--repeats` times in a
+   child process (`--run_stage`), which reports its wall time and peak RSS; keep the minimum.
+2. Compare each measurement to the baseline from the history (median of the last
+   `--baseline_runs` measurements that were not regressions).
+3. Append the measurements to the history and print the comparison.
+
+Inputs:
+- Nothing; the cohorts are generated in `--work_dir` (kept between runs, regenerate with
+  the `generate` stage).
+
+Outputs:
+- `--history` (JSON): list of measurements (stage, size, seed, wall_time_s, peak_rss_mb,
+  repeats, commit, host, timestamp, regression).
+
+Usage:
+    python bench_data_stages.py --sizes 10x1000 100x10000
+    # full grid (hours and tens of GB of memory for the largest sizes)
+    python bench_data_stages.py --sizes 10x1000 100x1000 1000x10000 5000x10000 1000x100000 5000x100000
+    # only compare, without recording
+    python bench_data_stages.py --sizes 10x1000 --stages actual --no_record
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import resource
+import importlib.util
+import subprocess
+import statistics
+from datetime import datetime
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(SCRIPT_DIR, ".."))
+
+STAGES = ["generate", "wrangle", "actual"]
+DEFAULT_WORK_DIR = os.path.join(SCRIPT_DIR, "..", "..", "data", "benchmarks", "cohorts")
+DEFAULT_HISTORY = os.path.join(SCRIPT_DIR, "..", "..", "data", "benchmarks", "data_stages_history.json")
+
+
+def parse_size(size):
+    """
+    Parse a cohort size written as `<n_subjects>x<n_otus>` (e.g. 100x10000).
+    """
+    n_subjects, n_otus = size.lower().split("x")
+    return int(n_subjects), int(n_otus)
+
+
+def cohort_dir(work_dir, n_subjects, n_otus, seed):
+    return os.path.join(work_dir, f"{n_subjects}x{n_otus}_seed{seed}")
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB (ru_maxrss is in kB on Linux, bytes on macOS).
+    """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 ** 2 if sys.platform == "darwin" else maxrss / 1024
+
+
+def run_stage(stage, n_subjects, n_otus, seed, work_dir):
+    """
+    Run one stage on one cohort (in the current process).
+
+    Returns:
+    float: Wall time of the stage in seconds (imports excluded).
+    """
+    data_dir = cohort_dir(work_dir, n_subjects, n_otus, seed)
+    if stage == "generate":
+        from synthetic_cohort import generate_cohort
+        # the BIOM table is only needed by `wrangle`, which cannot run without biom anyway
+        no_biom = importlib.util.find_spec("biom") is None
+        start = time.perf_counter()
+        generate_cohort(n_subjects, n_otus, data_dir, seed, feature_tables=True, no_biom=no_biom)
+        return time.perf_counter() - start
+
+    if not os.path.exists(os.path.join(data_dir, "cohort.json")):
+        raise FileNotFoundError(f"No cohort in {data_dir}, run the `generate` stage first")
+    from synthetic_cohort import subject_names
+    subjects = subject_names(n_subjects)
+
+    if stage == "wrangle":
+        if not os.path.exists(os.path.join(data_dir, "cohort.biom")):
+            raise FileNotFoundError(f"No BIOM table in {data_dir} (install biom and run the `generate` stage again)")
+        import time_series_data_wrangling
+        out_dir = os.path.join(data_dir, "wrangled", "")
+        start = time.perf_counter()
+        time_series_data_wrangling.main(os.path.join(data_dir, "cohort.biom"), os.path.join(data_dir, "metadata.csv"),
+                                        os.path.join(out_dir, "intermediate", ""), out_dir, subjects)
+        return time.perf_counter() - start
+
+    if stage == "actual":
+        import pandas as pd
+        from calculate_actual_growth_rates_genus_clr import read_taxonomy_tsv, clr_growth_by_genus
+        out_dir = os.path.join(data_dir, "actual_growth_rates")
+        os.makedirs(out_dir, exist_ok=True)
+        start = time.perf_counter()
+        taxonomy = read_taxonomy_tsv(os.path.join(data_dir, "taxonomy.tsv"))
+        for subject in subjects:
+            feature_table = pd.read_csv(os.path.join(data_dir, "feature_tables", f"{subject}_feature_table.tsv"),
+                                        sep="\t", skiprows=1, index_col=0)
+            growth_by_genus = clr_growth_by_genus(feature_table, taxonomy, subject)
+            growth_by_genus.to_csv(os.path.join(out_dir, f"{subject}_clr_actual_growth_rates_by_genus.csv"))
+        return time.perf_counter() - start
+
+    raise ValueError(f"Unknown stage `{stage}` (choose from {', '.join(STAGES)})")
+
+
+def measure(stage, n_subjects, n_otus, seed, work_dir, log_fp):
+    """
+    Run a stage in a fresh process and collect its wall time and peak RSS.
+
+    Returns:
+    dict: The measurement (without commit/host), or None if the stage failed.
+    """
+    argv = [sys.executable, os.path.abspath(__file__), "--run_stage", stage, "--sizes", f"{n_subjects}x{n_otus}",
+            "--seed", str(seed), "--work_dir", work_dir]
+    with open(log_fp, "a") as log:
+        proc = subprocess.run(argv, stdout=subprocess.PIPE, stderr=log, text=True)
+    # the stage prints progress; the measurement is the last line
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        with open(log_fp, "a") as log:
+            log.write(proc.stdout)
+        print(f"{stage} {n_subjects}x{n_otus} failed (exit {proc.returncode}), see {log_fp}")
+        return None
+    with open(log_fp, "a") as log:
+        log.write("\n".join(lines[:-1]) + "\n")
+    result = json.loads(lines[-1])
+    return {"stage": stage, "n_subjects": n_subjects, "n_otus": n_otus, "seed": seed, **result}
+
+
+def git_commit():
+    """
+    Current git commit of the repository (with `-dirty` for uncommitted changes), if any.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPT_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=SCRIPT_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+def load_history(history_fp):
+    if not os.path.exists(history_fp):
+        return []
+    with open(history_fp) as fh:
+        return json.load(fh)
+
+
+def baseline(history, record, baseline_runs, keys=("stage", "n_subjects", "n_otus", "seed", "host")):
+    """
+    Median wall time and peak RSS of the last `baseline_runs` earlier measurements with the same
+    `keys` (stage, size, seed and host by default; regressions excluded). None if there are none.
+    """
+    earlier = [r for r in history if all(r.get(k) == record[k] for k in keys) and not r.get("regression")]
+    earlier = earlier[-baseline_runs:]
+    if not earlier:
+        return None
+    return {"wall_time_s": statistics.median(r["wall_time_s"] for r in earlier),
+            "peak_rss_mb": statistics.median(r["peak_rss_mb"] for r in earlier),
+            "n_runs": len(earlier)}
+
+
+def compare(record, base, time_tolerance, rss_tolerance):
+    """
+    Flag a measurement that exceeds its baseline by more than the tolerances (fractions).
+
+    Returns:
+    list: Descriptions of the regressions (empty if none).
+    """
+    if base is None:
+        return []
+    regressions = []
+    for col, tolerance in (("wall_time_s", time_tolerance), ("peak_rss_mb", rss_tolerance)):
+        if record[col] > base[col] * (1 + tolerance):
+            regressions.append(f"{col} {record[col]:.2f} > {base[col]:.2f} (+{tolerance:.0%})")
+    return regressions
+
+
+def main(sizes, stages, seed, work_dir, history_fp, time_tolerance=0.25, rss_tolerance=0.25, baseline_runs=5,
+         repeats=3, record=True):
+    """
+    Run the benchmark and compare it with the history.
+
+    Parameters:
+    sizes (list): Cohort sizes as (n_subjects, n_otus).
+    stages (list): Stages to run (in this order).
+    seed (int): Seed of the synthetic cohorts.
+    work_dir (str): Folder for the cohorts and stage outputs.
+    history_fp (str): JSON history of the measurements.
+    time_tolerance, rss_tolerance (float): Allowed increase over the baseline (0.25 = 25%).
+    baseline_runs (int): Number of earlier measurements in the baseline median.
+    repeats (int): Runs per stage and size; the minimum wall time and peak RSS are kept.
+    record (bool): Append the measurements to the history.
+
+    Returns:
+    int: 0 if every stage ran without regression, 1 otherwise.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    log_fp = os.path.join(work_dir, "benchmark.log")
+    history = load_history(history_fp)
+    commit, host, timestamp = git_commit(), socket.gethostname(), datetime.now().isoformat(timespec="seconds")
+
+    failed, records = False, []
+    print(f"{'stage':<9} {'size':>12} {'time (s)':>10} {'base':>10} {'RSS (MB)':>10} {'base':>10}  result")
+    for n_subjects, n_otus in sizes:
+        for stage in stages:
+            if stage != "generate" and not os.path.exists(
+                    os.path.join(cohort_dir(work_dir, n_subjects, n_otus, seed), "cohort.json")):
+                # later stages need the cohort; generate it once without measuring
+                measure("generate", n_subjects, n_otus, seed, work_dir, log_fp)
+            runs = [measure(stage, n_subjects, n_otus, seed, work_dir, log_fp) for _ in range(repeats)]
+            if None in runs:
+                failed = True
+                continue
+            # the fastest and smallest of the repeats is the least disturbed by other load on the host
+            result = {**runs[0], "wall_time_s": min(r["wall_time_s"] for r in runs),
+                      "peak_rss_mb": min(r["peak_rss_mb"] for r in runs), "repeats": repeats}
+            result.update(commit=commit, host=host, timestamp=timestamp)
+            base = baseline(history, result, baseline_runs)
+            regressions = compare(result, base, time_tolerance, rss_tolerance)
+            result["regression"] = bool(regressions)
+            failed |= result["regression"]
+            records.append(result)
+            base_time = f"{base['wall_time_s']:.2f}" if base else "-"
+            base_rss = f"{base['peak_rss_mb']:.0f}" if base else "-"
+            status = "REGRESSION: " + "; ".join(regressions) if regressions else ("ok" if base else "new")
+            print(f"{stage:<9} {f'{n_subjects}x{n_otus}':>12} {result['wall_time_s']:>10.2f} {base_time:>10} "
+                  f"{result['peak_rss_mb']:>10.0f} {base_rss:>10}  {status}")
+
+    if record and records:
+        os.makedirs(os.path.dirname(os.path.abspath(history_fp)), exist_ok=True)
+        with open(history_fp, "w") as fh:
+            json.dump(history + records, fh, indent=1)
+        print(f"{len(records)} measurements added to {history_fp}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scaling and regression benchmark of the data stages")
+    parser.add_argument("--sizes", nargs="+", default=["10x1000", "100x10000"],
+                        help="Cohort sizes as <n_subjects>x<n_otus>")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES, help="Stages to run")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic cohorts")
+    parser.add_argument("--work_dir", default=DEFAULT_WORK_DIR, help="Folder for the cohorts and stage outputs")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON history of the measurements")
+    parser.add_argument("--time_tolerance", type=float, default=0.25, help="Allowed wall time increase (fraction)")
+    parser.add_argument("--rss_tolerance", type=float, default=0.25, help="Allowed peak RSS increase (fraction)")
+    parser.add_argument("--baseline_runs", type=int, default=5, help="Earlier measurements in the baseline median")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per stage and size (the minimum is kept)")
+    parser.add_argument("--no_record", action="store_true", help="Compare without adding to the history")
+    parser.add_argument("--run_stage", choices=STAGES, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    sizes = [parse_size(size) for size in args.sizes]
+    if args.run_stage is not None:
+        # child process: run one stage and print the measurement as the last line
+        wall_time = run_stage(args.run_stage, *sizes[0], args.seed, args.work_dir)
+        print(json.dumps({"wall_time_s": round(wall_time, 4), "peak_rss_mb": round(peak_rss_mb(), 1)}))
+        sys.exit(0)
+
+    sys.exit(main(sizes, args.stages, args.seed, args.work_dir, args.history, args.time_tolerance,
+                  args.rss_tolerance, args.baseline_runs, args.repeats, not args.no_record))
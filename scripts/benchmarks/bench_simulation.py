@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Offline Simulation Benchmark on Toy Community Models
+----------------------------------------------------
+
+Purpose:
+The simulation stage normally needs the AGORA databases and a Gurobi license, so solver and
+grow-path changes could not be measured on a plain Linux box. This benchmark builds a small
+model database of toy genera (variants of the E. coli core model bundled with micom, each with
+a few random non-lethal knockouts) and communities of configurable size, then runs the same
+build, medium completion and grow steps as simulate_growth_rates_edited.py with open-source
+solvers (osqp, hybrid, ...). It reports the latency of each stage, the distribution of
+per-sample times and the throughput, and keeps a JSON history like bench_data_stages.py, so a
+speedup (or regression) shows up as a comparison with the earlier runs on the same host.
+
+Workflow:
+1. Build (or reuse) the toy genus model database (`n_genera` genera, micom's build_database).
+2. Draw `n_samples` samples of `taxa_per_sample` genera with log-normal abundances.
+3. For every solver: `build()`, medium completion (fast_medium.py; `milp` uses micom's
+   `complete_community_medium`) of a diet that lacks `--drop` components, then grow with
+   robust_grow.py (per-sample times) or micom's `grow()` (`--grow_path micom`).
+4. Compare each stage with the history, print the summary and append the measurements.
+
+Inputs:
+- Nothing but micom (the E. coli core model ships with it).
+
+Outputs:
+- `--history` (JSON): per stage and solver: wall_time_s, peak_rss_mb (peak of the benchmark
+  and its workers up to the end of the stage), samples_per_s, sample_p50_s/p90_s/max_s,
+  n_failed, the configuration, commit, host and timestamp.
+- `<work_dir>/sample_times.csv`: per-sample times of the last run.
+
+Usage:
+    python bench_simulation.py --solvers osqp hybrid --n_samples 8 --taxa_per_sample 6 --threads 4
+    python bench_simulation.py --solvers osqp --n_samples 20 --grow_path micom --no_record
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import argparse
+import resource
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(SCRIPT_DIR, ".."))
+
+from bench_data_stages import git_commit, load_history, baseline, compare
+
+STAGES = ["build", "medium", "grow"]
+DEFAULT_WORK_DIR = os.path.join(SCRIPT_DIR, "..", "..", "data", "benchmarks", "simulation")
+DEFAULT_HISTORY = os.path.join(SCRIPT_DIR, "..", "..", "data", "benchmarks", "simulation_history.json")
+BIOMASS = "BIOMASS_Ecoli_core_w_GAM"
+CONFIG_KEYS = ["stage", "solver", "n_genera", "n_samples", "taxa_per_sample", "medium_completion",
+               "grow_path", "threads", "seed", "host"]
+
+
+def make_toy_db(db_dir, n_genera, seed=0, knockouts=3, min_growth=0.1):
+    """
+    Build a genus model database of toy taxa with micom's `build_database`. Every genus joins
+    one or two species models: copies of the E. coli core model, each with `knockouts` random
+    reactions removed that keep its growth rate above `min_growth`.
+
+    Parameters:
+    db_dir (str): Folder for the species models and the database.
+    n_genera (int): Number of genera.
+    seed (int): Random seed.
+    knockouts (int): Reactions knocked out per species.
+    min_growth (float): Minimal growth rate of each species on its own.
+
+    Returns:
+    str: Path of the database (.zip), reused as is if it was built with the same settings.
+    """
+    db_fp = os.path.join(db_dir, "toy_genus_db.zip")
+    settings = {"n_genera": n_genera, "seed": seed, "knockouts": knockouts, "min_growth": min_growth}
+    settings_fp = os.path.join(db_dir, "toy_db.json")
+    if os.path.exists(settings_fp) and os.path.exists(db_fp):
+        with open(settings_fp) as fh:
+            if json.load(fh) == settings:
+                return db_fp
+
+    import cobra
+    from micom.data import this_dir
+    from micom.workflows import build_database
+    os.makedirs(os.path.join(db_dir, "species"), exist_ok=True)
+    base = cobra.io.read_sbml_model(os.path.join(this_dir, "e_coli_core.xml.gz"))
+    internal = [r.id for r in base.reactions if not r.boundary and r.id != BIOMASS]
+    rng = np.random.default_rng([seed, 2])
+    manifest = []
+    for g in range(n_genera):
+        for sp in range(int(rng.integers(1, 3))):
+            model = base.copy()
+            model.id = f"Genus{g}_species{sp}"
+            removed = 0
+            for rid in rng.permutation(internal):
+                with model:
+                    model.reactions.get_by_id(rid).knock_out()
+                    viable = model.slim_optimize(error_value=0.0) > min_growth
+                if viable:
+                    model.reactions.get_by_id(rid).knock_out()
+                    removed += 1
+                if removed == knockouts:
+                    break
+            model_fp = os.path.join(db_dir, "species", f"{model.id}.json")
+            cobra.io.save_json_model(model, model_fp)
+            manifest.append({"id": model.id, "file": model_fp, "kingdom": "Bacteria", "phylum": "Toy",
+                             "class": "Toy", "order": "Toy", "family": "Toy", "genus": f"Genus{g}",
+                             "species": f"Genus{g} species{sp}"})
+    build_database(pd.DataFrame(manifest), db_fp, rank="genus", threads=1, progress=False)
+    with open(settings_fp, "w") as fh:
+        json.dump(settings, fh)
+    return db_fp
+
+
+def make_toy_taxonomy(n_samples, n_genera, taxa_per_sample, seed=0):
+    """
+    Draw the taxonomy table of the toy communities (the format of load_subject_data).
+
+    Returns:
+    pandas.DataFrame: Columns "id", "genus", "sample_id" and "abundance".
+    """
+    rng = np.random.default_rng([seed, 3])
+    rows = []
+    for s in range(n_samples):
+        genera = rng.choice(n_genera, size=min(taxa_per_sample, n_genera), replace=False)
+        for g, abundance in zip(genera, rng.lognormal(0, 1, len(genera))):
+            rows.append({"id": f"Genus{g}", "genus": f"Genus{g}", "sample_id": f"sample_{s + 1:03d}",
+                         "abundance": abundance})
+    return pd.DataFrame(rows)
+
+
+def toy_diet(drop=()):
+    """
+    The E. coli core medium as a community diet with the columns of a QIIME2 diet ("reaction",
+    "metabolite", "global_id" and "flux"), without the exchanges in `drop` so medium completion
+    has components to add.
+    """
+    import cobra
+    from micom.data import this_dir
+    medium = cobra.io.read_sbml_model(os.path.join(this_dir, "e_coli_core.xml.gz")).medium
+    reactions = [rid.replace("_e", "_m") for rid in medium]
+    diet = pd.DataFrame({"reaction": reactions, "metabolite": [rid[3:] for rid in reactions],
+                         "global_id": list(medium), "flux": list(medium.values())})
+    return diet[~diet.reaction.isin(drop)].reset_index(drop=True)
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process and its finished workers in MB (ru_maxrss is in kB
+    on Linux, bytes on macOS).
+    """
+    maxrss = max(resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+    return maxrss / 1024 ** 2 if sys.platform == "darwin" else maxrss / 1024
+
+
+def run_solver(solver, taxonomy, model_db, diet, work_dir, medium_completion="greedy", grow_path="robust",
+               tradeoff=0.5, threads=1):
+    """
+    Build, complete the medium and grow all toy samples with one solver.
+
+    Returns:
+    list of dict, pandas.DataFrame: One measurement per stage, and the per-sample times.
+    """
+    from micom.workflows import build, grow, complete_community_medium
+    from fast_medium import complete_community_medium_fast
+    from robust_grow import build_attempts, grow_with_timeouts
+    from grow_helpers import add_suggested_metabolites
+
+    model_folder = os.path.join(work_dir, f"models_{solver}")
+    # build() skips samples that already have a model, which would not measure anything
+    shutil.rmtree(model_folder, ignore_errors=True)
+    n_samples = taxonomy.sample_id.nunique()
+    stages, sample_times = [], []
+
+    def record(stage, start, times=None, n_failed=0):
+        wall_time = time.perf_counter() - start
+        entry = {"stage": stage, "solver": solver, "wall_time_s": round(wall_time, 4),
+                 "peak_rss_mb": round(peak_rss_mb(), 1), "samples_per_s": round(n_samples / wall_time, 4),
+                 "n_failed": int(n_failed)}
+        if times is not None and len(times):
+            entry.update(sample_p50_s=round(float(np.percentile(times, 50)), 4),
+                         sample_p90_s=round(float(np.percentile(times, 90)), 4),
+                         sample_max_s=round(float(np.max(times)), 4))
+        stages.append(entry)
+
+    start = time.perf_counter()
+    manifest = build(taxonomy, out_folder=model_folder, model_db=model_db, solver=solver, threads=threads)
+    record("build", start)
+
+    start = time.perf_counter()
+    if medium_completion == "milp":
+        completed = complete_community_medium(manifest, model_folder=model_folder, medium=diet, community_growth=0.1,
+                                              min_growth=0.001, minimize_components=True, max_import=1,
+                                              threads=threads)
+        record("medium", start)
+    else:
+        completed, report = complete_community_medium_fast(manifest, model_folder=model_folder, medium=diet,
+                                                           community_growth=0.1, min_growth=0.001, max_import=1,
+                                                           strategy=medium_completion, threads=threads)
+        record("medium", start, report["wall_time"].to_numpy(), (~report["feasible"]).sum())
+        sample_times.append(report[["sample_id", "wall_time"]].assign(stage="medium", status=report["feasible"]
+                                                                        .map({True: "feasible", False: "infeasible"})))
+    # the completed components are added to the diet, as in the simulation script
+    medium = add_suggested_metabolites(diet, completed,
+                                       added_metab_out=os.path.join(work_dir, f"added_metabolites_{solver}.csv"))
+
+    start = time.perf_counter()
+    if grow_path == "micom":
+        grow(manifest, model_folder, medium=medium, tradeoff=tradeoff, threads=threads, presolve=True)
+        record("grow", start)
+    else:
+        _, attempts_log = grow_with_timeouts(manifest, model_folder, medium=medium, tradeoff=tradeoff,
+                                             attempts=build_attempts(solver, ()), sample_timeout=None,
+                                             threads=threads)
+        record("grow", start, attempts_log["wall_time"].to_numpy(), (attempts_log["status"] != "optimal").sum())
+        sample_times.append(attempts_log[["sample_id", "wall_time", "status"]].assign(stage="grow"))
+
+    sample_times = pd.concat(sample_times, ignore_index=True) if sample_times else pd.DataFrame()
+    return stages, sample_times.assign(solver=solver)
+
+
+def main(solvers, n_genera, n_samples, taxa_per_sample, work_dir, history_fp, seed=0, drop=("EX_pi_m",),
+         medium_completion="greedy", grow_path="robust", tradeoff=0.5, threads=1, time_tolerance=0.25,
+         rss_tolerance=0.25, baseline_runs=5, record=True):
+    """
+    Run the benchmark for every solver and compare it with the history.
+
+    Parameters:
+    solvers (list): Solvers to benchmark (e.g. osqp, hybrid).
+    n_genera (int): Genera in the toy model database.
+    n_samples (int): Number of toy samples.
+    taxa_per_sample (int): Genera per sample.
+    work_dir (str): Folder for the model database, built models and per-sample times.
+    history_fp (str): JSON history of the measurements.
+    seed (int): Random seed of the models and samples.
+    drop (list): Exchanges removed from the diet (added back by medium completion).
+    medium_completion (str): "lp", "greedy" or "milp".
+    grow_path (str): "robust" (robust_grow.py, per-sample times) or "micom" (micom's grow()).
+    tradeoff (float): Cooperative tradeoff.
+    threads (int): Samples processed in parallel.
+    time_tolerance, rss_tolerance (float): Allowed increase over the baseline (0.25 = 25%).
+    baseline_runs (int): Number of earlier measurements in the baseline median.
+    record (bool): Append the measurements to the history.
+
+    Returns:
+    int: 0 if every stage ran without regression, 1 otherwise.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    model_db = make_toy_db(os.path.join(work_dir, f"toy_db_{n_genera}_seed{seed}"), n_genera, seed)
+    taxonomy = make_toy_taxonomy(n_samples, n_genera, taxa_per_sample, seed)
+    diet = toy_diet(drop)
+    history = load_history(history_fp)
+    config = {"n_genera": n_genera, "n_samples": n_samples, "taxa_per_sample": taxa_per_sample,
+              "medium_completion": medium_completion, "grow_path": grow_path, "threads": threads, "seed": seed,
+              "commit": git_commit(), "host": socket.gethostname(),
+              "timestamp": datetime.now().isoformat(timespec="seconds")}
+
+    failed, records, sample_times = False, [], []
+    for solver in solvers:
+        try:
+            stages, times = run_solver(solver, taxonomy, model_db, diet, work_dir, medium_completion, grow_path,
+                                       tradeoff, threads)
+        except Exception as error:
+            print(f"{solver} failed: {error}")
+            failed = True
+            continue
+        sample_times.append(times)
+        for entry in stages:
+            entry.update(config)
+            base = baseline(history, entry, baseline_runs, CONFIG_KEYS)
+            regressions = compare(entry, base, time_tolerance, rss_tolerance)
+            entry["regression"] = bool(regressions)
+            entry["baseline_wall_time_s"] = base["wall_time_s"] if base else None
+            entry["result"] = "REGRESSION: " + "; ".join(regressions) if regressions else ("ok" if base else "new")
+            failed |= entry["regression"] or entry["n_failed"] > 0
+            records.append(entry)
+
+    if records:
+        summary = pd.DataFrame(records)
+        for col in ("sample_p50_s", "sample_p90_s", "sample_max_s"):
+            if col not in summary:
+                summary[col] = np.nan
+        print(summary[["solver", "stage", "wall_time_s", "baseline_wall_time_s", "samples_per_s", "sample_p50_s",
+                       "sample_p90_s", "sample_max_s", "peak_rss_mb", "n_failed", "result"]].to_string(index=False))
+    if sample_times:
+        pd.concat(sample_times, ignore_index=True).to_csv(os.path.join(work_dir, "sample_times.csv"), index=False)
+
+    if record and records:
+        os.makedirs(os.path.dirname(os.path.abspath(history_fp)), exist_ok=True)
+        with open(history_fp, "w") as fh:
+            json.dump(history + [{k: v for k, v in r.items() if k != "result"} for r in records], fh, indent=1)
+        print(f"{len(records)} measurements added to {history_fp}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark build, medium completion and grow on toy models")
+    parser.add_argument("--solvers", nargs="+", default=["osqp", "hybrid"], help="Solvers to benchmark")
+    parser.add_argument("--n_genera", type=int, default=10, help="Genera in the toy model database")
+    parser.add_argument("--n_samples", type=int, default=8, help="Number of toy samples")
+    parser.add_argument("--taxa_per_sample", type=int, default=5, help="Genera per sample")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the models and samples")
+    parser.add_argument("--drop", nargs="*", default=["EX_pi_m"],
+                        help="Exchanges removed from the diet (added back by medium completion)")
+    parser.add_argument("--medium_completion", choices=["lp", "greedy", "milp"], default="greedy",
+                        help="Medium completion as in simulate_growth_rates_edited.py")
+    parser.add_argument("--grow_path", choices=["robust", "micom"], default="robust",
+                        help="robust_grow.py (per-sample times) or micom's grow()")
+    parser.add_argument("--tradeoff", type=float, default=0.5, help="Cooperative tradeoff")
+    parser.add_argument("--threads", type=int, default=1, help="Samples processed in parallel")
+    parser.add_argument("--work_dir", default=DEFAULT_WORK_DIR, help="Folder for the toy models")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON history of the measurements")
+    parser.add_argument("--time_tolerance", type=float, default=0.25, help="Allowed wall time increase (fraction)")
+    parser.add_argument("--rss_tolerance", type=float, default=0.25, help="Allowed peak RSS increase (fraction)")
+    parser.add_argument("--baseline_runs", type=int, default=5, help="Earlier measurements in the baseline median")
+    parser.add_argument("--no_record", action="store_true", help="Compare without adding to the history")
+    args = parser.parse_args()
+
+    sys.exit(main(args.solvers, args.n_genera, args.n_samples, args.taxa_per_sample, args.work_dir, args.history,
+                  args.seed, args.drop, args.medium_completion, args.grow_path, args.tradeoff, args.threads,
+                  args.time_tolerance, args.rss_tolerance, args.baseline_runs, not args.no_record))
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Synthetic Cohort Generator
+--------------------------
+
+Purpose:
+The real data (three subjects, ~1,000 OTUs) is too small to show how the data stages scale.
+This script generates a cohort of any size in the same formats as the real inputs: an OTU
+table in BIOM format, the sample metadata (`#SampleID`, `epoch_time`, `ANONYMIZED_NAME`)
+and a SILVA-like taxonomy (`Feature ID`, `Taxon`, `Confidence`). Sampling is irregular like
+the real time series: subjects start on different days, days are skipped (so the wrangling
+step has to interpolate) and some days have more than one sample (so it has to average).
+
+The cohort is deterministic: the same seed always gives the same files, and subject `i`
+has the same samples whatever the number of subjects, so sizes can be compared directly.
+
+Workflow:
+1. Build the taxonomy: `n_otus` OTUs (`denovo<i>`) spread over genera, families, ... with
+   a heavy-tailed number of OTUs per genus.
+2. For every subject: pick a start day, a number of days and the sampled days, a core set of
+   OTUs with log-normal mean abundances and a random walk over time, and draw counts at a
+   fixed sequencing depth (only the OTUs present in a sample are stored).
+3. Write the OTU table, metadata and taxonomy (and optionally one daily feature table per
+   subject, in the `biom convert --to-tsv` format read by calculate_actual_growth_rates_genus_clr.py).
+
+Outputs (in `--out_dir`):
+- `cohort.biom`: OTUs x samples counts (needs the biom package, skip with `--no_biom`).
+- `metadata.csv`: one row per sample.
+- `taxonomy.tsv`: one row per OTU.
+- `feature_tables/<subject>_feature_table.tsv` (with `--feature_tables`): OTUs x days,
+  same-day samples averaged.
+- `cohort.json`: the parameters and size of the cohort.
+
+Usage:
+    python synthetic_cohort.py --n_subjects 100 --n_otus 10000 --seed 1 \
+        --out_dir ../../data/synthetic/100x10000 --feature_tables
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+DAY = 86400
+FIRST_DAY = 1199145600  # 2008-01-01, the real time series start in 2008
+
+
+def subject_names(n_subjects):
+    """
+    Name the subjects like the real ones (F01, M01, ...), widening the number as needed.
+    """
+    width = max(2, len(str(n_subjects)))
+    return [f"{'FM'[i % 2]}{i // 2 + 1:0{width}d}" for i in range(n_subjects)]
+
+
+def make_taxonomy(n_otus, seed):
+    """
+    Build a SILVA-like taxonomy for `n_otus` OTUs.
+
+    Parameters:
+    n_otus (int): Number of OTUs.
+    seed (int): Random seed.
+
+    Returns:
+    pandas.DataFrame: Indexed by "Feature ID" with the columns "Taxon" and "Confidence".
+    """
+    rng = np.random.default_rng([seed, 0])
+    n_genera = max(10, n_otus // 20)
+    # heavy tail: a few genera have many OTUs, most have one or two
+    genus_weights = rng.pareto(1.2, n_genera) + 1
+    genus_of_otu = rng.choice(n_genera, size=n_otus, p=genus_weights / genus_weights.sum())
+    # each genus sits in one lineage; higher ranks get fewer and fewer groups
+    n_groups = {"p": 12, "c": 30, "o": 80, "f": max(20, n_genera // 4)}
+    lineage = {rank: rng.integers(n, size=n_genera) for rank, n in n_groups.items()}
+    genera = [";".join(["d__Bacteria"] + [f"{rank}__{rank.upper()}{lineage[rank][g]}" for rank in n_groups]
+                       + [f"g__Genus{g}"]) for g in range(n_genera)]
+    taxonomy = pd.DataFrame({"Taxon": [genera[g] + ";s__" for g in genus_of_otu],
+                             "Confidence": rng.uniform(0.7, 1.0, n_otus).round(6)},
+                            index=pd.Index([f"denovo{i}" for i in range(n_otus)], name="Feature ID"))
+    return taxonomy
+
+
+def make_subject(subject, index, n_otus, seed, n_days=90, sampled_fraction=0.7, duplicate_fraction=0.1,
+                 otus_per_subject=900, depth=10000):
+    """
+    Generate the samples of one subject.
+
+    Parameters:
+    subject (str): Subject name.
+    index (int): Subject number (seeds the subject's random generator).
+    n_otus (int): Number of OTUs in the cohort.
+    seed (int): Random seed of the cohort.
+    n_days (int): Mean length of the time series in days.
+    sampled_fraction (float): Fraction of days with a sample.
+    duplicate_fraction (float): Fraction of sampled days with a second sample.
+    otus_per_subject (int): Number of OTUs a subject can carry.
+    depth (int): Sequencing depth (reads per sample).
+
+    Returns:
+    pandas.DataFrame, scipy.sparse.csc_matrix: The metadata of the samples and the
+    OTUs x samples counts.
+    """
+    rng = np.random.default_rng([seed, 1, index])
+    start = FIRST_DAY + DAY * int(rng.integers(0, 120))
+    length = int(rng.integers(n_days // 2, n_days * 3 // 2))
+    # first and last day are always sampled, the days in between with `sampled_fraction`
+    days = np.flatnonzero(rng.random(length) < sampled_fraction)
+    days = np.union1d(days, [0, length - 1])
+    days = np.sort(np.concatenate([days, days[rng.random(len(days)) < duplicate_fraction]]))
+
+    otus = np.sort(rng.choice(n_otus, size=min(otus_per_subject, n_otus), replace=False))
+    log_mean = rng.normal(0, 2, len(otus))
+    # abundances drift as a random walk over days, so consecutive samples are correlated
+    walk = np.cumsum(rng.normal(0, 0.3, (length, len(otus))), axis=0)
+
+    rows, cols, counts = [], [], []
+    for col, day in enumerate(days):
+        # only part of the core OTUs is detected in each sample
+        present = rng.random(len(otus)) < 0.5
+        weights = np.exp(log_mean[present] + walk[day, present])
+        sample_counts = rng.multinomial(depth, weights / weights.sum())
+        keep = sample_counts > 0
+        rows.append(otus[present][keep])
+        cols.append(np.full(keep.sum(), col))
+        counts.append(sample_counts[keep])
+    table = sparse.csc_matrix((np.concatenate(counts).astype(float), (np.concatenate(rows), np.concatenate(cols))),
+                              shape=(n_otus, len(days)))
+
+    dates = pd.to_datetime(start + DAY * days, unit="s")
+    repeat = pd.Series(days).groupby(days).cumcount().to_numpy()
+    metadata = pd.DataFrame({
+        "#SampleID": [f"1015_{d.month}_{d.day}_{subject}_S{r + 1}" for d, r in zip(dates, repeat)],
+        "epoch_time": start + DAY * days,
+        "ANONYMIZED_NAME": subject,
+    })
+    return metadata, table
+
+
+def daily_feature_table(metadata, table, otu_ids):
+    """
+    Average same-day samples and keep the OTUs seen in the subject (the per-subject export format).
+
+    Returns:
+    pandas.DataFrame: OTUs x epoch times.
+    """
+    observed = np.flatnonzero(table.getnnz(axis=1))
+    dense = pd.DataFrame(table[observed].toarray(), index=otu_ids[observed], columns=metadata["epoch_time"])
+    daily = dense.T.groupby(level=0).mean().T
+    daily.columns = daily.columns.astype(str)
+    daily.index.name = "#OTU ID"
+    return daily
+
+
+def write_biom(table, otu_ids, sample_ids, biom_fp):
+    """
+    Write the OTU table in BIOM (HDF5) format.
+    """
+    # imported here so the other files can be generated without the biom package
+    from biom import Table
+    from biom.util import biom_open
+
+    with biom_open(biom_fp, "w") as fh:
+        Table(table, otu_ids, sample_ids).to_hdf5(fh, "synthetic cohort")
+
+
+def generate_cohort(n_subjects, n_otus, out_dir, seed=0, feature_tables=False, no_biom=False, **subject_options):
+    """
+    Generate a synthetic cohort and write it to `out_dir`.
+
+    Parameters:
+    n_subjects (int): Number of subjects.
+    n_otus (int): Number of OTUs.
+    out_dir (str): Output folder.
+    seed (int): Random seed.
+    feature_tables (bool): Also write a daily feature table per subject.
+    no_biom (bool): Do not write the BIOM table.
+    **subject_options: Passed to make_subject (n_days, sampled_fraction, ...).
+
+    Returns:
+    dict: The parameters and size of the cohort (also written to cohort.json).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    taxonomy = make_taxonomy(n_otus, seed)
+    taxonomy.to_csv(os.path.join(out_dir, "taxonomy.tsv"), sep="\t")
+    otu_ids = taxonomy.index.to_numpy()
+
+    if feature_tables:
+        os.makedirs(os.path.join(out_dir, "feature_tables"), exist_ok=True)
+    metadata, tables = [], []
+    for i, subject in enumerate(subject_names(n_subjects)):
+        subject_metadata, subject_table = make_subject(subject, i, n_otus, seed, **subject_options)
+        metadata.append(subject_metadata)
+        tables.append(subject_table)
+        if feature_tables:
+            daily = daily_feature_table(subject_metadata, subject_table, otu_ids)
+            with open(os.path.join(out_dir, "feature_tables", f"{subject}_feature_table.tsv"), "w") as fh:
+                fh.write("# Constructed from biom file\n")
+                daily.to_csv(fh, sep="\t")
+
+    metadata = pd.concat(metadata, ignore_index=True)
+    metadata.to_csv(os.path.join(out_dir, "metadata.csv"), index=False)
+    table = sparse.hstack(tables, format="csc")
+    if not no_biom:
+        write_biom(table, otu_ids, metadata["#SampleID"].to_numpy(), os.path.join(out_dir, "cohort.biom"))
+
+    summary = {"n_subjects": n_subjects, "n_otus": n_otus, "seed": seed, "n_samples": len(metadata),
+               "n_sampled_days": int(metadata.groupby("ANONYMIZED_NAME")["epoch_time"].nunique().sum()),
+               "nonzero": int(table.nnz), "subject_options": subject_options}
+    with open(os.path.join(out_dir, "cohort.json"), "w") as fh:
+        json.dump(summary, fh, indent=2)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic time-series cohort")
+    parser.add_argument("--n_subjects", type=int, required=True, help="Number of subjects")
+    parser.add_argument("--n_otus", type=int, required=True, help="Number of OTUs")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--out_dir", required=True, help="Output folder")
+    parser.add_argument("--n_days", type=int, default=90, help="Mean length of the time series in days")
+    parser.add_argument("--sampled_fraction", type=float, default=0.7, help="Fraction of days with a sample")
+    parser.add_argument("--duplicate_fraction", type=float, default=0.1,
+                        help="Fraction of sampled days with a second sample")
+    parser.add_argument("--otus_per_subject", type=int, default=900, help="Number of OTUs a subject can carry")
+    parser.add_argument("--depth", type=int, default=10000, help="Reads per sample")
+    parser.add_argument("--feature_tables", action="store_true", help="Also write daily feature tables per subject")
+    parser.add_argument("--no_biom", action="store_true", help="Do not write the BIOM table")
+    args = parser.parse_args()
+
+    summary = generate_cohort(args.n_subjects, args.n_otus, args.out_dir, args.seed, args.feature_tables,
+                              args.no_biom, n_days=args.n_days, sampled_fraction=args.sampled_fraction,
+                              duplicate_fraction=args.duplicate_fraction,
+                              otus_per_subject=args.otus_per_subject, depth=args.depth)
+    print(json.dumps(summary, indent=2))
@@ -46,12 +46,13 @@ Date: 01/21/2025
 
 import pandas as pd
 import numpy as np
-import subprocess
-from scipy.stats import gmean
 from pathlib import Path
 import argparse
 import os
 
+from query_index import DEFAULT_INDEX, register_actual_rates
+from telemetry import span, run_command
+
 def load_taxonomy(taxonomy_qza, output_dir):
     """
     Load taxonomy data from a QIIME2 taxonomy artifact.
@@ -61,14 +62,19 @@ def load_taxonomy(taxonomy_qza, output_dir):
     export_dir.mkdir(parents=True, exist_ok=True)
 
     # Export the taxonomy.qza file to a readable format
-    subprocess.run([
+    run_command([
         "qiime", "tools", "export",
         "--input-path", taxonomy_qza,
         "--output-path", str(export_dir)
-    ], check=True)
+    ], stage="actual")
 
     # Load the taxonomy TSV file
-    taxonomy_tsv = export_dir / "taxonomy.tsv"
+    return read_taxonomy_tsv(export_dir / "taxonomy.tsv")
+
+def read_taxonomy_tsv(taxonomy_tsv):
+    """
+    Read an exported taxonomy.tsv and add the genus of each OTU (column "Genus").
+    """
     taxonomy = pd.read_csv(taxonomy_tsv, sep="\t", index_col=0)
 
     # Extract genus-level taxonomy
@@ -77,50 +83,20 @@ def load_taxonomy(taxonomy_qza, output_dir):
 
     return taxonomy
 
-def process_subject(feature_table_qza, taxonomy_qza, output_dir, subject_id):
+def clr_growth_by_genus(feature_table, taxonomy, subject_id=""):
     """
-    Process a single subject's feature table to calculate actual growth rates by genus.
+    Calculate CLR-based actual growth rates from a feature table and collapse them by genus.
 
     Parameters:
-        - feature_table_qza (str): Path to the subject's feature table (.qza).
-        - output_dir (str): Directory where the subject's output will be saved.
-        - subject_id (str): Identifier for the subject (e.g., "F01").
-        - taxonomy_qza (str): Path to the subject's taxonomy file (.qza).
-    """
-    # Load taxonomy data from load_taxonomy function
-    taxonomy = load_taxonomy(taxonomy_qza, output_dir)
-
-    # Create an export directory for storing intermediate files for this subject
-    export_dir = Path(output_dir) / "qiime_exports" / subject_id
-    export_dir.mkdir(parents=True, exist_ok=True)
-
-    # Step 1: Export the feature table to .biom format using QIIME2
-    print(f"Exporting feature table for subject {subject_id}...")
-    subprocess.run([
-        "qiime", "tools", "export",              # QIIME2 command to export data
-        "--input-path", feature_table_qza,      # Path to the input feature table (.qza)
-        "--output-path", str(export_dir)        # Directory where the .biom file will be exported
-    ], check=True)
-
-    # Path to the exported .biom file
-    feature_table_biom = export_dir / "feature-table.biom"
-
-    # Step 2: Convert the .biom file to a tab-delimited .tsv file using BIOM CLI
-    print(f"Converting feature table for subject {subject_id} to TSV format...")
-    feature_table_tsv = export_dir / f"{subject_id}_feature_table.tsv"
+        - feature_table (pandas.DataFrame): OTU counts, rows = OTUs, columns = epoch times (as strings).
+        - taxonomy (pandas.DataFrame): Taxonomy indexed by OTU with a "Genus" column (see load_taxonomy).
+        - subject_id (str, optional): Subject ID used in progress messages.
 
-    subprocess.run([
-        "biom", "convert",                      # BIOM CLI command to convert file formats
-        "-i", str(feature_table_biom),          # Input .biom file
-        "-o", str(feature_table_tsv),           # Output .tsv file
-        "--to-tsv"                              # Convert to TSV format
-    ], check=True)
+    Returns:
+        - pandas.DataFrame: CLR change between consecutive days, rows = genera, columns = first day of each pair.
+    """
+    from scipy.stats import gmean
 
-    # Step 3: Load the TSV file into a pandas DataFrame for analysis
-    print(f"Loading feature table for subject {subject_id}...")
-    feature_table = pd.read_csv(feature_table_tsv, sep="\t", skiprows=1, index_col=0)
-    #how many non-zero values are in the feature table, filter out if .1 or more are zero
-    
     # Step 4: Sort sample columns by epoch time (numerically, not alphabetically)
     print(f"Sorting samples by epoch time for subject {subject_id}...")
     sorted_columns = sorted([int(col) for col in feature_table.columns])  # Convert column names to integers
@@ -165,14 +141,72 @@ def process_subject(feature_table_qza, taxonomy_qza, output_dir, subject_id):
     growth_rate_df["Genus"] = taxonomy.loc[growth_rate_df.index, "Genus"]
     growth_by_genus = growth_rate_df.groupby("Genus").sum() 
 
+    return growth_by_genus
+
+
+def process_subject(feature_table_qza, taxonomy_qza, output_dir, subject_id, query_index=None):
+    """
+    Process a single subject's feature table to calculate actual growth rates by genus.
+
+    Parameters:
+        - feature_table_qza (str): Path to the subject's feature table (.qza).
+        - output_dir (str): Directory where the subject's output will be saved.
+        - subject_id (str): Identifier for the subject (e.g., "F01").
+        - taxonomy_qza (str): Path to the subject's taxonomy file (.qza).
+        - query_index (str, optional): SQLite query index to register the output table in.
+    """
+    # Load taxonomy data from load_taxonomy function
+    # exported per subject so subjects can be processed in parallel
+    taxonomy = load_taxonomy(taxonomy_qza, Path(output_dir) / "qiime_exports" / subject_id)
+
+    # Create an export directory for storing intermediate files for this subject
+    export_dir = Path(output_dir) / "qiime_exports" / subject_id
+    export_dir.mkdir(parents=True, exist_ok=True)
+
+    # Step 1: Export the feature table to .biom format using QIIME2
+    print(f"Exporting feature table for subject {subject_id}...")
+    run_command([
+        "qiime", "tools", "export",              # QIIME2 command to export data
+        "--input-path", feature_table_qza,      # Path to the input feature table (.qza)
+        "--output-path", str(export_dir)        # Directory where the .biom file will be exported
+    ], stage="actual", subject=subject_id)
+
+    # Path to the exported .biom file
+    feature_table_biom = export_dir / "feature-table.biom"
+
+    # Step 2: Convert the .biom file to a tab-delimited .tsv file using BIOM CLI
+    print(f"Converting feature table for subject {subject_id} to TSV format...")
+    feature_table_tsv = export_dir / f"{subject_id}_feature_table.tsv"
+
+    run_command([
+        "biom", "convert",                      # BIOM CLI command to convert file formats
+        "-i", str(feature_table_biom),          # Input .biom file
+        "-o", str(feature_table_tsv),           # Output .tsv file
+        "--to-tsv"                              # Convert to TSV format
+    ], stage="actual", subject=subject_id)
+
+    # Step 3: Load the TSV file into a pandas DataFrame for analysis
+    print(f"Loading feature table for subject {subject_id}...")
+    feature_table = pd.read_csv(feature_table_tsv, sep="\t", skiprows=1, index_col=0)
+    #how many non-zero values are in the feature table, filter out if .1 or more are zero
+    
+    # Steps 4-6: normalize, CLR-transform, difference consecutive days and collapse by genus
+    with span("clr growth rates", stage="actual", subject=subject_id) as fields:
+        growth_by_genus = clr_growth_by_genus(feature_table, taxonomy, subject_id)
+        fields.update(n_otus=feature_table.shape[0], n_days=feature_table.shape[1])
+
     # Step 7: Save the genus-level growth rates to a CSV file
     output_path = Path(output_dir) / f"{subject_id}_clr_actual_growth_rates_by_genus.csv"
     growth_by_genus.to_csv(output_path)
 
     print(f"Actual growth rates saved for subject {subject_id} at: {output_path}")
 
+    # Added 20261019 - register the table in the SQL query index
+    if query_index:
+        register_actual_rates(query_index, subject_id, output_path)
+
 
-def main(feature_tables_dir, taxonomy_dir, output_dir):
+def main(feature_tables_dir, taxonomy_dir, output_dir, query_index=None, subject_ids=None):
     """
     Main function to process feature tables for multiple subjects.
 
@@ -180,17 +214,21 @@ def main(feature_tables_dir, taxonomy_dir, output_dir):
         - feature_tables_dir (str): Directory containing QIIME2 feature tables (.qza files).
         - taxonomy_dir (str): Directory containing QIIME2 taxonomy files (.qza files).
         - output_dir (str): Directory where all outputs will be saved.
+        - query_index (str, optional): SQLite query index to register the output tables in.
+        - subject_ids (list, optional): Only process these subjects (default: all feature tables).
     """
     Path(output_dir).mkdir(parents=True, exist_ok=True)
 
     for file in os.listdir(feature_tables_dir):
         if file.endswith("_feature_table.qza"):
             subject_id = file.split("_")[0]
+            if subject_ids is not None and subject_id not in subject_ids:
+                continue
             feature_table_qza = os.path.join(feature_tables_dir, file)
             taxonomy_qza = os.path.join(taxonomy_dir, f"{subject_id}_taxonomy.qza")
 
             if os.path.exists(taxonomy_qza):
-                process_subject(feature_table_qza, taxonomy_qza, output_dir, subject_id)
+                process_subject(feature_table_qza, taxonomy_qza, output_dir, subject_id, query_index)
             else:
                 print(f"Taxonomy file for {subject_id} not found. Skipping.")
 
@@ -200,6 +238,10 @@ if __name__ == "__main__":
     parser.add_argument("--feature_tables_dir", required=True, help="Directory containing QIIME2 feature tables (.qza files).")
     parser.add_argument("--taxonomy_dir", required=True, help="Directory containing QIIME2 taxonomy files (.qza files).")
     parser.add_argument("--output_dir", required=True, help="Directory where outputs will be saved.")
+    parser.add_argument("--query_index", default=DEFAULT_INDEX, help="SQLite query index to register the tables in.")
+    parser.add_argument("--no_query_index", action="store_true", help="Do not register the tables in the query index.")
+    parser.add_argument("--subject_ids", nargs="+", default=None, help="Only process these subjects (optional).")
     args = parser.parse_args()
 
-    main(args.feature_tables_dir, args.taxonomy_dir, args.output_dir)
\ No newline at end of file
+    main(args.feature_tables_dir, args.taxonomy_dir, args.output_dir,
+         None if args.no_query_index else args.query_index, args.subject_ids)
\ No newline at end of file
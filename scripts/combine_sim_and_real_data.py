@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Combine Simulated and Real Data
+-------------------------------
+
+Purpose:
+Python replacement for combine_sim_and_real_data.r. The R script re-reads every growth
+folder one by one, takes the run parameters from the folder name, pivots and joins in
+memory and writes a single `combined_sim_real_data_50.csv`, so one new tradeoff run means
+recombining everything. Here run parameters come from the results store (or a runs
+manifest), runs are combined in parallel with vectorized prevalence/join steps, and each
+run is written as its own Parquet part. Runs that are already combined and unchanged are
+skipped, so adding a run only combines that run.
+
+Workflow:
+1. List the runs (subject_id, model_db, solver, diet, tradeoff) from the results store or
+   a runs manifest CSV.
+2. For each new or changed run (in parallel):
+   a. Load its growth rates and keep taxa present in >= `prevalence_threshold` of samples.
+   b. Join to the subject's actual CLR growth rates (long format) on taxon and sample_id.
+   c. Add sampling_date, sick_day and date_vs_onset_illness.
+   d. Write the run to `<out_dir>/subject_id=.../.../tradeoff=.../part-0.parquet`.
+3. Record the combined runs in `<out_dir>/_runs.csv`.
+4. `read_combined` (or `--out_csv`) adds normed_epoch_time across all runs, as the R script did.
+
+Inputs:
+- `--store_dir`: results store written by simulate_growth_rates_edited.py / results_store.py, or
+- `--runs_manifest`: CSV with subject_id, model_db, solver, diet, tradeoff and growth_fp
+  (a growth_rates.csv, an unzipped growth folder or a growth .zip).
+- Actual CLR growth rates: `<actual_dir>/<subject>_clr_actual_growth_rates_by_genus.csv`.
+
+Outputs:
+- Partitioned Parquet dataset of the combined data plus `_runs.csv`.
+- Optionally, the full table as CSV (same columns as `combined_sim_real_data_50.csv`).
+
+Usage:
+    python combine_sim_and_real_data.py --store_dir ../data/results_store/ \
+        --out_dir ../data/combined_sim_real_data_50/ --out_csv ../data/combined_sim_real_data_50.csv
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import zipfile
+import argparse
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import pyarrow.dataset as ds
+
+from query_index import DEFAULT_INDEX, register_combined
+from results_store import (PARTITION_COLUMNS, PARTITION_SCHEMA, partition_dir, read_table, list_runs,
+                           write_parquet_atomic, table_signature, file_signature)
+
+# date of illness onset (epoch seconds) for each subject
+SICK_DAYS = {"F01": 1202688000, "M01": 1203465600, "M02": 1203120000}
+RUNS_FILE = "_runs.csv"
+GROWTH_COLUMNS = ["abundance", "growth_rate", "reactions", "metabolites", "taxon", "sample_id"]
+
+
+@lru_cache(maxsize=None)
+def load_actual_clr(subject_id, actual_dir):
+    """
+    Load a subject's actual CLR growth rates in long format.
+
+    Parameters:
+    subject_id (str): Subject ID (e.g. F01).
+    actual_dir (str): Folder with `<subject>_clr_actual_growth_rates_by_genus.csv` files.
+
+    Returns:
+    pandas.DataFrame: taxon (without the "g__" prefix), sample_id (epoch time) and clr_change_abund.
+    """
+    wide = pd.read_csv(os.path.join(actual_dir, f"{subject_id}_clr_actual_growth_rates_by_genus.csv"))
+    long = wide.melt(id_vars="Genus", var_name="sample_id", value_name="clr_change_abund")
+    long["taxon"] = long.pop("Genus").str[3:]
+    long["sample_id"] = pd.to_numeric(long["sample_id"])
+    return long[["taxon", "sample_id", "clr_change_abund"]]
+
+
+def load_runs(store_dir=None, runs_manifest=None):
+    """
+    Get the runs to combine, with a signature that changes when a run's results change.
+
+    Parameters:
+    store_dir (str, optional): Results store to list the runs from.
+    runs_manifest (str, optional): CSV with the run parameters and a growth_fp column.
+
+    Returns:
+    pandas.DataFrame: One row per run with the partition columns, growth_fp and signature.
+    """
+    if runs_manifest is not None:
+        runs = pd.read_csv(runs_manifest, dtype={"subject_id": str, "model_db": str,
+                                                 "solver": str, "diet": str})
+        missing = [c for c in PARTITION_COLUMNS + ["growth_fp"] if c not in runs.columns]
+        if missing:
+            raise ValueError(f"Runs manifest is missing columns: {', '.join(missing)}")
+    else:
+        runs = list_runs(store_dir)
+        runs["growth_fp"] = None
+
+    runs["signature"] = [file_signature([run["growth_fp"]]) if run["growth_fp"] is not None
+                         else table_signature(store_dir, "growth_rates", run)
+                         for _, run in runs.iterrows()]
+    return runs
+
+
+def load_run_growth(run, store_dir):
+    """
+    Load the growth rates of a single run from the store or from its growth_fp.
+    """
+    if run["growth_fp"] is None:
+        return read_table(store_dir, "growth_rates", columns=GROWTH_COLUMNS,
+                          **{col: run[col] for col in PARTITION_COLUMNS})
+    growth_fp = run["growth_fp"]
+    if growth_fp.endswith(".zip"):
+        with zipfile.ZipFile(growth_fp) as zf, zf.open("growth_rates.csv") as fh:
+            return pd.read_csv(fh, usecols=GROWTH_COLUMNS)
+    if os.path.isdir(growth_fp):
+        growth_fp = os.path.join(growth_fp, "growth_rates.csv")
+    return pd.read_csv(growth_fp, usecols=GROWTH_COLUMNS)
+
+
+def filter_prevalent(growth, prevalence_threshold=0.5):
+    """
+    Keep taxa that have a growth rate in at least `prevalence_threshold` of a run's samples.
+
+    Parameters:
+    growth (pandas.DataFrame): Growth rates of one run (taxon, sample_id, growth_rate, ...).
+    prevalence_threshold (float): Minimum fraction of samples (0.5 = present in 50% of samples).
+
+    Returns:
+    pandas.DataFrame: Prevalent rows with total_samples, sample_counts and prevalence added and
+    the "g__" prefix removed from taxon names.
+    """
+    growth = growth.copy()
+    # removes "g__" from taxon names for better readability
+    growth["taxon"] = growth["taxon"].str[3:]
+    growth["total_samples"] = growth["sample_id"].nunique()
+    sample_counts = growth.dropna(subset=["growth_rate"]).groupby("taxon")["sample_id"].nunique()
+    growth["sample_counts"] = growth["taxon"].map(sample_counts).fillna(0).astype(int)
+    growth["prevalence"] = growth["sample_counts"] / growth["total_samples"]
+    growth = growth[growth["prevalence"] >= prevalence_threshold]
+    growth["sample_id"] = pd.to_numeric(growth["sample_id"])
+    return growth
+
+
+def combine_run(prevalent, subject_id, actual_clr):
+    """
+    Join the actual CLR growth rates to a run's prevalent taxa and add illness metadata.
+
+    Parameters:
+    prevalent (pandas.DataFrame): Output of `filter_prevalent` for one run.
+    subject_id (str): Subject of the run.
+    actual_clr (pandas.DataFrame): Output of `load_actual_clr` for the subject.
+
+    Returns:
+    pandas.DataFrame: Rows with both a simulated growth rate and an actual CLR change.
+    """
+    combined = prevalent.merge(actual_clr, on=["taxon", "sample_id"], how="left")
+    combined = combined.dropna(subset=["growth_rate", "clr_change_abund"])
+    combined["sampling_date"] = pd.to_datetime(combined["sample_id"], unit="s", utc=True)
+    if subject_id in SICK_DAYS:
+        combined["sick_day"] = SICK_DAYS[subject_id]
+        combined["date_vs_onset_illness"] = "after"
+        combined.loc[combined["sample_id"] < combined["sick_day"], "date_vs_onset_illness"] = "before"
+    else:
+        # no recorded onset of illness (e.g. synthetic subjects); typed nulls keep the
+        # Parquet schema of this run compatible with the runs that have one
+        combined["sick_day"] = pd.Series(pd.NA, index=combined.index, dtype="Int64")
+        combined["date_vs_onset_illness"] = pd.Series(pd.NA, index=combined.index, dtype="string")
+    return combined.reset_index(drop=True)
+
+
+def _combine_one(args):
+    """
+    Combine one run and write it to the output dataset (runs in a worker process).
+    """
+    run, store_dir, actual_dir, out_dir, prevalence_threshold = args
+    prevalent = filter_prevalent(load_run_growth(run, store_dir), prevalence_threshold)
+    combined = combine_run(prevalent, run["subject_id"], load_actual_clr(run["subject_id"], actual_dir))
+    out_fp = os.path.join(partition_dir(out_dir, "", run), "part-0.parquet")
+    write_parquet_atomic(combined, out_fp)
+    # range of the prevalent samples, used for normed_epoch_time across runs
+    return {"n_rows": len(combined),
+            "min_sample_id": prevalent["sample_id"].min(),
+            "max_sample_id": prevalent["sample_id"].max()}
+
+
+def combine_runs(out_dir, actual_dir, store_dir=None, runs_manifest=None,
+                 prevalence_threshold=0.5, threads=1, overwrite=False, query_index=None):
+    """
+    Combine every new or changed run with the actual growth rates.
+
+    Parameters:
+    out_dir (str): Output Parquet dataset folder.
+    actual_dir (str): Folder with the actual CLR growth rate CSVs.
+    store_dir (str, optional): Results store with the simulated runs.
+    runs_manifest (str, optional): Runs manifest CSV (used instead of store_dir).
+    prevalence_threshold (float): Minimum taxon prevalence (0.5 = present in 50% of samples).
+    threads (int): Number of runs combined in parallel.
+    overwrite (bool): Recombine runs even if they are already up to date.
+    query_index (str, optional): SQLite query index to register the combined runs in (see query_index.py).
+
+    Returns:
+    pandas.DataFrame: The runs table saved as `_runs.csv`.
+    """
+    runs = load_runs(store_dir, runs_manifest)
+    runs_fp = os.path.join(out_dir, RUNS_FILE)
+    done = pd.read_csv(runs_fp, dtype={"subject_id": str}) if os.path.exists(runs_fp) and not overwrite else None
+
+    todo = runs
+    if done is not None:
+        done = done[done["prevalence_threshold"] == prevalence_threshold]
+        key = PARTITION_COLUMNS + ["signature"]
+        todo = runs.merge(done[key], on=key, how="left", indicator=True)
+        todo = todo[todo["_merge"] == "left_only"].drop(columns="_merge")
+    print(f"Combining {len(todo)} of {len(runs)} runs ({len(runs) - len(todo)} already up to date)")
+
+    jobs = [(run, store_dir, actual_dir, out_dir, prevalence_threshold) for _, run in todo.iterrows()]
+    with ProcessPoolExecutor(max_workers=threads) as pool:
+        stats = list(pool.map(_combine_one, jobs))
+
+    todo = todo.reset_index(drop=True).join(pd.DataFrame(stats, columns=["n_rows", "min_sample_id", "max_sample_id"]))
+    if query_index:
+        for _, run in todo.iterrows():
+            combined = pd.read_parquet(os.path.join(partition_dir(out_dir, "", run), "part-0.parquet"))
+            register_combined(query_index, combined, run, prevalence_threshold)
+    todo["prevalence_threshold"] = prevalence_threshold
+    if done is not None:
+        done = done.merge(todo[PARTITION_COLUMNS], on=PARTITION_COLUMNS, how="left", indicator=True)
+        done = done[done["_merge"] == "left_only"].drop(columns="_merge")
+        todo = pd.concat([done, todo], ignore_index=True)
+    todo = todo.drop(columns="growth_fp")
+    os.makedirs(out_dir, exist_ok=True)
+    todo.to_csv(runs_fp, index=False)
+    return todo
+
+
+def read_combined(out_dir, **filters):
+    """
+    Read the combined data and add normed_epoch_time.
+
+    normed_epoch_time scales sample_id to [0, 1] using the earliest and latest prevalent sample
+    of all combined runs, as combine_sim_and_real_data.r did.
+
+    Parameters:
+    out_dir (str): Output folder of `combine_runs`.
+    **filters: Partition values to keep (see `results_store.read_table`).
+
+    Returns:
+    pandas.DataFrame: The combined data.
+    """
+    dataset = ds.dataset(out_dir, format="parquet",
+                         partitioning=ds.partitioning(PARTITION_SCHEMA, flavor="hive"))
+    expression = None
+    for col, value in filters.items():
+        if value is None:
+            continue
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        values = [float(v) for v in values] if col == "tradeoff" else [str(v) for v in values]
+        condition = ds.field(col).isin(values)
+        expression = condition if expression is None else expression & condition
+    combined = dataset.to_table(filter=expression).to_pandas()
+    for col in ["subject_id", "model_db", "solver", "diet"]:
+        combined[col] = combined[col].astype(str)
+
+    runs = pd.read_csv(os.path.join(out_dir, RUNS_FILE))
+    start, end = runs["min_sample_id"].min(), runs["max_sample_id"].max()
+    combined["normed_epoch_time"] = (combined["sample_id"] - start) / (end - start)
+    return combined
+
+
+def main(out_dir, actual_dir, store_dir=None, runs_manifest=None,
+         prevalence_threshold=0.5, threads=1, overwrite=False, out_csv=None, query_index=None):
+    runs = combine_runs(out_dir, actual_dir, store_dir, runs_manifest,
+                        prevalence_threshold, threads, overwrite, query_index)
+    print(f"Combination complete. {runs['n_rows'].sum()} rows from {len(runs)} runs saved to {out_dir}")
+    if out_csv is not None:
+        read_combined(out_dir).to_csv(out_csv, index=False)
+        print(f"Combined data saved to {out_csv}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Combine simulated growth rates with actual CLR growth rates")
+    parser.add_argument("--store_dir", default="../data/results_store/",
+                        help="Results store with the simulated runs")
+    parser.add_argument("--runs_manifest", default=None,
+                        help="CSV with subject_id, model_db, solver, diet, tradeoff, growth_fp (instead of --store_dir)")
+    parser.add_argument("--actual_dir", default="../data/actual_growth_rates_genus_clr/",
+                        help="Folder with <subject>_clr_actual_growth_rates_by_genus.csv files")
+    parser.add_argument("--out_dir", default="../data/combined_sim_real_data_50/",
+                        help="Output Parquet dataset folder")
+    parser.add_argument("--prevalence_threshold", type=float, default=0.5,
+                        help="Keep taxa present in at least this fraction of a run's samples")
+    parser.add_argument("--threads", type=int, default=1, help="Runs combined in parallel")
+    parser.add_argument("--overwrite", action="store_true", help="Recombine all runs")
+    parser.add_argument("--out_csv", default=None, help="Also save the full combined table as CSV")
+    parser.add_argument("--query_index", default=DEFAULT_INDEX, help="SQLite query index to register the combined runs in")
+    parser.add_argument("--no_query_index", action="store_true", help="Do not register the combined runs")
+    args = parser.parse_args()
+
+    main(args.out_dir, args.actual_dir, args.store_dir, args.runs_manifest,
+         args.prevalence_threshold, args.threads, args.overwrite, args.out_csv,
+         None if args.no_query_index else args.query_index)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Golden-Output Equivalence Checker
+---------------------------------
+
+Purpose:
+Every faster path (solver settings, medium completion, grow path, rate calculation) has to give
+the same science as the path it replaces. This script compares a candidate result set with a
+baseline ("golden") result set: two `growth_rates/` trees of growth_* folders or .zip files, two
+Parquet results stores (see results_store.py), a tree and a store, or two directories of actual
+CLR growth rates. Rows are aligned on their keys (run parameters, subject, taxon, sample_id and,
+for exchanges, reaction) with a single vectorized merge, and every shared numeric column is
+checked with `|candidate - baseline| <= atol + rtol * |baseline|` (NaN only matches NaN).
+
+The check passes (exit status 0) when no row is missing on either side and every value is
+within tolerance; otherwise the summary lists the missing rows per run, the mismatches per
+column and run, and the largest deviations, and the exit status is 1.
+
+Workflow:
+1. Detect the kind of each result set (store, growth tree or actual rates) and load it as a
+   long table (growth folders are read in parallel threads).
+2. Normalize the key columns (epoch sample IDs as integers, tradeoffs rounded) and merge.
+3. Compare each value column, rank the deviations by how far they exceed the tolerance.
+
+Inputs:
+- `--baseline` and `--candidate`: result sets (any kind, not necessarily the same).
+
+Outputs:
+- A summary on stdout and optionally all mismatched values (`--out_fp`, .csv or .parquet).
+
+Usage:
+    python compare_results.py --baseline ../data/growth_rates/ --candidate ../data/results_store/
+    python compare_results.py --baseline ../data/golden/actual_growth_rates_genus_clr/ \
+        --candidate ../data/actual_growth_rates_genus_clr/ --atol 1e-9 --rtol 1e-6
+    python compare_results.py --baseline ../data/golden/store --candidate ../data/results_store \
+        --table exchanges --tolerance flux:1e-6:1e-4 --out_fp exchange_mismatches.csv
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import glob
+import argparse
+import zipfile
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from results_store import PARTITION_COLUMNS, LEGACY_NAME, read_table
+
+ACTUAL_SUFFIX = "_clr_actual_growth_rates_by_genus.csv"
+ACTUAL_VALUE = "clr_change_abund"
+TABLE_KEYS = {"growth_rates": ["taxon", "sample_id"],
+              "exchanges": ["taxon", "sample_id", "reaction"]}
+
+
+def detect_kind(path, table="growth_rates"):
+    """
+    Tell what a result set is: "store" (Parquet results store), "growth" (growth_* folders or
+    .zip files) or "actual" (actual CLR growth rate tables).
+    """
+    if os.path.isdir(os.path.join(path, table)):
+        return "store"
+    if glob.glob(os.path.join(path, "growth_*")):
+        return "growth"
+    if glob.glob(os.path.join(path, f"*{ACTUAL_SUFFIX}")):
+        return "actual"
+    raise ValueError(f"{path} is neither a results store, a folder of growth_* results "
+                     f"nor a folder of *{ACTUAL_SUFFIX} files")
+
+
+def _read_growth_run(args):
+    """
+    Read one table of a growth_* folder or .zip and add the run parameters from its name.
+    """
+    run_fp, table, params = args
+    if run_fp.endswith(".zip"):
+        with zipfile.ZipFile(run_fp) as zf:
+            if f"{table}.csv" not in zf.namelist():
+                return None
+            with zf.open(f"{table}.csv") as fh:
+                df = pd.read_csv(fh)
+    else:
+        table_fp = os.path.join(run_fp, f"{table}.csv")
+        if not os.path.exists(table_fp):
+            return None
+        df = pd.read_csv(table_fp)
+    # the parameters in the name are the run's labels (growth_rates.csv also has a tradeoff column)
+    return df.drop(columns=[c for c in PARTITION_COLUMNS if c in df.columns]).assign(**params)
+
+
+def load_growth_tree(growth_dir, table="growth_rates", threads=8):
+    """
+    Load a table of all growth_<subject>_<model_db>_<solver>_<diet>_<tradeoff> results in a folder
+    (folders are preferred over .zip files of the same run, as in results_store.py).
+    """
+    runs = {}
+    for run_fp in sorted(glob.glob(os.path.join(growth_dir, "growth_*"))):
+        name = Path(run_fp).name.replace(".zip", "")
+        if name not in runs or os.path.isdir(run_fp):
+            runs[name] = run_fp
+    jobs = []
+    for name, run_fp in runs.items():
+        match = LEGACY_NAME.match(name)
+        if match is None:
+            print(f"Skipping {run_fp}: name does not follow growth_<subject>_<model_db>_<solver>_<diet>_<tradeoff>")
+            continue
+        params = match.groupdict()
+        params["tradeoff"] = int(params["tradeoff"]) / 10
+        jobs.append((run_fp, table, params))
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        frames = [df for df in pool.map(_read_growth_run, jobs) if df is not None]
+    if not frames:
+        raise ValueError(f"No `{table}` tables found in {growth_dir}")
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_actual_dir(actual_dir):
+    """
+    Load all actual CLR growth rate tables of a folder in long format (subject_id, taxon,
+    sample_id, clr_change_abund).
+    """
+    frames = []
+    for fp in sorted(glob.glob(os.path.join(actual_dir, f"*{ACTUAL_SUFFIX}"))):
+        wide = pd.read_csv(fp)
+        long = wide.melt(id_vars="Genus", var_name="sample_id", value_name=ACTUAL_VALUE)
+        long = long.rename(columns={"Genus": "taxon"})
+        long.insert(0, "subject_id", os.path.basename(fp)[:-len(ACTUAL_SUFFIX)])
+        frames.append(long)
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_result_set(path, table="growth_rates", threads=8):
+    """
+    Load a result set of any kind as a long table.
+
+    Returns:
+    pandas.DataFrame, list: The table and its key columns.
+    """
+    kind = detect_kind(path, table)
+    if kind == "actual":
+        return load_actual_dir(path), ["subject_id", "taxon", "sample_id"]
+    if kind == "store":
+        df = read_table(path, table)
+    else:
+        df = load_growth_tree(path, table, threads)
+    return df, PARTITION_COLUMNS + TABLE_KEYS[table]
+
+
+def normalize_keys(df, keys):
+    """
+    Give the key columns one representation on both sides: strings, with integral numbers
+    (e.g. epoch sample IDs read as text, int or float) written without decimals and
+    tradeoffs rounded.
+    """
+    df = df.copy()
+    for key in keys:
+        values = df[key]
+        if key == "tradeoff":
+            df[key] = pd.to_numeric(values).round(6).astype(str)
+            continue
+        numeric = pd.to_numeric(values, errors="coerce")
+        if numeric.notna().all() and (numeric == np.round(numeric)).all():
+            df[key] = numeric.astype("int64").astype(str)
+        else:
+            df[key] = values.astype(str)
+    return df
+
+
+def parse_tolerances(specs):
+    """
+    Parse per-column tolerances written as column:atol:rtol (e.g. flux:1e-6:1e-4).
+    """
+    tolerances = {}
+    for spec in specs or []:
+        column, atol, rtol = spec.split(":")
+        tolerances[column] = (float(atol), float(rtol))
+    return tolerances
+
+
+def compare_result_sets(baseline, candidate, table="growth_rates", atol=1e-8, rtol=1e-5, tolerances=None,
+                        columns=None, threads=8):
+    """
+    Compare a candidate result set with a baseline.
+
+    Parameters:
+    baseline, candidate (str): Result sets (results store, growth_* folder or actual rates folder).
+    table (str): "growth_rates" or "exchanges" (ignored for actual rates).
+    atol, rtol (float): Default absolute and relative tolerance.
+    tolerances (dict, optional): Column -> (atol, rtol) overrides.
+    columns (list, optional): Value columns to compare (default: all shared numeric columns).
+    threads (int): Threads reading growth_* folders.
+
+    Returns:
+    dict: "keys", "missing" (rows only in the baseline), "extra" (rows only in the candidate),
+    "duplicates" (keys that are not unique), "columns" (per-column statistics), "deviations"
+    (all values out of tolerance, worst first) and "equivalent" (bool).
+    """
+    tolerances = tolerances or {}
+    (base_df, keys), (cand_df, cand_keys) = (load_result_set(baseline, table, threads),
+                                             load_result_set(candidate, table, threads))
+    if keys != cand_keys:
+        raise ValueError(f"Cannot compare {baseline} with {candidate}: different kinds of results")
+    base_df, cand_df = normalize_keys(base_df, keys), normalize_keys(cand_df, keys)
+
+    if columns is None:
+        shared = [c for c in base_df.columns if c in cand_df.columns and c not in keys]
+        columns = [c for c in shared if pd.api.types.is_numeric_dtype(base_df[c])
+                   and pd.api.types.is_numeric_dtype(cand_df[c])]
+    missing_columns = [c for c in columns if c not in base_df.columns or c not in cand_df.columns]
+    if missing_columns:
+        raise ValueError(f"Columns not in both result sets: {', '.join(missing_columns)}")
+
+    duplicates = pd.concat([base_df[base_df.duplicated(keys, keep=False)][keys].assign(side="baseline"),
+                            cand_df[cand_df.duplicated(keys, keep=False)][keys].assign(side="candidate")])
+    merged = base_df[keys + columns].drop_duplicates(keys).merge(
+        cand_df[keys + columns].drop_duplicates(keys), on=keys, how="outer", suffixes=("_baseline", "_candidate"),
+        indicator=True)
+    missing = merged.loc[merged["_merge"] == "left_only", keys]
+    extra = merged.loc[merged["_merge"] == "right_only", keys]
+    both = merged[merged["_merge"] == "both"]
+
+    stats, deviations = [], []
+    for column in columns:
+        col_atol, col_rtol = tolerances.get(column, (atol, rtol))
+        b = both[f"{column}_baseline"].to_numpy(dtype=float)
+        c = both[f"{column}_candidate"].to_numpy(dtype=float)
+        abs_diff = np.abs(c - b)
+        allowed = col_atol + col_rtol * np.abs(b)
+        both_nan = np.isnan(b) & np.isnan(c)
+        bad = ~both_nan & (np.isnan(b) | np.isnan(c) | (abs_diff > allowed))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rel_diff = abs_diff / np.abs(b)
+            # how many tolerances off (inf where only one side is NaN)
+            excess = np.where(np.isnan(b) | np.isnan(c), np.inf, abs_diff / allowed)
+        stats.append({"column": column, "atol": col_atol, "rtol": col_rtol, "n_compared": len(b),
+                      "n_mismatched": int(bad.sum()), "max_abs_diff": np.nanmax(abs_diff) if len(b) else np.nan,
+                      "max_rel_diff": np.nanmax(np.where(np.isfinite(rel_diff), rel_diff, np.nan))
+                      if np.isfinite(rel_diff).any() else np.nan})
+        if bad.any():
+            deviations.append(both.loc[bad, keys].assign(column=column, baseline=b[bad], candidate=c[bad],
+                                                         abs_diff=abs_diff[bad], rel_diff=rel_diff[bad],
+                                                         excess=excess[bad]))
+    deviations = (pd.concat(deviations, ignore_index=True).sort_values("excess", ascending=False)
+                  .reset_index(drop=True) if deviations else
+                  pd.DataFrame(columns=keys + ["column", "baseline", "candidate", "abs_diff", "rel_diff", "excess"]))
+    return {"keys": keys, "missing": missing.reset_index(drop=True), "extra": extra.reset_index(drop=True),
+            "duplicates": duplicates.reset_index(drop=True), "columns": pd.DataFrame(stats),
+            "deviations": deviations,
+            "equivalent": missing.empty and extra.empty and duplicates.empty and deviations.empty}
+
+
+def print_summary(report, top=20):
+    """
+    Print the comparison: row coverage, per-column statistics, mismatches per run and the
+    largest deviations.
+    """
+    keys = report["keys"]
+    group_keys = [k for k in keys if k in PARTITION_COLUMNS] or ["subject_id"]
+    n_rows = int(report["columns"]["n_compared"].max()) if not report["columns"].empty else 0
+    print(f"Compared {n_rows} rows on ({', '.join(keys)})")
+    for name in ("missing", "extra", "duplicates"):
+        df = report[name]
+        if not df.empty:
+            label = {"missing": "only in the baseline", "extra": "only in the candidate",
+                     "duplicates": "with duplicated keys"}[name]
+            print(f"\n{len(df)} rows {label}, per run:")
+            print(df.groupby(group_keys).size().rename("rows").reset_index().to_string(index=False))
+    print("\nPer column:")
+    print(report["columns"].to_string(index=False))
+    deviations = report["deviations"]
+    if not deviations.empty:
+        print("\nMismatches per run:")
+        print(deviations.groupby(group_keys + ["column"]).size().rename("mismatches").reset_index()
+              .sort_values("mismatches", ascending=False).head(top).to_string(index=False))
+        print(f"\nLargest deviations (top {min(top, len(deviations))} of {len(deviations)}):")
+        print(deviations.head(top).to_string(index=False))
+    print("\nEQUIVALENT" if report["equivalent"] else "\nNOT EQUIVALENT")
+
+
+def main(baseline, candidate, table="growth_rates", atol=1e-8, rtol=1e-5, tolerances=None, columns=None,
+         top=20, out_fp=None, threads=8):
+    report = compare_result_sets(baseline, candidate, table, atol, rtol, tolerances, columns, threads)
+    print_summary(report, top)
+    if out_fp is not None and not report["deviations"].empty:
+        if out_fp.endswith(".parquet"):
+            report["deviations"].to_parquet(out_fp, index=False)
+        else:
+            report["deviations"].to_csv(out_fp, index=False)
+        print(f"All {len(report['deviations'])} mismatched values saved to {out_fp}")
+    return 0 if report["equivalent"] else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that a candidate result set matches a baseline")
+    parser.add_argument("--baseline", required=True, help="Golden result set (store, growth_* folder or actual rates)")
+    parser.add_argument("--candidate", required=True, help="Result set to check")
+    parser.add_argument("--table", default="growth_rates", choices=list(TABLE_KEYS),
+                        help="Table of growth results to compare (ignored for actual rates)")
+    parser.add_argument("--atol", type=float, default=1e-8, help="Absolute tolerance")
+    parser.add_argument("--rtol", type=float, default=1e-5, help="Relative tolerance (of the baseline value)")
+    parser.add_argument("--tolerance", nargs="+", default=None,
+                        help="Per-column tolerances as column:atol:rtol (e.g. growth_rate:1e-6:1e-4)")
+    parser.add_argument("--columns", nargs="+", default=None, help="Value columns to compare (default: all numeric)")
+    parser.add_argument("--top", type=int, default=20, help="Number of deviations to print")
+    parser.add_argument("--out_fp", default=None, help="Save all mismatched values (.csv or .parquet)")
+    parser.add_argument("--threads", type=int, default=8, help="Threads reading growth_* folders")
+    args = parser.parse_args()
+
+    raise SystemExit(main(args.baseline, args.candidate, args.table, args.atol, args.rtol,
+                          parse_tolerances(args.tolerance), args.columns, args.top, args.out_fp, args.threads))
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Diet Registry and Parsed Medium Cache
+-------------------------------------
+
+Purpose:
+Diet shorthands used to come from `export DIET_SHORTHAND_<stem>=...` lines in diet_config.sh,
+so result names depended on whether the shell had sourced that file, and every process
+re-unzipped and re-parsed the diet .qza with `load_qiime_medium`. This module keeps the
+mapping in `diet_registry.csv` (shorthand, artifact file name, sha256 of the artifact) and
+caches each parsed medium as Parquet keyed by the artifact's hash, so a sweep parses each
+diet once and a changed artifact can never be picked up under an old shorthand.
+
+Workflow:
+1. `register` adds diets to the registry (or refreshes their hashes) from a diet folder.
+2. `load_diet` resolves a diet (path, file name, stem or shorthand), checks the artifact hash
+   against the registry, and returns the cached medium (parsing the .qza only on a cache miss).
+3. `diet_shorthand` returns the name used in results (falls back to the file stem for
+   unregistered diets).
+
+Inputs:
+- `diet_registry.csv` next to this script (shipped with the installed package) and the diet
+  .qza artifacts (default ../data/diets/, or `$MICOM_TS_DATA_DIR/diets`).
+
+Outputs:
+- `<cache_dir>/<sha256>.parquet`: parsed media (default ../data/diets/.medium_cache/).
+
+Usage:
+    python diet_registry.py register --diet_dir ../data/diets/
+    python diet_registry.py register --diet_dir ../data/diets/ --artifact my_diet.qza --shorthand mydiet
+    python diet_registry.py shorthand western_diet_gut_agora.qza
+    python diet_registry.py list
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import hashlib
+import argparse
+from pathlib import Path
+import pandas as pd
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_REGISTRY = os.path.join(SCRIPT_DIR, "diet_registry.csv")
+# the data folder of the source checkout; an installed package has none next to it, so paths are
+# then relative to the working directory like the other defaults (override with MICOM_TS_DATA_DIR)
+if os.path.exists(os.path.join(SCRIPT_DIR, "..", "pyproject.toml")):
+    DATA_DIR = os.environ.get("MICOM_TS_DATA_DIR", os.path.join(SCRIPT_DIR, "..", "data"))
+else:
+    DATA_DIR = os.environ.get("MICOM_TS_DATA_DIR", os.path.join("..", "data"))
+DEFAULT_DIET_DIR = os.path.join(DATA_DIR, "diets")
+DEFAULT_CACHE_DIR = os.path.join(DEFAULT_DIET_DIR, ".medium_cache")
+REGISTRY_COLUMNS = ["shorthand", "artifact", "sha256"]
+
+
+def load_registry(registry_fp=DEFAULT_REGISTRY, missing_ok=False):
+    """
+    Load the diet registry (one row per diet: shorthand, artifact, sha256).
+
+    A missing registry is an error (unless `missing_ok`), because every diet would then fall
+    back to its file stem and change the names and partition values of the results.
+    """
+    if not os.path.exists(registry_fp):
+        if missing_ok:
+            return pd.DataFrame(columns=REGISTRY_COLUMNS)
+        raise FileNotFoundError(f"Diet registry {registry_fp} not found. Pass the path of the registry "
+                                f"or create it with `python diet_registry.py register --artifact ... --shorthand ...`")
+    return pd.read_csv(registry_fp, dtype=str, keep_default_na=False)
+
+
+def file_sha256(fp):
+    """
+    Compute the sha256 hash of a file.
+    """
+    digest = hashlib.sha256()
+    with open(fp, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def find_entry(diet, registry):
+    """
+    Find the registry row of a diet given as a path, artifact file name, stem or shorthand.
+
+    Returns:
+    pandas.Series or None: The registry row, or None if the diet is not registered.
+    """
+    name = Path(diet).name
+    matches = registry[(registry["artifact"] == name) |
+                       (registry["artifact"].map(lambda a: Path(a).stem) == Path(diet).stem) |
+                       (registry["shorthand"] == diet)]
+    if matches.empty:
+        return None
+    return matches.iloc[0]
+
+
+def diet_shorthand(diet, registry_fp=DEFAULT_REGISTRY):
+    """
+    Get the shorthand used in result names for a diet, falling back to the file stem.
+
+    Parameters:
+    diet (str): Diet path, artifact file name, stem or shorthand.
+    registry_fp (str): Path to the diet registry.
+
+    Returns:
+    str: The registered shorthand (e.g. "wd") or the file stem for unregistered diets.
+    """
+    entry = find_entry(diet, load_registry(registry_fp))
+    return entry["shorthand"] if entry is not None else Path(diet).stem
+
+
+def resolve_diet(diet, registry_fp=DEFAULT_REGISTRY, diet_dir=DEFAULT_DIET_DIR):
+    """
+    Find the artifact of a diet given as a path, or as a registered artifact name, stem or shorthand.
+
+    Returns:
+    tuple: (path to the diet .qza, registry row or None if the diet is not registered).
+    """
+    entry = find_entry(diet, load_registry(registry_fp))
+    diet_fp = diet
+    if not os.path.exists(diet_fp):
+        if entry is None:
+            raise ValueError(f"Diet `{diet}` is neither a file nor registered in {registry_fp}")
+        diet_fp = os.path.join(diet_dir, entry["artifact"])
+    return diet_fp, entry
+
+
+def load_diet(diet, registry_fp=DEFAULT_REGISTRY, diet_dir=DEFAULT_DIET_DIR, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Load a diet medium through the registry and the parsed medium cache.
+
+    Parameters:
+    diet (str): Path to a diet .qza, or a registered artifact name, stem or shorthand
+        (resolved in `diet_dir`).
+    registry_fp (str): Path to the diet registry.
+    diet_dir (str): Folder with the diet artifacts (used when `diet` is not a path).
+    cache_dir (str): Folder for the cached, parsed media.
+
+    Returns:
+    pandas.DataFrame: The medium as returned by `load_qiime_medium` (reaction, flux, metabolite).
+    """
+    diet_fp, entry = resolve_diet(diet, registry_fp, diet_dir)
+    sha256 = file_sha256(diet_fp)
+    if entry is not None and entry["sha256"] and entry["sha256"] != sha256:
+        raise ValueError(f"{diet_fp} does not match the hash registered for `{entry['shorthand']}`. "
+                         f"Run `python diet_registry.py register --diet_dir {os.path.dirname(diet_fp)}` "
+                         f"if the diet was changed on purpose.")
+
+    cache_fp = os.path.join(cache_dir, f"{sha256}.parquet")
+    if os.path.exists(cache_fp):
+        medium = pd.read_parquet(cache_fp)
+    else:
+        # imported here so `diet_registry.py shorthand` (called from the loop scripts) and the
+        # sweep drivers stay fast
+        from micom.qiime_formats import load_qiime_medium
+        from results_store import write_parquet_atomic
+        medium = load_qiime_medium(diet_fp)
+        write_parquet_atomic(medium.reset_index(drop=True), cache_fp)
+    medium.index = medium.reaction
+    return medium
+
+
+def register_diets(diet_dir=DEFAULT_DIET_DIR, registry_fp=DEFAULT_REGISTRY, artifact=None, shorthand=None):
+    """
+    Add a diet to the registry, or refresh the hashes of all registered diets found in `diet_dir`.
+
+    Parameters:
+    diet_dir (str): Folder with the diet artifacts.
+    registry_fp (str): Path to the diet registry.
+    artifact (str, optional): File name of a diet to add (with `shorthand`).
+    shorthand (str, optional): Shorthand of the diet to add.
+
+    Returns:
+    pandas.DataFrame: The updated registry.
+    """
+    registry = load_registry(registry_fp, missing_ok=True)
+    if artifact is not None:
+        if shorthand is None:
+            raise ValueError("A --shorthand is required to register a new diet")
+        clash = registry[(registry["shorthand"] == shorthand) & (registry["artifact"] != artifact)]
+        if not clash.empty:
+            raise ValueError(f"Shorthand `{shorthand}` is already used for {clash['artifact'].iloc[0]}")
+        registry = registry[registry["artifact"] != artifact]
+        registry = pd.concat([registry, pd.DataFrame([{"shorthand": shorthand, "artifact": artifact, "sha256": ""}])],
+                             ignore_index=True)
+
+    for i, row in registry.iterrows():
+        diet_fp = os.path.join(diet_dir, row["artifact"])
+        if os.path.exists(diet_fp):
+            registry.loc[i, "sha256"] = file_sha256(diet_fp)
+        else:
+            print(f"{diet_fp} not found, keeping the registered hash of `{row['shorthand']}`")
+    registry.to_csv(registry_fp, index=False)
+    print(f"Registry with {len(registry)} diets saved to {registry_fp}")
+    return registry
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Diet registry and parsed medium cache")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    register_parser = subparsers.add_parser("register", help="Add a diet or refresh the registered hashes")
+    register_parser.add_argument("--diet_dir", default=DEFAULT_DIET_DIR, help="Folder with the diet .qza files")
+    register_parser.add_argument("--artifact", default=None, help="Diet .qza file name to add")
+    register_parser.add_argument("--shorthand", default=None, help="Shorthand for the added diet")
+    register_parser.add_argument("--registry", default=DEFAULT_REGISTRY, help="Path to the diet registry")
+
+    shorthand_parser = subparsers.add_parser("shorthand", help="Print the shorthand of a diet")
+    shorthand_parser.add_argument("diet", help="Diet path, file name or stem")
+    shorthand_parser.add_argument("--registry", default=DEFAULT_REGISTRY, help="Path to the diet registry")
+
+    list_parser = subparsers.add_parser("list", help="Print the registry")
+    list_parser.add_argument("--registry", default=DEFAULT_REGISTRY, help="Path to the diet registry")
+
+    args = parser.parse_args()
+
+    if args.command == "register":
+        register_diets(args.diet_dir, args.registry, args.artifact, args.shorthand)
+    elif args.command == "shorthand":
+        print(diet_shorthand(args.diet, args.registry))
+    else:
+        print(load_registry(args.registry).to_string(index=False))
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Diet Sensitivity from LP Duals
+------------------------------
+
+Purpose:
+To see which dietary metabolites drive a genus's predicted growth we used to perturb the
+medium and rerun `grow()` once per metabolite. This script gets the same information from
+one pass over the solved models: for every sample it solves the cooperative tradeoff once,
+then, for every taxon, maximizes that taxon's growth while the other taxa keep their
+tradeoff growth rates, and reads the reduced cost of each medium import and the shadow
+price of the corresponding medium metabolite from the LP solution. The reduced cost is the
+growth rate the taxon loses per unit of import removed (the marginal value of the last unit
+of import). Where the solver does not return duals, the sensitivity is estimated by finite
+differences (lowering the import bound by `fd_step` and re-solving) for those entries only.
+When several imports limit growth at once (a degenerate optimum), the solver attributes the
+value to some of them and reports 0 for the others, so a 0 means "not limiting on its own".
+
+Workflow:
+1. Build the medium from the diet and the metabolites added by medium completion
+   (the `added_metabolites_*.csv` written by `add_suggested_metabolites`).
+2. Per sample (in parallel): cooperative tradeoff -> reference growth rates.
+3. Per taxon: one LP maximizing its growth with the other taxa fixed at their reference
+   rates; read reduced costs/shadow prices of the medium exchanges.
+4. Fill missing duals with finite differences and write one table.
+
+Inputs:
+- A manifest and model folder from `build()`, a diet (.qza or registered shorthand) and,
+  optionally, the added metabolites CSV.
+
+Outputs:
+- `--out_fp` (CSV) with one row per sample x taxon x medium metabolite: reaction, metabolite,
+  import (bound), growth_rate (reference), max_growth, reduced_cost, shadow_price,
+  sensitivity and method ("dual" or "finite_difference").
+
+Usage:
+    python diet_sensitivity.py --manifest ../data/pickled_models/pickled_F01_agora201_gurobi/manifest.csv \
+        --diet_fp ../data/diets/western_diet_gut_agora.qza \
+        --added_metab_fp ../data/added_metabolites/added_metabolites_F01_agora201_refseq216_genus_1_wd.csv \
+        --tradeoff 0.5 --threads 10 --out_fp ../data/diet_sensitivity/F01_agora201_wd_0.5.csv
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+from diet_registry import load_diet
+
+
+def import_duals(com, reactions):
+    """
+    Read the reduced cost of each import and the shadow price of its medium metabolite.
+
+    Parameters:
+    com (micom.Community): A community with an optimal LP solution.
+    reactions (list): Medium exchange reaction IDs.
+
+    Returns:
+    pandas.DataFrame: reduced_cost and shadow_price by reaction (NaN where the solver gives no duals).
+    """
+    duals = pd.DataFrame(np.nan, index=reactions, columns=["reduced_cost", "shadow_price"])
+    for rid in reactions:
+        try:
+            rxn = com.reactions.get_by_id(rid)
+            met = list(rxn.metabolites.keys())[0]
+            # imports run through the reverse variable, so its reduced cost is the value of one more unit
+            duals.loc[rid, "reduced_cost"] = rxn.reverse_variable.dual
+            duals.loc[rid, "shadow_price"] = com.constraints[met.id].dual
+        except Exception as e:
+            # only this reaction falls back to NaN (and to finite differences)
+            print(f"No duals for {rid}: {type(e).__name__}: {e}")
+    return duals.astype(float)
+
+
+def finite_difference(com, rid, base, fd_step=0.01):
+    """
+    Estimate the growth lost per unit of import by lowering the import bound and re-solving.
+
+    Parameters:
+    com (micom.Community): The community with the taxon objective set.
+    rid (str): Medium exchange reaction ID.
+    base (float): Objective value with the unmodified medium.
+    fd_step (float): Import reduction (capped at the import bound).
+
+    Returns:
+    float: (base - perturbed objective) / step, NaN if the perturbed problem cannot be solved.
+    """
+    rxn = com.reactions.get_by_id(rid)
+    step = min(fd_step, -rxn.lower_bound)
+    if step <= 0:
+        return 0.0
+    with com:
+        rxn.lower_bound += step
+        perturbed = com.slim_optimize(error_value=np.nan)
+    return (base - perturbed) / step
+
+
+def sample_sensitivity(com, medium, tradeoff=0.5, fd_step=0.01, rtol=1e-6):
+    """
+    Compute the diet sensitivity of every taxon in one community.
+
+    Parameters:
+    com (micom.Community): The community model.
+    medium (pandas.Series): Import fluxes with exchange reaction IDs as index.
+    tradeoff (float): Cooperative tradeoff used for the reference growth rates.
+    fd_step (float): Import reduction for the finite-difference fallback.
+    rtol (float): Relative slack on the other taxa's reference growth rates.
+
+    Returns:
+    pandas.DataFrame: One row per taxon and medium reaction.
+    """
+    com.medium = medium[medium.index.isin([r.id for r in com.exchanges])].to_dict()
+    reference = com.cooperative_tradeoff(fraction=tradeoff).members.growth_rate.drop("medium")
+    reactions = list(com.medium)
+    tables = []
+    for taxon in com.taxa:
+        # raw optlang bounds are not undone by the model context, so restore them ourselves
+        others = [other for other in com.taxa if other != taxon]
+        original_lb = {other: com.constraints["objective_" + other].lb for other in others}
+        try:
+            with com:
+                for other in others:
+                    com.constraints["objective_" + other].lb = reference[other] * (1 - rtol)
+                com.objective = com.constraints["objective_" + taxon].expression
+                base = com.slim_optimize(error_value=np.nan)
+                duals = import_duals(com, reactions)
+                if np.isnan(base):
+                    duals[:] = np.nan
+                missing = duals["reduced_cost"].isna()
+                duals["sensitivity"] = duals["reduced_cost"]
+                duals["method"] = np.where(missing, "finite_difference", "dual")
+                if not np.isnan(base):
+                    for rid in duals.index[missing]:
+                        duals.loc[rid, "sensitivity"] = finite_difference(com, rid, base, fd_step)
+        finally:
+            for other, lb in original_lb.items():
+                com.constraints["objective_" + other].lb = lb
+        duals["taxon"] = taxon
+        duals["growth_rate"] = reference[taxon]
+        duals["max_growth"] = base
+        tables.append(duals.rename_axis("reaction").reset_index())
+    table = pd.concat(tables, ignore_index=True)
+    table["metabolite"] = [list(com.reactions.get_by_id(r).metabolites.keys())[0].id for r in table.reaction]
+    table["import"] = table.reaction.map(com.medium)
+    return table
+
+
+def _sensitivity(args):
+    """
+    Compute the sensitivity table of one sample (runs in a worker process).
+    """
+    from micom import load_pickle
+
+    sid, p, medium, tradeoff, fd_step = args
+    com = load_pickle(p)
+    table = sample_sensitivity(com, medium, tradeoff, fd_step)
+    table.insert(0, "sample_id", sid)
+    return table
+
+
+def main(manifest_fp, model_folder, diet_fp, added_metab_fp, out_fp, tradeoff=0.5, fd_step=0.01, threads=1):
+    from micom.workflows.core import workflow
+    from micom.workflows.media import process_medium
+
+    manifest = pd.read_csv(manifest_fp)
+    model_folder = model_folder or os.path.dirname(manifest_fp)
+    diet = load_diet(diet_fp).reset_index(drop=True)
+    if added_metab_fp is not None:
+        added = pd.read_csv(added_metab_fp)
+        # the added flux replaces the diet flux, as in the medium grow used
+        diet = pd.concat([diet, added], ignore_index=True).drop_duplicates("reaction", keep="last")
+
+    samples = manifest.sample_id.unique()
+    medium = process_medium(diet[["reaction", "flux"]], samples)
+    args = [[s, os.path.join(model_folder, manifest[manifest.sample_id == s].file.iloc[0]),
+             medium.flux[medium.sample_id == s], tradeoff, fd_step] for s in samples]
+    res = workflow(_sensitivity, args, threads=threads, description="Diet sensitivity")
+    table = pd.concat(res, ignore_index=True)
+    table = table[["sample_id", "taxon", "reaction", "metabolite", "import", "growth_rate", "max_growth",
+                   "reduced_cost", "shadow_price", "sensitivity", "method"]]
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_fp)), exist_ok=True)
+    table.to_csv(out_fp, index=False)
+    n_fd = (table["method"] == "finite_difference").sum()
+    print(f"Sensitivity of {table.taxon.nunique()} taxa to {table.reaction.nunique()} medium components "
+          f"in {len(samples)} samples ({n_fd} of {len(table)} entries by finite differences) "
+          f"saved to {out_fp}")
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Diet sensitivity of taxon growth from LP duals")
+    parser.add_argument("--manifest", required=True, help="manifest.csv written by build()")
+    parser.add_argument("--model_folder", default=None, help="Folder with the pickled models (default: manifest folder)")
+    parser.add_argument("--diet_fp", required=True, help="Path to the diet .qza (or a registered shorthand)")
+    parser.add_argument("--added_metab_fp", default=None, help="added_metabolites CSV from medium completion")
+    parser.add_argument("--tradeoff", type=float, default=0.5, help="Cooperative tradeoff for the reference growth rates")
+    parser.add_argument("--fd_step", type=float, default=0.01, help="Import reduction for the finite-difference fallback")
+    parser.add_argument("--threads", type=int, default=1, help="Samples processed in parallel")
+    parser.add_argument("--out_fp", required=True, help="Output CSV for the sensitivity table")
+    args = parser.parse_args()
+
+    main(args.manifest, args.model_folder, args.diet_fp, args.added_metab_fp, args.out_fp,
+         args.tradeoff, args.fd_step, args.threads)
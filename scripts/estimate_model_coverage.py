@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Estimate Model Database Coverage Before Building
+------------------------------------------------
+
+Purpose:
+This script predicts how much of each sample will be represented in a MICOM community
+model *before* any models are built. It matches the `qiime_to_micom` genus table of each
+subject against the manifest (index) of one or more model databases, using the same
+matching rules as `micom.Community`, but without loading or joining a single GSMM.
+The numbers it reports are the same ones `build()` writes to `manifest.csv`
+(found_taxa, total_taxa, found_fraction, found_abundance_fraction), so samples and
+subjects that would be poorly covered can be dropped before hours of build and grow.
+
+Workflow:
+1. Load each subject's feature table and taxonomy with `qiime_to_micom`.
+2. Read only the manifest of each model database (.qza, .zip or folder).
+3. Normalize abundances per sample and apply the build abundance cutoff.
+4. Match taxa to the model database on the database's summary rank.
+5. Save a per-sample coverage table and a cohort summary across all model databases.
+
+Inputs:
+- A directory of QIIME2 feature tables and taxonomies (`<subject_id>_feature_table.qza`,
+  `<subject_id>_taxonomy.qza`).
+- One or more model databases (e.g. agora103_genus.qza, agora201_refseq216_genus_1.qza).
+
+Outputs:
+- `model_coverage_by_sample.csv`: one row per subject, model database and sample.
+- `model_coverage_summary.csv`: one row per subject and model database with summary
+  statistics and the number of samples below the coverage threshold.
+
+Usage:
+    python estimate_model_coverage.py \
+        --subject_ids F01 M01 M02 \
+        --model_names agora103_genus.qza agora201_refseq216_genus_1.qza \
+        --min_coverage 0.5 \
+        --out_dir ../data/model_coverage/
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import zipfile
+import argparse
+from pathlib import Path
+import pandas as pd
+
+COVERAGE_COLUMNS = ['found_taxa', 'total_taxa', 'found_fraction', 'found_abundance_fraction']
+
+
+def load_model_db_manifest(model_fp):
+    """
+    Load only the manifest of a model database without extracting any models.
+
+    Parameters:
+    model_fp (str): Path to a model database (.qza artifact, .zip file or folder).
+
+    Returns:
+    pandas.DataFrame: The model database manifest (one row per GSMM).
+    """
+    from micom.db import load_manifest
+    from micom.qiime_formats import load_qiime_manifest
+
+    if model_fp.endswith(".qza"):
+        return load_qiime_manifest(model_fp)
+    if model_fp.endswith(".zip"):
+        with zipfile.ZipFile(model_fp) as zf:
+            with zf.open("manifest.csv") as mf:
+                return pd.read_csv(mf)
+    return load_manifest(model_fp)
+
+
+def match_taxa(subject_micom, db_manifest, cutoff=0.0001):
+    """
+    Match the taxa of every sample to a model database as `micom.Community` does.
+
+    This reproduces the abundance normalization, abundance cutoff, rank prefix unification
+    and the merge on the database rank columns for all samples at once.
+
+    Parameters:
+    subject_micom (pandas.DataFrame): Long-format taxonomy from `qiime_to_micom`.
+    db_manifest (pandas.DataFrame): Model database manifest from `load_model_db_manifest`.
+    cutoff (float): Abundance cutoff used in `build()`. Default is 0.0001 (the micom default).
+
+    Returns:
+    pandas.DataFrame: The taxa above the cutoff with their relative abundance and a boolean
+    `found` column (True for taxa with a model in the database).
+    """
+    from micom.constants import RANKS
+    from micom.taxonomy import unify_rank_prefixes
+
+    rank = db_manifest["summary_rank"].iloc[0]
+    if rank not in subject_micom.columns:
+        raise ValueError(f"Missing the column `{rank}` from the taxonomy.")
+
+    taxonomy = subject_micom.copy()
+    if "abundance" not in taxonomy.columns:
+        taxonomy["abundance"] = 1.0
+    # normalize within each sample before the cutoff, as Community does
+    taxonomy["abundance"] = taxonomy["abundance"] / taxonomy.groupby("sample_id")["abundance"].transform("sum")
+    taxonomy = taxonomy[taxonomy["abundance"] > cutoff]
+
+    keep_cols = [r for r in RANKS[0:(RANKS.index(rank) + 1)]
+                 if r in taxonomy.columns and r in db_manifest.columns]
+    db_taxa = db_manifest[keep_cols].drop_duplicates()
+    taxonomy = unify_rank_prefixes(taxonomy, db_manifest)
+    matched = pd.merge(taxonomy, db_taxa, on=keep_cols, how="left", indicator=True)
+    matched["found"] = matched["_merge"] == "both"
+    return matched.drop(columns="_merge")
+
+
+def estimate_coverage(subject_micom, db_manifest, cutoff=0.0001):
+    """
+    Estimate the build metrics of every sample in a taxonomy table for one model database.
+
+    Parameters:
+    subject_micom (pandas.DataFrame): Long-format taxonomy from `qiime_to_micom`.
+    db_manifest (pandas.DataFrame): Model database manifest from `load_model_db_manifest`.
+    cutoff (float): Abundance cutoff used in `build()`. Default is 0.0001 (the micom default).
+
+    Returns:
+    pandas.DataFrame: One row per sample_id with found_taxa, total_taxa, found_fraction
+    and found_abundance_fraction.
+    """
+    matched = match_taxa(subject_micom, db_manifest, cutoff)
+    matched["found_abundance"] = matched["abundance"].where(matched["found"], 0.0)
+
+    coverage = matched.groupby("sample_id").agg(found_taxa=("found", "sum"),
+                                                total_taxa=("found", "size"),
+                                                found_abundance_fraction=("found_abundance", "sum"))
+    coverage["found_fraction"] = coverage["found_taxa"] / coverage["total_taxa"]
+    coverage = coverage.reset_index()[["sample_id"] + COVERAGE_COLUMNS]
+
+    return coverage
+
+
+def summarize_coverage(coverage, min_coverage=0.5):
+    """
+    Summarize per-sample coverage for each subject and model database.
+
+    Parameters:
+    coverage (pandas.DataFrame): Output of `estimate_coverage` with added
+        subject_id and model_db columns.
+    min_coverage (float): Minimum found_abundance_fraction for a sample to be kept.
+
+    Returns:
+    pandas.DataFrame: Mean, median, min, max and std of found_abundance_fraction and
+    found_fraction plus the number of samples that fall below min_coverage.
+    """
+    grouped = coverage.groupby(["subject_id", "model_db"])
+    summary = grouped.agg(n_samples=("sample_id", "nunique"),
+                          mean_found_fraction=("found_fraction", "mean"),
+                          mean_abundance_fraction=("found_abundance_fraction", "mean"),
+                          median_abundance_fraction=("found_abundance_fraction", "median"),
+                          min_abundance_fraction=("found_abundance_fraction", "min"),
+                          max_abundance_fraction=("found_abundance_fraction", "max"),
+                          std_abundance_fraction=("found_abundance_fraction", "std"))
+    summary["n_below_min_coverage"] = (coverage["found_abundance_fraction"] < min_coverage) \
+        .groupby([coverage["subject_id"], coverage["model_db"]]).sum()
+    summary["n_kept"] = summary["n_samples"] - summary["n_below_min_coverage"]
+
+    return summary.reset_index()
+
+
+def filter_covered_samples(subject_micom, model_fp, min_coverage, cutoff=0.0001):
+    """
+    Drop samples whose estimated found_abundance_fraction is below min_coverage.
+
+    Used by simulate_growth_rates_edited.py so that build() and grow() never see
+    samples that the model database cannot represent.
+
+    Parameters:
+    subject_micom (pandas.DataFrame): Long-format taxonomy from `qiime_to_micom`.
+    model_fp (str): Path to the model database.
+    min_coverage (float): Minimum found_abundance_fraction for a sample to be kept.
+    cutoff (float): Abundance cutoff that will be used in `build()`.
+
+    Returns:
+    tuple: (filtered taxonomy, per-sample coverage table with a `skipped` column)
+    """
+    coverage = estimate_coverage(subject_micom, load_model_db_manifest(model_fp), cutoff=cutoff)
+    coverage["skipped"] = coverage["found_abundance_fraction"] < min_coverage
+    keep = coverage.loc[~coverage["skipped"], "sample_id"]
+    filtered_subject_micom = subject_micom[subject_micom["sample_id"].isin(keep)].reset_index(drop=True)
+
+    return filtered_subject_micom, coverage
+
+
+def main(subject_ids, qza_dir, model_dir, model_names, cutoff, min_coverage, out_dir):
+    """
+    Estimate coverage for every subject against every model database and save the tables.
+    """
+    from micom.taxonomy import qiime_to_micom
+
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+
+    db_manifests = {}
+    for model_name in model_names:
+        print(f"Reading manifest for model database {model_name}...")
+        db_manifests[model_name] = load_model_db_manifest(os.path.join(model_dir, model_name))
+
+    coverage_list = []
+    for subject_id in subject_ids:
+        print(f"Loading taxonomy for subject {subject_id}...")
+        feature_table_fp = os.path.join(qza_dir, f"{subject_id}_feature_table.qza")
+        taxonomy_fp = os.path.join(qza_dir, f"{subject_id}_taxonomy.qza")
+        subject_micom = qiime_to_micom(feature_table_fp, taxonomy_fp, collapse_on="genus")
+
+        for model_name, db_manifest in db_manifests.items():
+            print(f"Estimating coverage of subject {subject_id} in {model_name}...")
+            coverage = estimate_coverage(subject_micom, db_manifest, cutoff=cutoff)
+            coverage.insert(0, "model_db", Path(model_name).stem)
+            coverage.insert(0, "subject_id", subject_id)
+            coverage_list.append(coverage)
+
+    coverage = pd.concat(coverage_list, ignore_index=True)
+    coverage["below_min_coverage"] = coverage["found_abundance_fraction"] < min_coverage
+    summary = summarize_coverage(coverage, min_coverage=min_coverage)
+
+    coverage_csv = os.path.join(out_dir, "model_coverage_by_sample.csv")
+    summary_csv = os.path.join(out_dir, "model_coverage_summary.csv")
+    coverage.to_csv(coverage_csv, index=False)
+    summary.to_csv(summary_csv, index=False)
+    print(f"Per-sample coverage saved to {coverage_csv}")
+    print(f"Coverage summary saved to {summary_csv}")
+
+    hopeless = summary[summary["n_kept"] == 0]
+    for _, row in hopeless.iterrows():
+        print(f"No samples of subject {row['subject_id']} reach {min_coverage} coverage in {row['model_db']}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate model database coverage of each sample without building models")
+    parser.add_argument("--subject_ids",
+                        required=True,
+                        nargs="+",
+                        help="List of subject IDs to process")
+    parser.add_argument("--qza_dir",
+                        default="../data/qiime_outputs/",
+                        help="Directory containing <subject_id>_feature_table.qza and <subject_id>_taxonomy.qza")
+    parser.add_argument("--model_dir",
+                        default="../data/models/",
+                        help="Path to model directory")
+    parser.add_argument("--model_names",
+                        required=True,
+                        nargs="+",
+                        help="Names of model databases to compare (e.g. agora103_genus.qza agora201_refseq216_genus_1.qza)")
+    parser.add_argument("--cutoff",
+                        type=float,
+                        default=0.0001,
+                        help="Abundance cutoff that build() will use")
+    parser.add_argument("--min_coverage",
+                        type=float,
+                        default=0.5,
+                        help="Minimum found_abundance_fraction for a sample to be worth building")
+    parser.add_argument("--out_dir",
+                        default="../data/model_coverage/",
+                        help="Directory to save the coverage tables")
+
+    args = parser.parse_args()
+
+    main(args.subject_ids, args.qza_dir,
+         args.model_dir, args.model_names,
+         args.cutoff, args.min_coverage,
+         args.out_dir)
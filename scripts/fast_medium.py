@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Fast Medium Completion (LP Relaxation / Greedy Rounding)
+--------------------------------------------------------
+
+Purpose:
+`complete_community_medium(..., minimize_components=True)` solves one MILP per sample, which
+is one of the slowest steps per subject (and very slow without a commercial MIP solver).
+This module completes the medium with the LP relaxation of that MILP instead: with the
+indicator variables relaxed to [0, 1], minimizing the number of added components becomes
+minimizing the total import flux of the candidates (scaled by `max_import`), which is a
+single LP. The LP solution is rounded by adding every used candidate at `max_import`
+("lp"), optionally followed by a greedy pass that drops added components (smallest LP flux
+first) while the medium stays feasible ("greedy"). The result is verified with a single
+feasibility check that the community reaches `community_growth` and every taxon reaches
+`min_growth`.
+
+Workflow:
+1. Solve the LP relaxation per sample (`micom.media.complete_medium` with the flux objective).
+2. Round: add every candidate with a nonzero LP flux at `max_import`.
+3. (greedy) Try to drop each added component, smallest LP flux first, keeping drops that stay feasible.
+4. Check feasibility of the final medium once.
+5. Optionally solve the MILP for some samples and report how many extra components were added.
+
+Inputs:
+- A manifest and model folder from `build()` and a medium (as for `complete_community_medium`).
+
+Outputs:
+- The completed medium (same columns as `complete_community_medium`).
+- A report with one row per sample: n_added, feasible, n_checks, wall_time and, for compared
+  samples, n_added_milp and extra_components (n_added - n_added_milp).
+
+This module is used by simulate_growth_rates_edited.py with `--medium_completion lp|greedy`.
+
+Usage:
+    python fast_medium.py --manifest ../data/pickled_models/pickled_F01_agora201_gurobi/manifest.csv \
+        --diet_fp ../data/diets/western_diet_gut_agora.qza --strategy greedy --compare_milp 3 \
+        --out_fp F01_wd_completed_medium.csv
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import time
+import logging
+import argparse
+import pandas as pd
+
+from telemetry import span, solver_stats
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ["lp", "greedy", "milp"]
+
+
+def medium_is_feasible(com, medium, community_growth=0.1, min_growth=0.001):
+    """
+    Check whether every taxon can reach `min_growth` (and the community `community_growth`) on a medium.
+
+    Parameters:
+    com (micom.Community): The community model.
+    medium (pandas.Series): Import fluxes with exchange reaction IDs as index.
+    community_growth (float): Minimum community growth rate.
+    min_growth (float): Minimum growth rate of every taxon.
+
+    Returns:
+    bool: True if the medium supports the required growth.
+    """
+    from optlang.symbolics import Zero
+    from micom.util import _apply_min_growth, _format_min_growth
+
+    tol = com.solver.configuration.tolerances.feasibility
+    with com:
+        com.medium = medium[medium.index.isin([r.id for r in com.exchanges])].to_dict()
+        _apply_min_growth(com, _format_min_growth(min_growth, com.taxa), tol, tol)
+        com.add_cons_vars([com.problem.Constraint(com.objective.expression, lb=community_growth,
+                                                  name="micom_ts_growth_check")])
+        com.objective = Zero
+        sol = com.optimize(fluxes=False)
+    return sol is not None
+
+
+def complete_medium_fast(com, medium, community_growth=0.1, min_growth=0.001,
+                         max_import=1, strategy="greedy"):
+    """
+    Complete the medium of one community with the LP relaxation and rounding.
+
+    Parameters:
+    com (micom.Community): The community model.
+    medium (pandas.Series): The original medium (import fluxes by exchange reaction ID).
+    community_growth (float): Minimum community growth rate.
+    min_growth (float): Minimum growth rate of every taxon.
+    max_import (float): Import rate of added components.
+    strategy (str): "lp" (round only) or "greedy" (round, then drop unneeded components).
+
+    Returns:
+    tuple: (completed medium as pandas.Series, number of feasibility checks, feasible flag)
+    """
+    from micom.media import complete_medium
+
+    relaxed = complete_medium(com, medium, growth=community_growth, min_growth=min_growth,
+                              max_import=max_import, minimize_components=False)
+    added = relaxed[~relaxed.index.isin(medium.index)].sort_values()
+    completed = relaxed.copy()
+    completed[added.index] = max_import
+
+    n_checks = 0
+    if strategy == "greedy":
+        for rid in added.index:
+            n_checks += 1
+            if medium_is_feasible(com, completed.drop(rid), community_growth, min_growth):
+                completed = completed.drop(rid)
+    n_checks += 1
+    feasible = medium_is_feasible(com, completed, community_growth, min_growth)
+    return completed, n_checks, feasible
+
+
+def _fix_medium_fast(args):
+    """
+    Complete the medium of one sample (runs in a worker process, like micom's `_fix_medium`).
+    """
+    from micom import load_pickle
+    from micom.media import complete_medium
+
+    sid, p, community_growth, min_growth, max_import, strategy, medium = args
+    start = time.perf_counter()
+    com = load_pickle(p)
+    try:
+        with span("complete sample medium", stage="grow", sample=sid, strategy=strategy) as fields:
+            if strategy == "milp":
+                fixed = complete_medium(com, medium, growth=community_growth, min_growth=min_growth,
+                                        max_import=max_import, minimize_components=True)
+                n_checks, feasible = 0, True
+            else:
+                fixed, n_checks, feasible = complete_medium_fast(com, medium, community_growth, min_growth,
+                                                                 max_import, strategy)
+            fields.update(solver_stats(com), n_checks=n_checks, feasible=feasible)
+    except Exception:
+        logger.error("Can't reach the specified growth rates for model %s." % sid)
+        return None, {"sample_id": sid, "n_added": None, "feasible": False,
+                      "n_checks": 0, "wall_time": time.perf_counter() - start}
+    fixed = pd.DataFrame({"reaction": fixed.index, "flux": fixed.values})
+    fixed["metabolite"] = [list(com.reactions.get_by_id(r).metabolites.keys())[0].id for r in fixed.reaction]
+    fixed["description"] = [list(com.reactions.get_by_id(r).metabolites.keys())[0].name for r in fixed.reaction]
+    fixed["sample_id"] = sid
+    report = {"sample_id": sid, "n_added": int((~fixed.reaction.isin(medium.index)).sum()),
+              "feasible": feasible, "n_checks": n_checks, "wall_time": time.perf_counter() - start}
+    return fixed, report
+
+
+def complete_community_medium_fast(manifest, model_folder, medium, community_growth=0.1,
+                                   min_growth=0.001, max_import=1, strategy="greedy",
+                                   compare_milp=0, summarize=True, threads=1):
+    """
+    Drop-in alternative to `complete_community_medium(..., minimize_components=True)`.
+
+    Parameters:
+    manifest (pandas.DataFrame): The manifest as returned by `build()`.
+    model_folder (str): The folder in which to find the files mentioned in the manifest.
+    medium (pandas.DataFrame): Growth medium with columns "reaction" and "flux".
+    community_growth (float): Minimum community growth rate.
+    min_growth (float): Minimum growth rate of every taxon.
+    max_import (float): Import rate of added components.
+    strategy (str): "lp", "greedy" or "milp" (the original MILP, for comparison).
+    compare_milp (int): Also solve the MILP for this many samples (evenly spaced) and report
+        the extra components of the fast completion (0 to skip).
+    summarize (bool): Return the maximum flux of each component across samples (as micom does).
+    threads (int): Number of samples completed in parallel.
+
+    Returns:
+    tuple: (completed medium as pandas.DataFrame, report as pandas.DataFrame)
+    """
+    from micom.workflows.core import workflow
+    from micom.workflows.media import process_medium
+
+    if strategy not in STRATEGIES:
+        raise ValueError(f"`{strategy}` is not a valid strategy. Must be one of {', '.join(STRATEGIES)}!")
+    samples = manifest.sample_id.unique()
+    paths = {s: os.path.join(model_folder, manifest[manifest.sample_id == s].file.iloc[0]) for s in samples}
+    medium = process_medium(medium, samples)
+    if medium.flux[medium.flux < 1e-6].any():
+        medium.loc[medium.flux < 1e-6, "flux"] = 1e-6
+
+    def run(samples_to_run, run_strategy, description):
+        args = [[s, paths[s], community_growth, min_growth, max_import, run_strategy,
+                 medium.flux[medium.sample_id == s]] for s in samples_to_run]
+        return workflow(_fix_medium_fast, args, threads=threads, description=description)
+
+    res = run(samples, strategy, f"Completing media ({strategy})")
+    if all(fixed is None for fixed, _ in res):
+        raise RuntimeError("All medium completions failed. You may need to increase `max_import` "
+                           "or lower the target growth rate.")
+    report = pd.DataFrame([r for _, r in res])
+
+    if compare_milp > 0 and strategy != "milp":
+        step = max(1, len(samples) // compare_milp)
+        compared = list(samples[::step][:compare_milp])
+        milp = pd.DataFrame([r for _, r in run(compared, "milp", "Completing media (MILP comparison)")])
+        milp = milp.rename(columns={"n_added": "n_added_milp", "wall_time": "wall_time_milp"})
+        report = report.merge(milp[["sample_id", "n_added_milp", "wall_time_milp"]], on="sample_id", how="left")
+        report["extra_components"] = report["n_added"] - report["n_added_milp"]
+
+    final = pd.concat([fixed for fixed, _ in res if fixed is not None])
+    if summarize:
+        final = final.groupby(["reaction", "metabolite", "description"]).flux.max().reset_index()
+    return final, report
+
+
+def summarize_report(report):
+    """
+    Print a short summary of a completion report.
+    """
+    print(f"Completed {report['feasible'].sum()} of {len(report)} media "
+          f"(median {report['n_added'].median():.0f} added components, "
+          f"median {report['wall_time'].median():.1f}s per sample)")
+    if "extra_components" in report.columns:
+        compared = report.dropna(subset=["extra_components"])
+        print(f"Compared with the MILP on {len(compared)} samples: "
+              f"{compared['extra_components'].mean():.1f} extra components on average "
+              f"(max {compared['extra_components'].max():.0f}), "
+              f"{compared['wall_time'].sum():.1f}s vs {compared['wall_time_milp'].sum():.1f}s")
+
+
+if __name__ == "__main__":
+    from diet_registry import load_diet
+
+    parser = argparse.ArgumentParser(description="Complete growth media with the LP relaxation instead of the MILP")
+    parser.add_argument("--manifest", required=True, help="manifest.csv written by build()")
+    parser.add_argument("--model_folder", default=None, help="Folder with the pickled models (default: manifest folder)")
+    parser.add_argument("--diet_fp", required=True, help="Path to qiime defined medium .qza")
+    parser.add_argument("--strategy", default="greedy", choices=STRATEGIES, help="Completion strategy")
+    parser.add_argument("--community_growth", type=float, default=0.1, help="Minimum community growth rate")
+    parser.add_argument("--min_growth", type=float, default=0.001, help="Minimum growth rate of every taxon")
+    parser.add_argument("--max_import", type=float, default=1, help="Import rate of added components")
+    parser.add_argument("--compare_milp", type=int, default=0,
+                        help="Also solve the MILP for this many samples and report the extra components")
+    parser.add_argument("--threads", type=int, default=1, help="Samples completed in parallel")
+    parser.add_argument("--out_fp", required=True, help="Output CSV for the completed medium")
+    args = parser.parse_args()
+
+    manifest = pd.read_csv(args.manifest)
+    model_folder = args.model_folder or os.path.dirname(args.manifest)
+    diet = load_diet(args.diet_fp).reset_index(drop=True)
+    completed, report = complete_community_medium_fast(manifest, model_folder, diet,
+                                                       args.community_growth, args.min_growth,
+                                                       args.max_import, args.strategy,
+                                                       args.compare_milp, threads=args.threads)
+    completed.to_csv(args.out_fp, index=False)
+    report_fp = args.out_fp.replace(".csv", "_report.csv")
+    report.to_csv(report_fp, index=False)
+    summarize_report(report)
+    print(f"Completed medium saved to {args.out_fp} (report: {report_fp})")
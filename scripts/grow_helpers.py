@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Shared Build/Grow Helpers
+-------------------------
+
+Purpose:
+Helpers that were copied between simulate_growth_rates_edited.py, test/simulate_growth_rates.py
+and test/validate_medium.py: loading a subject's QIIME2 artifacts as a micom taxonomy,
+keeping the first samples for quick tests, adding the metabolites suggested by medium
+completion to a diet, and unzipping grow() results. micom is only imported when a subject
+is loaded, so importing this module stays cheap.
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import zipfile
+import pandas as pd
+
+
+def load_subject_data(subject_id, qza_dir, collapse_on='genus'):
+    """
+    Load subject data and convert it to a MICOM-compatible format.
+    Parameters:
+    subject_id (str): The identifier for the subject.
+    qza_dir (str): The directory where the QIIME2 artifact files are located.
+    collapse_on (str, optional): The taxonomic level to collapse on. Default is 'genus'.
+    Returns:
+    pandas.DataFrame: The subject's taxonomy table as used by micom's build().
+    """
+    # imported here so scripts using this module start without loading micom
+    from micom.taxonomy import qiime_to_micom
+
+    feature_table_fp = os.path.join(qza_dir, f"{subject_id}_feature_table.qza")
+    taxonomy_fp = os.path.join(qza_dir, f"{subject_id}_taxonomy.qza")
+    subject_micom = qiime_to_micom(feature_table_fp,
+                                   taxonomy_fp,
+                                   collapse_on=collapse_on)
+
+    return subject_micom
+
+
+def filter_first_n_sample_ids(subject_micom, n=3):
+    """
+    Keep the first `n` samples of a subject (for quick test runs).
+    """
+    first_n_ids = subject_micom["sample_id"].unique()[:n]
+    return subject_micom[subject_micom["sample_id"].isin(first_n_ids)].reset_index(drop=True)
+
+
+def add_suggested_metabolites(diet_og, diet_sugg, added_metab_out="added_metabolites.csv"):
+    """
+    This function takes in the original diet and the micom suggested (completed) diet
+    and returns a new diet that includes the suggested metabolites
+    without removing the original ones. Components the completion raised
+    (or added) take the suggested flux, so every reaction appears once.
+
+    Inputs:
+    diet_og: pandas dataframe with the original diet
+    diet_sugg: pandas dataframe with the diet from micom complete_community_medium
+    added_metab_out: path to output csv file for added metabolites
+
+    Returns:
+    diet_new: pandas dataframe with the original and new nonzero elements of suggested diet
+    """
+
+    diet_og = diet_og.reset_index(drop=True)
+    diet_sugg = diet_sugg.reset_index(drop=True)
+
+    diet_merged = pd.merge(diet_og, diet_sugg, on=['reaction', 'metabolite'], how='outer', suffixes=('_og', '_sugg'))
+    # components missing from the original diet have an original flux of 0, not NaN
+    diet_merged["flux_diff"] = diet_merged["flux_sugg"] - diet_merged["flux_og"].fillna(0)
+    added_metabolites = diet_merged[diet_merged["flux_diff"] > 0]
+    added_metabolites = added_metabolites[["reaction", "metabolite", "global_id", "flux_sugg"]]
+    added_metabolites = added_metabolites.rename(columns={"flux_sugg": "flux"})
+    #write the added metabolites to a csv file
+    added_metabolites.to_csv(added_metab_out, index=False)
+    print(f"Added metabolites saved to {added_metab_out}")
+    #add added_metabolites to diet_og, replacing the original rows of raised components
+    diet_new = pd.concat([diet_og[~diet_og["reaction"].isin(added_metabolites["reaction"])], added_metabolites],
+                         ignore_index=True)
+    #reindex diet_new
+    diet_new = diet_new.reset_index(drop=True)
+    return diet_new
+
+
+def unzip_to_folder(growth_out_fp, out_folder):
+    """
+    Unzips the growth output file to the specified folder.
+    Parameters:
+    growth_out_fp (str): The path to the growth output file.
+    out_folder (str): The folder to unzip the file to.
+    """
+    # unzip the growth output .zip file and save contents to a folder by the same name
+    with zipfile.ZipFile(growth_out_fp, 'r') as zip_ref:
+        zip_ref.extractall(out_folder)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Cached Pairwise Interaction Engine
+----------------------------------
+
+Purpose:
+The interaction notebooks (e.g. M01_Anaero_Fusica_int.ipynb) load a full growth .zip and call
+`micom.interaction.interactions(results, taxa=...)` for one focal taxon at a time. Each call
+regroups all exchange fluxes by sample and metabolite and loops over partners in pandas,
+so every new pair takes minutes. This engine indexes a run's exchange fluxes once, as one
+taxa x metabolites array of abundance-scaled fluxes per sample, classifies every ordered
+taxon pair at once with array operations (samples in parallel), and caches the result in
+the results store. Looking at another pair is then a filtered read of the cache.
+
+The classification follows micom's `interactions`: for a focal taxon, a partner and a
+metabolite that both exchange above the solver tolerance (and do not both export it), the
+interaction is "co-consumed" if both import it, "provided" if the focal taxon exports it
+and "received" otherwise; the flux is the smaller of the two abundance-scaled fluxes.
+
+Workflow:
+1. `compute` lists the runs with exchanges in the results store and skips runs whose cache
+   is newer than their exchanges (same signature as in combine_sim_and_real_data.py).
+2. Per run: build the (sample, taxon, metabolite) index, classify all pairs per sample in
+   parallel, and write `<store>/interactions/<run partition>/part-0.parquet`.
+3. `query` (or `read_interactions`) reads the cached pairs of a focal taxon and partner;
+   `flux_matrix` turns them into a donor x recipient flux matrix.
+
+Inputs:
+- A results store with an `exchanges` table (see results_store.py; runs imported from
+  growth .zip files keep their exchanges).
+
+Outputs:
+- `<store>/interactions/...`: sample_id, focal, partner, metabolite, class, flux per run.
+- `query --out_fp`: the selected interactions with metabolite annotations (CSV).
+
+Usage:
+    python interaction_engine.py compute --store_dir ../data/results_store/ --subject_id M01 --threads 10
+    python interaction_engine.py query --store_dir ../data/results_store/ --subject_id M01 --diet wd \
+        --tradeoff 0.8 --focal g__Anaerostipes --partner g__Fusicatenibacter \
+        --out_fp ../data/interactions/ints_anaerostipes_fusicatenibacter.csv
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from results_store import (PARTITION_COLUMNS, partition_dir, read_table, read_annotations, list_runs,
+                           write_table, table_signature)
+
+INTERACTION_TABLE = "interactions"
+SIGNATURE_FILE = "_exchanges_signature"
+EXCHANGE_COLUMNS = ["taxon", "sample_id", "metabolite", "flux", "abundance", "tolerance"]
+
+
+def index_exchanges(exchanges):
+    """
+    Index the exchange fluxes of a run once, as one array per sample.
+
+    Parameters:
+    exchanges (pandas.DataFrame): exchanges table of a run (taxon, sample_id, metabolite, flux,
+        abundance, tolerance).
+
+    Returns:
+    dict: sample_id -> (taxa, metabolites, taxa x metabolites array of abundance-scaled fluxes,
+    tolerance). Missing exchanges are 0, medium fluxes are left out.
+    """
+    ex = exchanges[exchanges["taxon"] != "medium"]
+    ex = ex.assign(scaled=ex["flux"] * ex["abundance"])
+    index = {}
+    for sample_id, sample in ex.groupby("sample_id", sort=False):
+        scaled = sample.pivot_table(index="taxon", columns="metabolite", values="scaled",
+                                    aggfunc="sum", fill_value=0.0)
+        index[sample_id] = (scaled.index.to_numpy(), scaled.columns.to_numpy(),
+                            scaled.to_numpy(), sample["tolerance"].max())
+    return index
+
+
+def sample_pair_interactions(args):
+    """
+    Classify the interactions of all ordered taxon pairs in one sample (runs in a worker process).
+
+    Parameters:
+    args (tuple): (sample_id, taxa, metabolites, scaled fluxes, tolerance) from `index_exchanges`.
+
+    Returns:
+    pandas.DataFrame: sample_id, focal, partner, metabolite, class, flux.
+    """
+    sample_id, taxa, metabolites, scaled, tol = args
+    active = np.abs(scaled) > tol
+    exports = active & (scaled > 0)
+    imports = active & (scaled < 0)
+    # focal x partner x metabolite
+    pair = active[:, None, :] & active[None, :, :] & ~(exports[:, None, :] & exports[None, :, :])
+    pair &= ~np.eye(len(taxa), dtype=bool)[:, :, None]
+    focal, partner, met = np.nonzero(pair)
+    classes = np.where(imports[focal, met] & imports[partner, met], "co-consumed",
+                       np.where(exports[focal, met], "provided", "received"))
+    flux = np.minimum(np.abs(scaled[focal, met]), np.abs(scaled[partner, met]))
+    return pd.DataFrame({"sample_id": sample_id, "focal": taxa[focal], "partner": taxa[partner],
+                         "metabolite": metabolites[met], "class": classes, "flux": flux})
+
+
+def run_interactions(exchanges, threads=1):
+    """
+    Compute the interactions of all taxon pairs in all samples of a run.
+
+    Parameters:
+    exchanges (pandas.DataFrame): exchanges table of the run.
+    threads (int): Number of samples processed in parallel.
+
+    Returns:
+    pandas.DataFrame: sample_id, focal, partner, metabolite, class, flux.
+    """
+    jobs = [(sample_id, *arrays) for sample_id, arrays in index_exchanges(exchanges).items()]
+    if threads > 1:
+        with ProcessPoolExecutor(max_workers=threads) as pool:
+            tables = list(pool.map(sample_pair_interactions, jobs, chunksize=max(1, len(jobs) // (4 * threads))))
+    else:
+        tables = [sample_pair_interactions(job) for job in jobs]
+    return pd.concat(tables, ignore_index=True)
+
+
+def compute_interactions(store_dir, threads=1, overwrite=False, **filters):
+    """
+    Compute and cache the interactions of every run with exchanges that is not cached yet.
+
+    Parameters:
+    store_dir (str): Root folder of the results store.
+    threads (int): Number of samples processed in parallel.
+    overwrite (bool): Recompute runs even if their cache is up to date.
+    **filters: Partition values of the runs to process (as for `read_table`).
+
+    Returns:
+    pandas.DataFrame: The processed runs with the number of interactions.
+    """
+    runs = list_runs(store_dir, "exchanges")
+    for col, value in filters.items():
+        if value is not None:
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            values = [float(v) for v in values] if col == "tradeoff" else [str(v) for v in values]
+            runs = runs[runs[col].isin(values)]
+
+    done = []
+    for _, run in runs.iterrows():
+        params = run[PARTITION_COLUMNS].to_dict()
+        signature = table_signature(store_dir, "exchanges", params)
+        signature_fp = os.path.join(partition_dir(store_dir, INTERACTION_TABLE, params), SIGNATURE_FILE)
+        if not overwrite and os.path.exists(signature_fp):
+            with open(signature_fp) as fh:
+                if fh.read().strip() == signature:
+                    continue
+        exchanges = read_table(store_dir, "exchanges", columns=EXCHANGE_COLUMNS, **params)
+        interactions = run_interactions(exchanges, threads)
+        write_table(interactions, store_dir, INTERACTION_TABLE, params)
+        with open(signature_fp, "w") as fh:
+            fh.write(signature)
+        done.append({**params, "n_interactions": len(interactions)})
+        print(f"{len(interactions)} interactions in {exchanges['sample_id'].nunique()} samples for "
+              f"{', '.join(str(v) for v in params.values())}")
+    print(f"Computed interactions for {len(done)} of {len(runs)} runs ({len(runs) - len(done)} already cached)")
+    return pd.DataFrame(done)
+
+
+def match_taxa(taxa, names):
+    """
+    Match taxon names to the taxa of a run: exact names are used as is, other names select
+    every taxon that contains them (e.g. "Anaerostipes" for "g__Anaerostipes").
+    """
+    names = [names] if isinstance(names, str) else names
+    matched = set()
+    for name in names:
+        matched |= {name} if name in taxa else {t for t in taxa if name in t}
+    return sorted(matched)
+
+
+def read_interactions(store_dir, focal=None, partner=None, annotate=True, **filters):
+    """
+    Read cached interactions, e.g. of one focal taxon with one partner.
+
+    Parameters:
+    store_dir (str): Root folder of the results store.
+    focal, partner (str or list, optional): Taxa to keep (see `match_taxa`).
+    annotate (bool): Add the metabolite annotations of the model database.
+    **filters: Partition values of the runs to read (as for `read_table`).
+
+    Returns:
+    pandas.DataFrame: Matching interactions (with the run parameters), like micom's `interactions`.
+    """
+    ints = read_table(store_dir, INTERACTION_TABLE, **filters)
+    for col, names in (("focal", focal), ("partner", partner)):
+        if names is not None:
+            ints = ints[ints[col].isin(match_taxa(ints[col].unique(), names))]
+    if annotate and not ints.empty:
+        annotations = pd.concat([read_annotations(store_dir, db).assign(model_db=db)
+                                 for db in ints["model_db"].unique()])
+        ints = ints.merge(annotations.drop_duplicates(["model_db", "metabolite"]),
+                          on=["model_db", "metabolite"], how="left")
+    return ints.reset_index(drop=True)
+
+
+def flux_matrix(interactions, metabolite=None, sample_id=None):
+    """
+    Sum the provided fluxes into a donor x recipient matrix.
+
+    Parameters:
+    interactions (pandas.DataFrame): Output of `read_interactions` or `run_interactions`.
+    metabolite (str or list, optional): Only count these metabolites.
+    sample_id (optional): Only count this sample (or list of samples).
+
+    Returns:
+    pandas.DataFrame: Flux from the donor (rows) to the recipient (columns).
+    """
+    provided = interactions[interactions["class"] == "provided"]
+    if metabolite is not None:
+        provided = provided[provided["metabolite"].isin(np.atleast_1d(metabolite))]
+    if sample_id is not None:
+        provided = provided[provided["sample_id"].isin(np.atleast_1d(sample_id))]
+    return provided.pivot_table(index="focal", columns="partner", values="flux",
+                                aggfunc="sum", fill_value=0.0).rename_axis(index="donor", columns="recipient")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cached pairwise interactions from grow results")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    compute_parser = subparsers.add_parser("compute", help="Compute and cache the interactions of stored runs")
+    query_parser = subparsers.add_parser("query", help="Read the cached interactions of a taxon pair")
+    for sub in (compute_parser, query_parser):
+        sub.add_argument("--store_dir", default="../data/results_store/", help="Root folder of the results store")
+        for col in PARTITION_COLUMNS:
+            sub.add_argument(f"--{col}", nargs="+", default=None, help=f"Keep only these {col} values")
+    compute_parser.add_argument("--threads", type=int, default=1, help="Samples processed in parallel")
+    compute_parser.add_argument("--overwrite", action="store_true", help="Recompute runs that are already cached")
+    query_parser.add_argument("--focal", nargs="+", default=None, help="Focal taxa (e.g. g__Anaerostipes)")
+    query_parser.add_argument("--partner", nargs="+", default=None, help="Partner taxa")
+    query_parser.add_argument("--out_fp", default=None, help="Save the interactions as CSV (default: print)")
+    args = parser.parse_args()
+
+    filters = {col: getattr(args, col) for col in PARTITION_COLUMNS}
+    if args.command == "compute":
+        compute_interactions(args.store_dir, args.threads, args.overwrite, **filters)
+    else:
+        ints = read_interactions(args.store_dir, args.focal, args.partner, **filters)
+        if args.out_fp is None:
+            print(ints.sort_values("flux", ascending=False).head(20).to_string(index=False))
+        else:
+            ints.to_csv(args.out_fp, index=False)
+            print(f"{len(ints)} interactions saved to {args.out_fp}")
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+All-Pairs Lagged Regression of Genus Growth Rates
+-------------------------------------------------
+
+Purpose:
+The lagged regressions that flagged pairs such as Anaerostipes-Fusicatenibacter and
+Subdoligranulum-Faecalibacterium in M01 were fit one pair at a time in notebooks. With
+~100 observed genera per subject that is ~10k ordered pairs per lag, too slow to rerun
+whenever the data changes. This script fits every (target, driver, lag) regression of a
+subject at once:
+
+    clr_change[target, t] = b0 + a * clr_change[target, t - 1] + b * clr_change[driver, t - lag] + e
+
+For every target and lag the shared columns (intercept and the target's own previous change)
+are projected out once (Frisch-Waugh-Lovell), after which the driver coefficient, its
+standard error and t-test for all drivers are a handful of batched array operations on the
+stacked lagged matrices. P-values are corrected with Benjamini-Hochberg across all tests of
+a subject, subjects run in parallel, and significant pairs are joined to the MICOM-predicted
+metabolite exchanges between the same two genera (see interaction_engine.py).
+
+Genera that were never observed in a subject all get the same CLR change series (scaled by a
+constant), since only the pseudo-count and the geometric mean move. These series are dropped
+before fitting, which leaves the observed genera.
+
+Workflow:
+1. Load each subject's CLR actual growth rates (genus x sample, consecutive daily samples).
+2. Drop never-observed genera (the most common series up to scaling).
+3. For every lag: build the lagged target/driver matrices, residualize on the target's
+   intercept and autoregressive term, and compute coefficients, partial correlations and
+   p-values for all ordered pairs.
+4. Adjust p-values (Benjamini-Hochberg) per subject.
+5. Optionally join significant pairs to the cached MICOM interactions (driver provides a
+   metabolite to the target) from a results store.
+
+Inputs:
+- `<actual_dir>/<subject>_clr_actual_growth_rates_by_genus.csv` for each subject.
+- Optionally, a results store with cached interactions (interaction_engine.py compute).
+
+Outputs (in `--out_dir`):
+- `lagged_regression.csv`: subject_id, target, driver, lag, n, coef, std_err, partial_r,
+  t_stat, p_value, q_value, significant.
+- `lagged_regression_interactions.csv`: significant pairs with, per MICOM run, the number of
+  samples/metabolites where the driver provides to the target, the total flux and the top
+  metabolites.
+
+Usage:
+    python lagged_regression.py --subject_ids F01 M01 M02 --lags 1 2 3 --threads 3 \
+        --store_dir ../data/results_store/ --out_dir ../data/lagged_regression/
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+SUBJECTS = ["F01", "M01", "M02"]
+
+
+def load_clr_matrix(subject_id, actual_dir, drop_unobserved=True):
+    """
+    Load a subject's CLR actual growth rates as a genus x sample matrix in time order.
+
+    Parameters:
+    subject_id (str): Subject to load.
+    actual_dir (str): Folder with <subject>_clr_actual_growth_rates_by_genus.csv files.
+    drop_unobserved (bool): Drop the genera that share the most common series up to scaling
+        (never observed in the subject).
+
+    Returns:
+    pandas.DataFrame: Genera as index (with the "g__" prefix), epoch times as columns.
+    """
+    fp = os.path.join(actual_dir, f"{subject_id}_clr_actual_growth_rates_by_genus.csv")
+    clr = pd.read_csv(fp).set_index("Genus")
+    clr = clr[sorted(clr.columns, key=float)]
+    if drop_unobserved:
+        values = clr.to_numpy()
+        norms = np.linalg.norm(values, axis=1, keepdims=True)
+        shapes = pd.Series([tuple(row) for row in np.round(values / np.where(norms > 0, norms, 1), 8)],
+                           index=clr.index)
+        counts = shapes.value_counts()
+        if counts.iloc[0] > 1:
+            clr = clr[shapes != counts.index[0]]
+    return clr
+
+
+def lagged_pair_regressions(clr, lag):
+    """
+    Fit the lagged regression of every target on every driver for one lag.
+
+    Parameters:
+    clr (pandas.DataFrame): Genus x sample matrix from `load_clr_matrix`.
+    lag (int): Number of samples between the driver and the target (>= 1).
+
+    Returns:
+    pandas.DataFrame: target, driver, lag, n, coef, std_err, partial_r, t_stat, p_value
+    for all ordered pairs of different genera.
+    """
+    from scipy.stats import t as t_dist
+
+    values = clr.to_numpy(dtype=float)
+    n_genera, n_samples = values.shape
+    rows = np.arange(max(lag, 1), n_samples)
+    n = len(rows)
+    dof = n - 3
+    y = values[:, rows]                                           # target x n
+    x = values[:, rows - lag]                                     # driver x n
+    controls = np.stack([np.ones_like(y), values[:, rows - 1]], axis=2)  # target x n x 2
+    q, _ = np.linalg.qr(controls)
+    # residuals of the targets and of every driver after removing each target's controls
+    ry = y - np.einsum("gnk,gk->gn", q, np.einsum("gnk,gn->gk", q, y))
+    rx = x[None, :, :] - np.einsum("gnk,gkd->gdn", q, np.einsum("gnk,dn->gkd", q, x))  # target x driver x n
+    sxx = np.einsum("gdn,gdn->gd", rx, rx)
+    sxy = np.einsum("gdn,gn->gd", rx, ry)
+    syy = np.einsum("gn,gn->g", ry, ry)[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        coef = sxy / sxx
+        sse = np.clip(syy - coef * sxy, 0, None)
+        std_err = np.sqrt(sse / dof / sxx)
+        t_stat = coef / std_err
+        partial_r = sxy / np.sqrt(sxx * syy)
+    p_value = 2 * t_dist.sf(np.abs(t_stat), dof)
+    # drivers collinear with the controls (e.g. the target itself at lag 1) cannot be tested
+    degenerate = sxx <= 1e-10 * np.einsum("dn,dn->d", x, x)[None, :]
+    target, driver = np.nonzero(~np.eye(n_genera, dtype=bool))
+    table = pd.DataFrame({"target": clr.index[target], "driver": clr.index[driver], "lag": lag, "n": n,
+                          "coef": coef[target, driver], "std_err": std_err[target, driver],
+                          "partial_r": partial_r[target, driver], "t_stat": t_stat[target, driver],
+                          "p_value": p_value[target, driver]})
+    table.loc[degenerate[target, driver], ["coef", "std_err", "partial_r", "t_stat", "p_value"]] = np.nan
+    return table
+
+
+def subject_regressions(subject_id, actual_dir, lags=(1, 2, 3), alpha=0.05):
+    """
+    Fit all lagged pair regressions of one subject and adjust the p-values.
+
+    Parameters:
+    subject_id (str): Subject to process.
+    actual_dir (str): Folder with the CLR actual growth rate CSVs.
+    lags (list of int): Lags to fit.
+    alpha (float): FDR level for `significant`.
+
+    Returns:
+    pandas.DataFrame: Output of `lagged_pair_regressions` for all lags with subject_id,
+    q_value (Benjamini-Hochberg across all tests of the subject) and significant.
+    """
+    from scipy.stats import false_discovery_control
+
+    clr = load_clr_matrix(subject_id, actual_dir)
+    table = pd.concat([lagged_pair_regressions(clr, lag) for lag in lags], ignore_index=True)
+    table.insert(0, "subject_id", subject_id)
+    tested = table["p_value"].notna()
+    table["q_value"] = np.nan
+    table.loc[tested, "q_value"] = false_discovery_control(table.loc[tested, "p_value"].to_numpy())
+    table["significant"] = table["q_value"] < alpha
+    print(f"{subject_id}: {len(clr)} genera, {tested.sum()} tests, {table['significant'].sum()} significant")
+    return table
+
+
+def _subject_regressions(args):
+    """
+    Run `subject_regressions` in a worker process.
+    """
+    return subject_regressions(*args)
+
+
+def join_interactions(significant, store_dir, top_n=5, **filters):
+    """
+    Join significant (driver -> target) pairs to the MICOM metabolites the driver provides to the target.
+
+    Parameters:
+    significant (pandas.DataFrame): Significant rows of the regression table.
+    store_dir (str): Results store with cached interactions (interaction_engine.py compute).
+    top_n (int): Number of metabolites (by total flux) listed per pair and run.
+    **filters: Partition values of the runs to use (e.g. diet="wd", tradeoff=0.8).
+
+    Returns:
+    pandas.DataFrame: One row per significant pair, lag and run with n_samples, n_metabolites,
+    total_flux and top_metabolites (pairs without predicted exchange are kept with 0).
+    """
+    from interaction_engine import read_interactions
+
+    pairs = significant[["subject_id", "target", "driver"]].drop_duplicates()
+    subjects = pairs["subject_id"].unique().tolist()
+    if filters.get("subject_id") is not None:
+        subjects = [s for s in subjects if s in np.atleast_1d(filters["subject_id"])]
+    ints = read_interactions(store_dir, annotate=False, **{**filters, "subject_id": subjects})
+    provided = ints[ints["class"] == "provided"].rename(columns={"focal": "driver", "partner": "target"})
+    provided = provided.merge(pairs, on=["subject_id", "driver", "target"])
+
+    run_columns = ["model_db", "solver", "diet", "tradeoff"]
+    keys = ["subject_id", "driver", "target"] + run_columns
+    by_metabolite = provided.groupby(keys + ["metabolite"])["flux"].sum().reset_index()
+    top = (by_metabolite.sort_values("flux", ascending=False).groupby(keys)["metabolite"]
+           .apply(lambda mets: ";".join(mets.head(top_n))).rename("top_metabolites"))
+    summary = provided.groupby(keys).agg(n_samples=("sample_id", "nunique"),
+                                         n_metabolites=("metabolite", "nunique"),
+                                         total_flux=("flux", "sum")).join(top).reset_index()
+    joined = significant.merge(summary, on=["subject_id", "driver", "target"], how="left")
+    joined[["n_samples", "n_metabolites", "total_flux"]] = joined[["n_samples", "n_metabolites",
+                                                                   "total_flux"]].fillna(0)
+    return joined.sort_values(["subject_id", "q_value", "total_flux"], ascending=[True, True, False])
+
+
+def main(subject_ids, actual_dir, out_dir, lags=(1, 2, 3), alpha=0.05, threads=1,
+         store_dir=None, top_n=5, **filters):
+    jobs = [(subject_id, actual_dir, list(lags), alpha) for subject_id in subject_ids]
+    with ProcessPoolExecutor(max_workers=threads) as pool:
+        table = pd.concat(list(pool.map(_subject_regressions, jobs)), ignore_index=True)
+
+    os.makedirs(out_dir, exist_ok=True)
+    out_fp = os.path.join(out_dir, "lagged_regression.csv")
+    table.to_csv(out_fp, index=False)
+    print(f"{len(table)} regressions ({table['significant'].sum()} significant at FDR {alpha}) saved to {out_fp}")
+
+    if store_dir is not None:
+        joined = join_interactions(table[table["significant"]], store_dir, top_n, **filters)
+        joined_fp = os.path.join(out_dir, "lagged_regression_interactions.csv")
+        joined.to_csv(joined_fp, index=False)
+        print(f"Significant pairs joined to MICOM interactions saved to {joined_fp}")
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="All-pairs lagged regression of genus CLR growth rates")
+    parser.add_argument("--subject_ids", nargs="+", default=SUBJECTS, help="Subjects to process")
+    parser.add_argument("--actual_dir", default="../data/actual_growth_rates_genus_clr/",
+                        help="Folder with <subject>_clr_actual_growth_rates_by_genus.csv files")
+    parser.add_argument("--lags", nargs="+", type=int, default=[1, 2, 3], help="Driver lags (in samples, >= 1)")
+    parser.add_argument("--alpha", type=float, default=0.05, help="FDR level")
+    parser.add_argument("--threads", type=int, default=1, help="Subjects processed in parallel")
+    parser.add_argument("--store_dir", default=None,
+                        help="Results store with cached interactions to join significant pairs to")
+    parser.add_argument("--model_db", nargs="+", default=None, help="Only join interactions of these model DBs")
+    parser.add_argument("--diet", nargs="+", default=None, help="Only join interactions of these diets")
+    parser.add_argument("--tradeoff", nargs="+", type=float, default=None, help="Only join interactions of these tradeoffs")
+    parser.add_argument("--top_n", type=int, default=5, help="Metabolites listed per joined pair")
+    parser.add_argument("--out_dir", default="../data/lagged_regression/", help="Output folder")
+    args = parser.parse_args()
+
+    if min(args.lags) < 1:
+        parser.error("lags must be >= 1 (lag 1 is the first sample after the driver)")
+    main(args.subject_ids, args.actual_dir, args.out_dir, args.lags, args.alpha, args.threads,
+         args.store_dir, args.top_n, model_db=args.model_db, diet=args.diet, tradeoff=args.tradeoff)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+micom-ts Command Line Interface
+-------------------------------
+
+Purpose:
+One entry point for all scripts of the workflow (`micom-ts <command> ...`, installed with
+`pip install .` as the `micom_time_series` package). Only the module of the chosen command is
+imported, and the scripts load micom, scipy and the solver interfaces only once they are needed,
+so `--help`, argument errors and dry runs return right away. Each command takes the same
+arguments as its script (`python <script>.py ...` keeps working). `--trace` and `--profile`
+before the command switch on the structured telemetry of telemetry.py for the command and every
+process it starts.
+
+Usage:
+    micom-ts --help
+    micom-ts grow --subject_id F01 --model_name agora201_refseq216_genus_1.qza ...
+    micom-ts sweep --subject_ids F01 M01 --model_names agora201_refseq216_genus_1.qza \
+        --diets western_diet_gut_agora.qza --tradeoffs 0.5 --dry_run
+    micom-ts --trace ../data/traces/F01.jsonl --profile cprofile --profile_stages grow grow --subject_id F01 ...
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import sys
+import runpy
+import argparse
+
+# command -> (module, description)
+COMMANDS = {
+    "wrangle": ("time_series_data_wrangling", "Average, interpolate and export the OTU tables per subject"),
+    "silva": ("silva_taxonomy_mapping", "Map OTUs to SILVA taxonomy with QIIME2"),
+    "actual": ("calculate_actual_growth_rates_genus_clr", "Actual CLR growth rates by genus"),
+    "coverage": ("estimate_model_coverage", "Estimate model database coverage before building"),
+    "cutoff": ("adaptive_cutoff", "Calibrate and choose per-sample abundance cutoffs"),
+    "grow": ("simulate_growth_rates_edited", "Build and grow the community models of a subject"),
+    "sweep": ("sweep_scheduler", "Run a simulation sweep packed onto the available cores and memory"),
+    "queue": ("sweep_queue", "Distribute a simulation sweep over workers through a shared queue"),
+    "pipeline": ("pipeline", "Run all stages as a DAG, skipping up-to-date nodes"),
+    "diets": ("diet_registry", "Diet registry and parsed medium cache"),
+    "medium": ("fast_medium", "LP/greedy medium completion"),
+    "store": ("results_store", "Partitioned Parquet results store"),
+    "combine": ("combine_sim_and_real_data", "Combine simulated and actual growth rates"),
+    "score": ("score_agreement", "Score agreement of simulated and actual growth rates"),
+    "tradeoff-search": ("tradeoff_search", "Adaptive tradeoff search per subject"),
+    "sensitivity": ("diet_sensitivity", "Growth sensitivity to diet imports"),
+    "interactions": ("interaction_engine", "Cached pairwise interactions from grow results"),
+    "lagged": ("lagged_regression", "All-pairs lagged regression of actual growth rates"),
+    "cube": ("analysis_cube", "Memory-mapped analysis cube of all results"),
+    "index": ("query_index", "SQL query index over runs and outputs"),
+    "runs": ("run_registry", "Registry of simulation runs keyed by a hash of their inputs"),
+    "trace": ("telemetry", "Summarize a telemetry trace, convert it to Chrome trace format or smoke-check telemetry"),
+    "compare": ("compare_results", "Check that results match a golden baseline within tolerances"),
+}
+
+
+def usage():
+    """
+    Build the top-level help text (without importing any command).
+    """
+    width = max(len(command) for command in COMMANDS)
+    lines = ["usage: micom-ts [--trace TRACE] [--profile {cprofile,py-spy}] [--profile_stages STAGES]",
+             "                [--profile_dir PROFILE_DIR] <command> [arguments]", "",
+             "MICOM time series workflow. Run `micom-ts <command> --help` for the arguments of a command.", "",
+             "commands:"]
+    lines += [f"  {command:<{width}}  {description}" for command, (_, description) in COMMANDS.items()]
+    lines += ["", "telemetry options (see telemetry.py):",
+              "  --trace TRACE              append structured events of the command to this JSONL file",
+              "  --profile PROFILER         profile the traced steps with cprofile or py-spy",
+              "  --profile_stages STAGES    only profile these stages (comma-separated, e.g. grow,actual)",
+              "  --profile_dir PROFILE_DIR  folder for the profiles (default: next to the trace)"]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """
+    Run the script of a command with the remaining arguments, as if it was called directly.
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return 0
+    # options before the command are ours, everything after it belongs to the command
+    parser = argparse.ArgumentParser(prog="micom-ts", usage=usage(), add_help=False)
+    parser.add_argument("--trace", default=None)
+    parser.add_argument("--profile", choices=["cprofile", "py-spy"], default=None)
+    parser.add_argument("--profile_stages", default=None)
+    parser.add_argument("--profile_dir", default=None)
+    parser.add_argument("command", nargs="?")
+    parser.add_argument("args", nargs=argparse.REMAINDER)
+    options = parser.parse_args(argv)
+    command = options.command
+    if command not in COMMANDS:
+        print(usage(), file=sys.stderr)
+        print(f"\nmicom-ts: error: unknown command `{command}`", file=sys.stderr)
+        return 2
+    if options.trace or options.profile:
+        from telemetry import configure
+        configure(options.trace, options.profile,
+                  options.profile_stages.split(",") if options.profile_stages else None, options.profile_dir)
+    module = COMMANDS[command][0]
+    sys.argv = [module] + options.args
+    # alter_sys makes the script `__main__`, so its functions can be pickled for worker processes
+    runpy.run_module(module, run_name="__main__", alter_sys=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
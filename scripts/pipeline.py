@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+DAG Pipeline Runner with Content-Hash Caching
+---------------------------------------------
+
+Purpose:
+The stages (wrangling, SILVA mapping, actual growth rates, simulation, combine) used to be
+chained by hand through folder conventions like `../data/qiime_outputs/`. This runner
+declares them as a DAG of nodes with typed inputs and outputs (an input must be produced
+with the same type it is consumed as), one node per subject for the per-subject stages and
+one per run for the simulations. A node is skipped when the content hashes of its inputs,
+its command and the content of its outputs match the last successful run, so pulling a new
+subject through only runs that subject's nodes (plus combine, which itself only combines
+runs that changed). An upstream node that reruns but writes identical outputs does not
+invalidate anything downstream. Independent nodes (e.g. different subjects) run in parallel.
+
+Workflow:
+1. `build_pipeline` declares the nodes of the selected stages and subjects; `connect_nodes`
+   links each input to the node that outputs it and checks the artifact types.
+2. `run_pipeline` starts every node whose upstream nodes are done (up to `--jobs` at a time),
+   checking its cache key first; each node's output goes to `<state_dir>/logs/<node>.log`.
+3. The key and output hashes of successful nodes are saved in `<state_dir>/pipeline_state.json`
+   (file hashes are cached by size and modification time).
+
+Nodes (scripts are run as modules, from the scripts folder or the installed package):
+- wrangle/<subject>: time_series_data_wrangling.py -> combined OTU table, updated metadata
+- silva/<subject>: silva_taxonomy_mapping.py -> feature table and taxonomy .qza
+- actual/<subject>: calculate_actual_growth_rates_genus_clr.py -> actual CLR growth rates
+- simulate/<run>: simulate_growth_rates_edited.py -> growth .zip (runs sharing a pickled model
+  folder wait for the first one, as in sweep_scheduler.py)
+- combine: combine_sim_and_real_data.py over a runs manifest of all simulated runs
+
+Usage:
+    python pipeline.py --subject_ids F01 M01 M02 --input_biom ../data/otu_table.biom \
+        --metadata ../data/metadata.csv --rep_seq ../data/uclust_casey_rep_set.qza \
+        --classifier ../data/silva-138-99-nb-classifier.qza \
+        --model_names agora201_refseq216_genus_1.qza --diets western_diet_gut_agora.qza \
+        --tradeoffs 0.3 0.5 0.8 --solver gurobi --jobs 4 --threads 10
+    python pipeline.py ... --stages actual simulate --dry_run
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+from collections import namedtuple
+
+from diet_registry import file_sha256
+from sweep_scheduler import build_job_matrix, job_argv, pinned_env
+
+STAGES = ["wrangle", "silva", "actual", "simulate", "combine"]
+DEFAULT_STATE_DIR = "../data/.pipeline/"
+STATE_FILE = "pipeline_state.json"
+
+# a typed path: the type of an input must match the type it was output as
+Artifact = namedtuple("Artifact", ["kind", "path"])
+
+
+def subject_paths(subject_id, dirs):
+    """
+    Get the typed artifacts of one subject, following the folder conventions of the scripts.
+    """
+    return {"otu_table": Artifact("otu_table", os.path.join(dirs["combined_dir"], f"{subject_id}_combined_otu_qiime2.tsv")),
+            "metadata": Artifact("metadata", os.path.join(dirs["combined_dir"], f"{subject_id}_updated_metadata.csv")),
+            "feature_table": Artifact("feature_table", os.path.join(dirs["qiime_dir"], f"{subject_id}_feature_table.qza")),
+            "taxonomy": Artifact("taxonomy", os.path.join(dirs["qiime_dir"], f"{subject_id}_taxonomy.qza")),
+            "actual_rates": Artifact("actual_rates", os.path.join(dirs["actual_dir"],
+                                                                  f"{subject_id}_clr_actual_growth_rates_by_genus.csv"))}
+
+
+def write_runs_manifest(jobs, runs_manifest, write=True):
+    """
+    Write the runs manifest read by combine (only if its content changed).
+
+    Parameters:
+    jobs (pandas.DataFrame): Job matrix from `build_job_matrix`.
+    runs_manifest (str): Path of the manifest.
+    write (bool): Only check whether the content changed, without writing (for dry runs).
+
+    Returns:
+    bool: True if the manifest is missing or its content changed.
+    """
+    runs = jobs.rename(columns={"diet": "diet_artifact", "diet_short": "diet", "growth_out_fp": "growth_fp"})
+    content = runs[["subject_id", "model_db", "solver", "diet", "tradeoff", "growth_fp"]].to_csv(index=False)
+    if os.path.exists(runs_manifest):
+        with open(runs_manifest) as fh:
+            if fh.read() == content:
+                return False
+    if write:
+        os.makedirs(os.path.dirname(runs_manifest), exist_ok=True)
+        with open(runs_manifest, "w") as fh:
+            fh.write(content)
+    return True
+
+
+def build_pipeline(subject_ids, stages, dirs, input_biom=None, metadata=None, rep_seq=None, classifier=None,
+                   model_names=(), diets=(), tradeoffs=(), solver="gurobi", threads=1, extra_args=()):
+    """
+    Declare the nodes of the selected stages.
+
+    Parameters:
+    subject_ids (list): Subjects to pull through the pipeline.
+    stages (list): Stages to include (see STAGES); inputs of left-out stages must already exist.
+    dirs (dict): Folders: intermediate_dir, combined_dir, qiime_dir, actual_dir, model_dir, diet_dir,
+        pickled_dir, growth_dir, added_metab_dir, combined_out_dir, state_dir.
+    input_biom, metadata (str): Inputs of the wrangling stage.
+    rep_seq, classifier (str): Inputs of the SILVA stage.
+    model_names, diets, tradeoffs, solver: Simulation sweep (as in sweep_scheduler.py).
+    threads (int): Threads per simulation and for combine.
+    extra_args (list): Extra simulate_growth_rates_edited.py arguments.
+
+    Returns:
+    list: Nodes (dicts with name, stage, argv, inputs, outputs and after, plus `prepare` for
+    nodes whose inputs are written just before they run).
+    """
+    python = sys.executable
+    nodes = []
+    for subject_id in subject_ids:
+        paths = subject_paths(subject_id, dirs)
+        if "wrangle" in stages:
+            nodes.append({"name": f"wrangle/{subject_id}", "stage": "wrangle",
+                          "argv": [python, "-m", "time_series_data_wrangling", "-i", input_biom, "-m", metadata,
+                                   "-n", dirs["intermediate_dir"], "-o", dirs["combined_dir"], "-l", subject_id],
+                          "inputs": [Artifact("biom", input_biom), Artifact("sample_metadata", metadata)],
+                          "outputs": [paths["otu_table"], paths["metadata"]]})
+        if "silva" in stages:
+            nodes.append({"name": f"silva/{subject_id}", "stage": "silva",
+                          "argv": [python, "-m", "silva_taxonomy_mapping", "-i", dirs["combined_dir"], "-r", rep_seq,
+                                   "-c", classifier, "-o", dirs["qiime_dir"], "-l", subject_id],
+                          "inputs": [paths["otu_table"], Artifact("rep_seq", rep_seq),
+                                     Artifact("classifier", classifier)],
+                          "outputs": [paths["feature_table"], paths["taxonomy"]]})
+        if "actual" in stages:
+            nodes.append({"name": f"actual/{subject_id}", "stage": "actual",
+                          "argv": [python, "-m", "calculate_actual_growth_rates_genus_clr",
+                                   "--feature_tables_dir", dirs["qiime_dir"], "--taxonomy_dir", dirs["qiime_dir"],
+                                   "--output_dir", dirs["actual_dir"], "--subject_ids", subject_id],
+                          "inputs": [paths["feature_table"], paths["taxonomy"]],
+                          "outputs": [paths["actual_rates"]]})
+
+    if "simulate" in stages or "combine" in stages:
+        jobs = build_job_matrix(subject_ids, model_names, diets, tradeoffs, solver, dirs["pickled_dir"],
+                                dirs["diet_dir"], dirs["growth_dir"], dirs["added_metab_dir"])
+    if "simulate" in stages:
+        first_build = {}
+        sim_args = ["--qza_dir", dirs["qiime_dir"], "--model_dir", dirs["model_dir"]] + list(extra_args)
+        for job in jobs.to_dict("records"):
+            paths = subject_paths(job["subject_id"], dirs)
+            name = f"simulate/{job['job_id']}"
+            # the first run of a pickled model folder builds the models the others reuse
+            after = [first_build[job["pickled_gsmm_out"]]] if job["pickled_gsmm_out"] in first_build else []
+            first_build.setdefault(job["pickled_gsmm_out"], name)
+            nodes.append({"name": name, "stage": "simulate", "argv": job_argv(job, threads, sim_args),
+                          "inputs": [paths["feature_table"], paths["taxonomy"],
+                                     Artifact("model_db", os.path.join(dirs["model_dir"], job["model_name"])),
+                                     Artifact("diet", job["diet_fp"])],
+                          "outputs": [Artifact("growth", job["growth_out_fp"])],
+                          "after": after})
+    if "combine" in stages:
+        runs_manifest = os.path.join(dirs["state_dir"], "runs_manifest.csv")
+        nodes.append({"name": "combine", "stage": "combine",
+                      "argv": [python, "-m", "combine_sim_and_real_data", "--runs_manifest", runs_manifest,
+                               "--actual_dir", dirs["actual_dir"], "--out_dir", dirs["combined_out_dir"],
+                               "--threads", str(threads)],
+                      "inputs": ([Artifact("runs_manifest", runs_manifest)] +
+                                 [Artifact("growth", fp) for fp in jobs["growth_out_fp"]] +
+                                 [subject_paths(s, dirs)["actual_rates"] for s in subject_ids]),
+                      "outputs": [Artifact("combined", os.path.join(dirs["combined_out_dir"], "_runs.csv"))],
+                      "prepare": lambda write: write_runs_manifest(jobs, runs_manifest, write)})
+    return nodes
+
+
+def connect_nodes(nodes):
+    """
+    Link every input to the node that outputs it, check the artifact types and order the nodes.
+
+    Returns:
+    list: The nodes in topological order, each with the names of its upstream nodes in `deps`.
+    """
+    producers = {}
+    for node in nodes:
+        for artifact in node["outputs"]:
+            path = os.path.normpath(artifact.path)
+            if path in producers:
+                raise ValueError(f"{artifact.path} is output by both {producers[path][0]['name']} and {node['name']}")
+            producers[path] = (node, artifact.kind)
+
+    for node in nodes:
+        deps = set(node.get("after", []))
+        for artifact in node["inputs"]:
+            producer = producers.get(os.path.normpath(artifact.path))
+            if producer is None:
+                continue
+            if producer[1] != artifact.kind:
+                raise ValueError(f"{node['name']} reads {artifact.path} as {artifact.kind}, "
+                                 f"but {producer[0]['name']} outputs it as {producer[1]}")
+            deps.add(producer[0]["name"])
+        node["deps"] = sorted(deps)
+
+    ordered, done = [], set()
+    remaining = list(nodes)
+    while remaining:
+        ready = [node for node in remaining if set(node["deps"]) <= done]
+        if not ready:
+            raise ValueError(f"Cycle between {', '.join(node['name'] for node in remaining)}")
+        for node in ready:
+            ordered.append(node)
+            done.add(node["name"])
+            remaining.remove(node)
+    return ordered
+
+
+def load_state(state_fp):
+    """
+    Load the pipeline state (node keys and output hashes, cached file hashes).
+    """
+    if not os.path.exists(state_fp):
+        return {"nodes": {}, "files": {}}
+    with open(state_fp) as fh:
+        return json.load(fh)
+
+
+def save_state(state, state_fp):
+    """
+    Save the pipeline state atomically.
+    """
+    os.makedirs(os.path.dirname(state_fp) or ".", exist_ok=True)
+    tmp_fp = f"{state_fp}.tmp"
+    with open(tmp_fp, "w") as fh:
+        json.dump(state, fh, indent=1, sort_keys=True)
+    os.replace(tmp_fp, state_fp)
+
+
+def content_hash(path, state):
+    """
+    Get the sha256 of a file, reusing the cached hash while its size and modification time are unchanged.
+
+    Returns:
+    str or None: The hash, or None if the file does not exist.
+    """
+    path = os.path.abspath(path)
+    if not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+    cached = state["files"].get(path)
+    if cached is not None and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return cached[2]
+    sha256 = file_sha256(path)
+    state["files"][path] = [stat.st_size, stat.st_mtime_ns, sha256]
+    return sha256
+
+
+def node_key(node, state):
+    """
+    Hash a node's command with the content of its inputs.
+
+    Returns:
+    str or None: The key, or None if an input does not exist.
+    """
+    inputs = []
+    for artifact in node["inputs"]:
+        sha256 = content_hash(artifact.path, state)
+        if sha256 is None:
+            return None
+        inputs.append([artifact.kind, os.path.normpath(artifact.path), sha256])
+    canonical = json.dumps({"argv": node["argv"][1:], "inputs": inputs}, sort_keys=True)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def is_up_to_date(node, key, state):
+    """
+    Check that a node last succeeded with the same key and its outputs are unchanged since.
+    """
+    record = state["nodes"].get(node["name"])
+    if record is None or key is None or record["key"] != key:
+        return False
+    return all(content_hash(artifact.path, state) == record["outputs"].get(os.path.normpath(artifact.path))
+               for artifact in node["outputs"])
+
+
+def run_pipeline(nodes, state_dir=DEFAULT_STATE_DIR, jobs=1, force=False, dry_run=False, poll=1.0):
+    """
+    Run the out-of-date nodes, up to `jobs` at a time, as soon as their upstream nodes are done.
+
+    Parameters:
+    nodes (list): Nodes from `connect_nodes`.
+    state_dir (str): Folder for the pipeline state and node logs.
+    jobs (int): Maximum number of nodes running at once.
+    force (bool): Run all nodes, even if they are up to date.
+    dry_run (bool): Only print which nodes would run.
+    poll (float): Seconds between checks of the running nodes.
+
+    Returns:
+    dict: Node name -> "up to date", "ran" (or "would run"), "failed" or "blocked".
+    """
+    state_fp = os.path.join(state_dir, STATE_FILE)
+    state = load_state(state_fp)
+    log_dir = os.path.join(state_dir, "logs")
+    if not dry_run:
+        os.makedirs(log_dir, exist_ok=True)
+    env = pinned_env(1)
+    status = {}
+    pending = list(nodes)
+    running = {}
+    while pending or running:
+        for node in list(pending):
+            if len(running) >= jobs:
+                break
+            dep_status = [status.get(dep) for dep in node["deps"]]
+            if any(s in ("failed", "blocked") for s in dep_status):
+                pending.remove(node)
+                status[node["name"]] = "blocked"
+                print(f"Blocked: {node['name']} (upstream failed)")
+                continue
+            if not all(s in ("up to date", "ran", "would run") for s in dep_status):
+                continue
+            pending.remove(node)
+            # generated inputs (the runs manifest) are only written once the node is due, never in a dry run
+            changed = node["prepare"](not dry_run) if "prepare" in node else False
+            key = None if "would run" in dep_status or (dry_run and changed) else node_key(node, state)
+            if not force and is_up_to_date(node, key, state):
+                status[node["name"]] = "up to date"
+                continue
+            if dry_run:
+                status[node["name"]] = "would run"
+                print(f"Would run {node['name']}: {' '.join(node['argv'][2:])}")
+                continue
+            log_fp = os.path.join(log_dir, node["name"].replace("/", "__") + ".log")
+            print(f"Starting {node['name']} (log: {log_fp})")
+            with open(log_fp, "w") as log:
+                proc = subprocess.Popen(node["argv"], stdout=log, stderr=subprocess.STDOUT, env=env)
+            running[proc] = (node, key, time.time())
+
+        if not running:
+            continue
+        time.sleep(poll)
+        for proc, (node, key, start) in list(running.items()):
+            if proc.poll() is None:
+                continue
+            del running[proc]
+            outputs = {os.path.normpath(a.path): content_hash(a.path, state) for a in node["outputs"]}
+            missing = [path for path, sha256 in outputs.items() if sha256 is None]
+            if proc.returncode != 0 or missing:
+                status[node["name"]] = "failed"
+                reason = f"exit code {proc.returncode}" if proc.returncode != 0 else f"missing {', '.join(missing)}"
+                print(f"FAILED: {node['name']} ({reason}) after {time.time() - start:.0f}s")
+                continue
+            status[node["name"]] = "ran"
+            state["nodes"][node["name"]] = {"key": key or node_key(node, state), "outputs": outputs,
+                                            "finished": time.time()}
+            save_state(state, state_fp)
+            print(f"Completed: {node['name']} in {time.time() - start:.0f}s")
+
+    if not dry_run:
+        save_state(state, state_fp)
+    counts = {s: list(status.values()).count(s) for s in sorted(set(status.values()))}
+    print("Pipeline: " + ", ".join(f"{n} {s}" for s, n in counts.items()))
+    return status
+
+
+def main(subject_ids, stages, dirs, input_biom, metadata, rep_seq, classifier,
+         model_names, diets, tradeoffs, solver, threads, jobs, extra_args, force, dry_run):
+    """
+    Declare, connect and run the pipeline.
+    """
+    nodes = build_pipeline(subject_ids, stages, dirs, input_biom, metadata, rep_seq, classifier,
+                           model_names, diets, tradeoffs, solver, threads, extra_args)
+    nodes = connect_nodes(nodes)
+    print(f"Pipeline with {len(nodes)} nodes for {len(subject_ids)} subject(s), stages: {', '.join(stages)}")
+    status = run_pipeline(nodes, dirs["state_dir"], jobs, force, dry_run)
+    if "failed" in status.values():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the pipeline stages as a DAG, skipping up-to-date nodes")
+    parser.add_argument("--subject_ids", required=True, nargs="+", help="Subjects to pull through the pipeline")
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES,
+                        help="Stages to run (inputs of the other stages must exist)")
+    parser.add_argument("--input_biom", default=None, help="BIOM table for the wrangling stage")
+    parser.add_argument("--metadata", default=None, help="Metadata CSV for the wrangling stage")
+    parser.add_argument("--rep_seq", default=None, help="Representative sequences .qza for the SILVA stage")
+    parser.add_argument("--classifier", default=None, help="SILVA classifier .qza for the SILVA stage")
+    parser.add_argument("--model_names", nargs="+", default=[], help="Model database .qza files in --model_dir")
+    parser.add_argument("--diets", nargs="+", default=[], help="Diet .qza files in --diet_dir")
+    parser.add_argument("--tradeoffs", nargs="+", type=float, default=[], help="Cooperative tradeoff values")
+    parser.add_argument("--solver", default="gurobi", help="Specify solver (e.g. osqp, gurobi, cplex)")
+    parser.add_argument("--threads", type=int, default=1, help="Threads per simulation and for combine")
+    parser.add_argument("--jobs", type=int, default=1, help="Nodes running at once")
+    parser.add_argument("--intermediate_dir", default="../data/interpolated_bioms/", help="Wrangling intermediate outputs")
+    parser.add_argument("--combined_dir", default="../data/combined_meta_and_otu_outputs/",
+                        help="Wrangled OTU tables and metadata")
+    parser.add_argument("--qiime_dir", default="../data/qiime_outputs/", help="Feature table and taxonomy .qza files")
+    parser.add_argument("--actual_dir", default="../data/actual_growth_rates_genus_clr/", help="Actual CLR growth rates")
+    parser.add_argument("--model_dir", default="../data/models/", help="Model database folder")
+    parser.add_argument("--diet_dir", default="../data/diets/", help="Diet folder")
+    parser.add_argument("--pickled_dir", default="../data/pickled_models/", help="Parent folder for pickled models")
+    parser.add_argument("--growth_dir", default="../data/growth_rates/", help="Folder for growth_*.zip outputs")
+    parser.add_argument("--added_metab_dir", default="../data/added_metabolites/", help="Added metabolites folder")
+    parser.add_argument("--combined_out_dir", default="../data/combined_sim_real_data_50/", help="Combined Parquet dataset")
+    parser.add_argument("--state_dir", default=DEFAULT_STATE_DIR, help="Pipeline state, runs manifest and node logs")
+    parser.add_argument("--force", action="store_true", help="Run all nodes, even if up to date")
+    parser.add_argument("--dry_run", action="store_true", help="Only print the nodes that would run")
+    args, extra_args = parser.parse_known_args()
+
+    # the wrangling script joins folders and file names without a separator
+    dirs = {name: os.path.join(getattr(args, name), "") for name in
+            ["intermediate_dir", "combined_dir", "qiime_dir", "actual_dir", "model_dir", "diet_dir", "pickled_dir",
+             "growth_dir", "added_metab_dir", "combined_out_dir", "state_dir"]}
+    for stage, required in (("wrangle", ["input_biom", "metadata"]), ("silva", ["rep_seq", "classifier"]),
+                            ("simulate", ["model_names", "diets", "tradeoffs"]),
+                            ("combine", ["model_names", "diets", "tradeoffs"])):
+        if stage in args.stages and not all(getattr(args, arg) for arg in required):
+            parser.error(f"the {stage} stage requires --{' and --'.join(required)}")
+
+    main(args.subject_ids, args.stages, dirs, args.input_biom, args.metadata, args.rep_seq, args.classifier,
+         args.model_names, args.diets, args.tradeoffs, args.solver, args.threads, args.jobs, extra_args,
+         args.force, args.dry_run)
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+SQL Query Index over Runs and Outputs
+-------------------------------------
+
+Purpose:
+Questions like "all gurobi runs on agora201 with vmhfiber where Akkermansia grows faster
+than 0.05" used to mean globbing data/growth_rates/ and parsing folder names with
+renaming_script.py-style regexes. This module keeps one SQLite file (no server) with the
+run parameters and outputs in indexed tables, so such questions are one SQL query. Scripts
+register their outputs as they write them, in DEFAULT_INDEX unless run with `--no_query_index`:
+
+- simulate_growth_rates_edited.py: the run's growth rates, the build manifest and the added
+  metabolites (`--query_index`),
+- combine_sim_and_real_data.py: the combined rows of every (re)combined run (`--query_index`),
+- calculate_actual_growth_rates_genus_clr.py: the actual CLR growth rates (`--query_index`).
+
+`scan` registers existing outputs (results store, growth_* folders, actual rates, manifests,
+added metabolite CSVs) once.
+
+Tables (indexed on subject_id, taxon, sample_id and the run parameters):
+- runs: run_id, subject_id, model_db, solver, diet, tradeoff, source, n_samples, n_taxa, registered
+- growth_rates: run_id, subject_id, taxon, sample_id, growth_rate, abundance
+- actual_rates: subject_id, taxon, sample_id, clr_change, source
+- manifests: model_folder, subject_id, sample_id, file, reactions, metabolites, found_taxa,
+  total_taxa, found_fraction, found_abundance_fraction
+- added_metabolites: subject_id, model, diet, reaction, metabolite, flux, source
+- combined: run_id, subject_id, taxon, sample_id, growth_rate, clr_change_abund, prevalence,
+  date_vs_onset_illness, prevalence_threshold
+
+Taxa keep the names of their source (e.g. "g__Akkermansia" in growth_rates and actual_rates,
+"Akkermansia" in combined). Registering a run, subject or file again replaces its rows.
+
+Usage:
+    python query_index.py scan --index_db ../data/query_index.sqlite --store_dir ../data/results_store/ \
+        --growth_dir ../data/growth_rates/ --actual_dir ../data/actual_growth_rates_genus_clr/ \
+        --pickled_dir ../data/pickled_models/ --added_metab_dir ../data/added_metabolites/
+    python query_index.py query --index_db ../data/query_index.sqlite \
+        "SELECT r.*, g.sample_id, g.growth_rate FROM growth_rates g JOIN runs r USING (run_id)
+         WHERE r.solver = 'gurobi' AND r.model_db = 'agora201' AND r.diet = 'vmhfiber'
+         AND g.taxon = 'g__Akkermansia' AND g.growth_rate > 0.05"
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import re
+import glob
+import time
+import sqlite3
+import argparse
+from pathlib import Path
+import pandas as pd
+
+DEFAULT_INDEX = "../data/query_index.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    subject_id TEXT,
+    model_db TEXT,
+    solver TEXT,
+    diet TEXT,
+    tradeoff REAL,
+    source TEXT,
+    n_samples INTEGER,
+    n_taxa INTEGER,
+    registered REAL
+);
+CREATE INDEX IF NOT EXISTS runs_params ON runs (subject_id, model_db, solver, diet, tradeoff);
+CREATE INDEX IF NOT EXISTS runs_diet ON runs (diet, tradeoff);
+CREATE TABLE IF NOT EXISTS growth_rates (
+    run_id TEXT,
+    subject_id TEXT,
+    taxon TEXT,
+    sample_id INTEGER,
+    growth_rate REAL,
+    abundance REAL
+);
+CREATE INDEX IF NOT EXISTS growth_rates_run ON growth_rates (run_id);
+CREATE INDEX IF NOT EXISTS growth_rates_taxon ON growth_rates (taxon, growth_rate);
+CREATE INDEX IF NOT EXISTS growth_rates_subject ON growth_rates (subject_id, taxon, sample_id);
+CREATE TABLE IF NOT EXISTS actual_rates (
+    subject_id TEXT,
+    taxon TEXT,
+    sample_id INTEGER,
+    clr_change REAL,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS actual_rates_subject ON actual_rates (subject_id, taxon, sample_id);
+CREATE TABLE IF NOT EXISTS manifests (
+    model_folder TEXT,
+    subject_id TEXT,
+    sample_id TEXT,
+    file TEXT,
+    reactions INTEGER,
+    metabolites INTEGER,
+    found_taxa REAL,
+    total_taxa REAL,
+    found_fraction REAL,
+    found_abundance_fraction REAL
+);
+CREATE INDEX IF NOT EXISTS manifests_folder ON manifests (model_folder);
+CREATE INDEX IF NOT EXISTS manifests_subject ON manifests (subject_id, sample_id);
+CREATE TABLE IF NOT EXISTS added_metabolites (
+    subject_id TEXT,
+    model TEXT,
+    diet TEXT,
+    reaction TEXT,
+    metabolite TEXT,
+    flux REAL,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS added_metabolites_params ON added_metabolites (subject_id, model, diet);
+CREATE INDEX IF NOT EXISTS added_metabolites_source ON added_metabolites (source);
+CREATE TABLE IF NOT EXISTS combined (
+    run_id TEXT,
+    subject_id TEXT,
+    taxon TEXT,
+    sample_id INTEGER,
+    growth_rate REAL,
+    clr_change_abund REAL,
+    prevalence REAL,
+    date_vs_onset_illness TEXT,
+    prevalence_threshold REAL
+);
+CREATE INDEX IF NOT EXISTS combined_run ON combined (run_id);
+CREATE INDEX IF NOT EXISTS combined_subject ON combined (subject_id, taxon, sample_id);
+"""
+
+MANIFEST_COLUMNS = ["sample_id", "file", "reactions", "metabolites", "found_taxa", "total_taxa",
+                    "found_fraction", "found_abundance_fraction"]
+COMBINED_COLUMNS = ["taxon", "sample_id", "growth_rate", "clr_change_abund", "prevalence", "date_vs_onset_illness"]
+# added_metabolites_<subject>_<model stem>_<diet shorthand>.csv (model stems contain underscores)
+ADDED_METAB_NAME = re.compile(r"^added_metabolites_(?P<subject_id>[^_]+)_(?P<model>.+)_(?P<diet>[^_]+)$")
+
+
+def connect(index_db):
+    """
+    Open the index (creating the file and tables if needed).
+
+    Writers from several processes wait for each other's transactions (up to 5 minutes).
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(index_db)), exist_ok=True)
+    con = sqlite3.connect(index_db, timeout=300)
+    con.executescript(SCHEMA)
+    return con
+
+
+def replace_rows(index_db, table, rows, where, params):
+    """
+    Replace the rows of a table that match `where` with new rows, in one transaction.
+    """
+    con = connect(index_db)
+    with con:
+        con.execute(f"DELETE FROM {table} WHERE {where}", params)
+        rows.to_sql(table, con, if_exists="append", index=False)
+    con.close()
+
+
+def run_id(subject_id, model_db, solver, diet, tradeoff):
+    """
+    Get the ID of a run, e.g. "F01/agora201/gurobi/wd/0.5".
+    """
+    return f"{subject_id}/{model_db}/{solver}/{diet}/{float(tradeoff)}"
+
+
+def register_run(index_db, growth_rates, subject_id, model_db, solver, diet, tradeoff, source=None):
+    """
+    Register the growth rates of a run (replacing earlier rows of the same run).
+
+    Parameters:
+    index_db (str): Path to the SQLite index.
+    growth_rates (pandas.DataFrame): growth_rates table of the run (taxon, sample_id, growth_rate, abundance).
+    subject_id, model_db, solver, diet (str): Run labels (e.g. F01, agora201, gurobi, wd).
+    tradeoff (float): Cooperative tradeoff of the run.
+    source (str, optional): Where the run is stored (results store, .zip or folder).
+
+    Returns:
+    str: The run_id.
+    """
+    rid = run_id(subject_id, model_db, solver, diet, tradeoff)
+    rows = growth_rates[["taxon", "sample_id", "growth_rate", "abundance"]].copy()
+    rows["sample_id"] = pd.to_numeric(rows["sample_id"]).astype("int64")
+    rows.insert(0, "subject_id", subject_id)
+    rows.insert(0, "run_id", rid)
+    run = pd.DataFrame([{"run_id": rid, "subject_id": subject_id, "model_db": model_db, "solver": solver,
+                         "diet": diet, "tradeoff": float(tradeoff), "source": source,
+                         "n_samples": rows["sample_id"].nunique(), "n_taxa": rows["taxon"].nunique(),
+                         "registered": time.time()}])
+    replace_rows(index_db, "growth_rates", rows, "run_id = ?", (rid,))
+    replace_rows(index_db, "runs", run, "run_id = ?", (rid,))
+    return rid
+
+
+def register_actual_rates(index_db, subject_id, actual_fp):
+    """
+    Register a subject's actual CLR growth rates (genus x sample CSV) in long format.
+    """
+    wide = pd.read_csv(actual_fp)
+    rows = wide.melt(id_vars="Genus", var_name="sample_id", value_name="clr_change")
+    rows = rows.rename(columns={"Genus": "taxon"})
+    rows["sample_id"] = pd.to_numeric(rows["sample_id"]).astype("int64")
+    rows.insert(0, "subject_id", subject_id)
+    rows["source"] = str(actual_fp)
+    replace_rows(index_db, "actual_rates", rows, "subject_id = ?", (subject_id,))
+
+
+def register_manifest(index_db, manifest_fp, subject_id=None):
+    """
+    Register a build() manifest; the subject defaults to the pickled_<subject>_... folder name.
+    """
+    model_folder = os.path.dirname(os.path.abspath(manifest_fp))
+    if subject_id is None:
+        parts = Path(model_folder).name.split("_")
+        subject_id = parts[1] if parts[0] == "pickled" and len(parts) > 1 else None
+    rows = pd.read_csv(manifest_fp).reindex(columns=MANIFEST_COLUMNS)
+    rows.insert(0, "subject_id", subject_id)
+    rows.insert(0, "model_folder", model_folder)
+    replace_rows(index_db, "manifests", rows, "model_folder = ?", (model_folder,))
+
+
+def register_added_metabolites(index_db, added_metab_fp, subject_id=None, model=None, diet=None):
+    """
+    Register an added metabolites CSV; labels default to those in its file name.
+    """
+    match = ADDED_METAB_NAME.match(Path(added_metab_fp).stem)
+    labels = match.groupdict() if match else {}
+    rows = pd.read_csv(added_metab_fp).reindex(columns=["reaction", "metabolite", "flux"])
+    rows.insert(0, "diet", diet or labels.get("diet"))
+    rows.insert(0, "model", model or labels.get("model"))
+    rows.insert(0, "subject_id", subject_id or labels.get("subject_id"))
+    rows["source"] = os.path.abspath(added_metab_fp)
+    replace_rows(index_db, "added_metabolites", rows, "source = ?", (os.path.abspath(added_metab_fp),))
+
+
+def register_combined(index_db, combined, run, prevalence_threshold):
+    """
+    Register the combined rows of one run (replacing earlier rows of the same run).
+
+    Parameters:
+    index_db (str): Path to the SQLite index.
+    combined (pandas.DataFrame): Output of `combine_run` for the run.
+    run (dict or pandas.Series): subject_id, model_db, solver, diet and tradeoff of the run.
+    prevalence_threshold (float): Prevalence threshold used to combine the run.
+    """
+    rid = run_id(run["subject_id"], run["model_db"], run["solver"], run["diet"], run["tradeoff"])
+    rows = combined.reindex(columns=COMBINED_COLUMNS)
+    rows.insert(0, "subject_id", run["subject_id"])
+    rows.insert(0, "run_id", rid)
+    rows["prevalence_threshold"] = prevalence_threshold
+    replace_rows(index_db, "combined", rows, "run_id = ?", (rid,))
+
+
+def query(index_db, sql, params=()):
+    """
+    Run a SQL query on the index and return the result as a DataFrame.
+    """
+    con = connect(index_db)
+    result = pd.read_sql_query(sql, con, params=params)
+    con.close()
+    return result
+
+
+def scan(index_db, store_dir=None, growth_dir=None, actual_dir=None, pickled_dir=None, added_metab_dir=None):
+    """
+    Register existing outputs in the index.
+
+    Parameters:
+    index_db (str): Path to the SQLite index.
+    store_dir (str, optional): Results store (all runs).
+    growth_dir (str, optional): Folder with legacy growth_* folders/zips (runs not in the store).
+    actual_dir (str, optional): Folder with <subject>_clr_actual_growth_rates_by_genus.csv files.
+    pickled_dir (str, optional): Folder searched recursively for manifest.csv files.
+    added_metab_dir (str, optional): Folder with added_metabolites_*.csv files.
+    """
+    counts = {}
+    registered = set()
+    if store_dir is not None:
+        from results_store import list_runs, read_table, PARTITION_COLUMNS
+        for _, run in list_runs(store_dir).iterrows():
+            params = {col: run[col] for col in PARTITION_COLUMNS}
+            growth = read_table(store_dir, "growth_rates", columns=["taxon", "sample_id", "growth_rate", "abundance"],
+                                **params)
+            registered.add(register_run(index_db, growth, source=os.path.abspath(store_dir), **params))
+        counts["store runs"] = len(registered)
+    if growth_dir is not None:
+        from results_store import LEGACY_NAME, load_legacy_run
+        n_legacy = 0
+        for run_fp in sorted(glob.glob(os.path.join(growth_dir, "growth_*"))):
+            match = LEGACY_NAME.match(Path(run_fp).name.replace(".zip", ""))
+            if match is None:
+                continue
+            params = match.groupdict()
+            params["tradeoff"] = int(params["tradeoff"]) / 10
+            if run_id(**params) in registered:
+                continue
+            tables = load_legacy_run(run_fp)
+            if "growth_rates" in tables:
+                registered.add(register_run(index_db, tables["growth_rates"], source=os.path.abspath(run_fp), **params))
+                n_legacy += 1
+        counts["legacy runs"] = n_legacy
+    if actual_dir is not None:
+        actual_fps = sorted(glob.glob(os.path.join(actual_dir, "*_clr_actual_growth_rates_by_genus.csv")))
+        for actual_fp in actual_fps:
+            register_actual_rates(index_db, Path(actual_fp).name.split("_")[0], actual_fp)
+        counts["actual rate tables"] = len(actual_fps)
+    if pickled_dir is not None:
+        manifest_fps = sorted(glob.glob(os.path.join(pickled_dir, "**", "manifest.csv"), recursive=True))
+        for manifest_fp in manifest_fps:
+            register_manifest(index_db, manifest_fp)
+        counts["manifests"] = len(manifest_fps)
+    if added_metab_dir is not None:
+        added_fps = sorted(glob.glob(os.path.join(added_metab_dir, "added_metabolites_*.csv")))
+        for added_fp in added_fps:
+            register_added_metabolites(index_db, added_fp)
+        counts["added metabolite CSVs"] = len(added_fps)
+    print(f"Registered {', '.join(f'{n} {what}' for what, n in counts.items())} in {index_db}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite query index over runs and outputs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scan_parser = subparsers.add_parser("scan", help="Register existing outputs")
+    scan_parser.add_argument("--index_db", default=DEFAULT_INDEX, help="Path to the SQLite index")
+    scan_parser.add_argument("--store_dir", default=None, help="Results store")
+    scan_parser.add_argument("--growth_dir", default=None, help="Folder with legacy growth_* results")
+    scan_parser.add_argument("--actual_dir", default=None, help="Folder with actual CLR growth rate CSVs")
+    scan_parser.add_argument("--pickled_dir", default=None, help="Folder searched for manifest.csv files")
+    scan_parser.add_argument("--added_metab_dir", default=None, help="Folder with added_metabolites_*.csv files")
+
+    query_parser = subparsers.add_parser("query", help="Run a SQL query")
+    query_parser.add_argument("sql", help="SQL query (tables: runs, growth_rates, actual_rates, manifests, "
+                                          "added_metabolites, combined)")
+    query_parser.add_argument("--index_db", default=DEFAULT_INDEX, help="Path to the SQLite index")
+    query_parser.add_argument("--out_fp", default=None, help="Save the result as CSV (default: print)")
+    args = parser.parse_args()
+
+    if args.command == "scan":
+        scan(args.index_db, args.store_dir, args.growth_dir, args.actual_dir, args.pickled_dir, args.added_metab_dir)
+    else:
+        result = query(args.index_db, args.sql)
+        if args.out_fp is None:
+            print(result.to_string(index=False))
+        else:
+            result.to_csv(args.out_fp, index=False)
+            print(f"{len(result)} rows saved to {args.out_fp}")
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Partitioned Parquet Store for MICOM Growth Results
+--------------------------------------------------
+
+Purpose:
+Every run used to write `growth_*.zip` with `save_results` and then extract it with
+`unzip_to_folder`, so each result existed twice on disk, and every folder carried its own
+copy of `annotations.csv` (~1,600 rows, identical across tradeoffs). This module writes grow
+output straight into a Parquet dataset partitioned by run parameters, with annotations stored
+once per model database. Readers pass the parameters they want and only the matching
+partitions are opened, instead of globbing and reading every CSV.
+
+Layout:
+    <store>/growth_rates/subject_id=F01/model_db=agora201/solver=gurobi/diet=wd/tradeoff=0.3/<part>.parquet
+    <store>/exchanges/subject_id=F01/model_db=agora201/solver=gurobi/diet=wd/tradeoff=0.3/<part>.parquet
+    <store>/annotations/model_db=agora201/annotations.parquet
+
+Workflow:
+1. simulate_growth_rates_edited.py (`--results_store`) writes every sample as soon as it is
+   solved (`sample_writer`), so memory stays flat and partial runs can already be queried.
+2. `read_table` loads growth rates or exchanges filtered on any partition column.
+3. `import` converts existing growth_* result folders/zips into the store once.
+
+Inputs:
+- `GrowthResults` from `grow()` plus the run parameters, or existing growth_* folders.
+
+Outputs:
+- The partitioned Parquet dataset described above.
+
+Usage:
+    python results_store.py import --growth_dir ../data/growth_rates/ --store_dir ../data/results_store/
+    python results_store.py query --store_dir ../data/results_store/ --subject_id F01 --diet wd \
+        --out_fp F01_wd_growth_rates.csv
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import re
+import glob
+import shutil
+import argparse
+import zipfile
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+PARTITION_COLUMNS = ["subject_id", "model_db", "solver", "diet", "tradeoff"]
+PARTITION_SCHEMA = pa.schema([("subject_id", pa.string()),
+                              ("model_db", pa.string()),
+                              ("solver", pa.string()),
+                              ("diet", pa.string()),
+                              ("tradeoff", pa.float64())])
+RESULT_TABLES = ["growth_rates", "exchanges"]
+# legacy result names, e.g. growth_F01_agora201_gurobi_wd_03
+LEGACY_NAME = re.compile(r"^growth_(?P<subject_id>[^_]+)_(?P<model_db>[^_]+)_(?P<solver>[^_]+)_"
+                         r"(?P<diet>[^_]+)_(?P<tradeoff>\d\d)$")
+
+
+def partition_dir(store_dir, table, params):
+    """
+    Get the folder of one run's partition for a result table.
+
+    Parameters:
+    store_dir (str): Root folder of the store.
+    table (str): "growth_rates" or "exchanges".
+    params (dict): subject_id, model_db, solver, diet and tradeoff of the run.
+    """
+    parts = [f"{col}={float(params[col]) if col == 'tradeoff' else params[col]}" for col in PARTITION_COLUMNS]
+    return os.path.join(store_dir, table, *parts)
+
+
+def write_parquet_atomic(df, out_fp):
+    """
+    Write a DataFrame to Parquet so readers never see a half-written file.
+    """
+    os.makedirs(os.path.dirname(out_fp), exist_ok=True)
+    # dataset readers skip dot files, so the temporary file is never picked up
+    tmp_fp = os.path.join(os.path.dirname(out_fp), f".{os.path.basename(out_fp)}.tmp-{os.getpid()}")
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_fp)
+    os.replace(tmp_fp, out_fp)
+
+
+def write_annotations(annotations, store_dir, model_db):
+    """
+    Store the metabolite annotations of a model database once (they do not depend on the run).
+    """
+    out_fp = os.path.join(store_dir, "annotations", f"model_db={model_db}", "annotations.parquet")
+    if not os.path.exists(out_fp):
+        write_parquet_atomic(annotations.reset_index(drop=True), out_fp)
+
+
+def write_table(df, store_dir, table, params, part="part-0"):
+    """
+    Write one result table of a run (or one piece of it) into its partition.
+
+    Partition columns are dropped from the data because the folder names carry them (the
+    solver of a fallback attempt is kept per row as `attempt_solver`, see robust_grow.py).
+    """
+    df = df.drop(columns=[c for c in PARTITION_COLUMNS if c in df.columns])
+    write_parquet_atomic(df.reset_index(drop=True), os.path.join(partition_dir(store_dir, table, params), f"{part}.parquet"))
+
+
+def write_results(results, store_dir, subject_id, model_db, solver, diet, tradeoff, part="part-0"):
+    """
+    Write `GrowthResults` of a run to the store.
+
+    Parameters:
+    results (GrowthResults): Output of `grow()`.
+    store_dir (str): Root folder of the store.
+    subject_id, model_db, solver, diet (str): Run labels (e.g. F01, agora201, gurobi, wd).
+    tradeoff (float): Cooperative tradeoff of the run.
+    part (str): File name inside the partition (use one per piece when writing incrementally).
+    """
+    params = {"subject_id": subject_id, "model_db": model_db, "solver": solver, "diet": diet, "tradeoff": tradeoff}
+    write_table(results.growth_rates, store_dir, "growth_rates", params, part)
+    write_table(results.exchanges, store_dir, "exchanges", params, part)
+    write_annotations(results.annotations, store_dir, model_db)
+
+
+def clear_run(store_dir, subject_id, model_db, solver, diet, tradeoff):
+    """
+    Remove the stored results of a run, so a rerun does not leave stale per-sample parts behind.
+    """
+    params = {"subject_id": subject_id, "model_db": model_db, "solver": solver, "diet": diet, "tradeoff": tradeoff}
+    for table in RESULT_TABLES:
+        shutil.rmtree(partition_dir(store_dir, table, params), ignore_errors=True)
+
+
+def sample_writer(store_dir, subject_id, model_db, solver, diet, tradeoff):
+    """
+    Get an `on_result(sample_id, results)` callback that writes each solved sample to the store.
+
+    Every sample becomes its own `part-<sample_id>.parquet` file in the run's partitions, so
+    nothing is held in memory and `read_table` returns the samples solved so far mid-run.
+    Existing results of the run are removed first.
+
+    Parameters:
+    store_dir (str): Root folder of the store.
+    subject_id, model_db, solver, diet (str): Run labels (e.g. F01, agora201, gurobi, wd).
+    tradeoff (float): Cooperative tradeoff of the run.
+
+    Returns:
+    callable: Callback for `robust_grow.grow_with_timeouts(on_result=...)`.
+    """
+    clear_run(store_dir, subject_id, model_db, solver, diet, tradeoff)
+
+    def on_result(sample_id, results):
+        write_results(results, store_dir, subject_id, model_db, solver, diet, tradeoff,
+                      part=f"part-{sample_id}")
+    return on_result
+
+
+def read_table(store_dir, table="growth_rates", columns=None, **filters):
+    """
+    Read a result table, opening only the partitions that match the filters.
+
+    Parameters:
+    store_dir (str): Root folder of the store.
+    table (str): "growth_rates" or "exchanges".
+    columns (list, optional): Columns to load (default: all).
+    **filters: Partition values to keep, e.g. subject_id="F01", diet=["wd", "vmhfiber"], tradeoff=0.3.
+
+    Returns:
+    pandas.DataFrame: Matching rows, with the partition columns added.
+    """
+    table_dir = os.path.join(store_dir, table)
+    if not os.path.exists(table_dir):
+        raise ValueError(f"No `{table}` table found in {store_dir}")
+    dataset = ds.dataset(table_dir, format="parquet",
+                         partitioning=ds.partitioning(PARTITION_SCHEMA, flavor="hive"))
+    expression = None
+    for col, value in filters.items():
+        if value is None:
+            continue
+        if col not in PARTITION_COLUMNS:
+            raise ValueError(f"Can only filter on partition columns ({', '.join(PARTITION_COLUMNS)}), not `{col}`")
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        values = [float(v) for v in values] if col == "tradeoff" else [str(v) for v in values]
+        condition = ds.field(col).isin(values)
+        expression = condition if expression is None else expression & condition
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def read_annotations(store_dir, model_db):
+    """
+    Read the metabolite annotations of a model database.
+    """
+    return pd.read_parquet(os.path.join(store_dir, "annotations", f"model_db={model_db}", "annotations.parquet"))
+
+
+def table_signature(store_dir, table, params):
+    """
+    Get a signature of one run's files in a table that changes whenever the run is rewritten.
+
+    Returns:
+    str: "<number of files>:<total size>:<latest mtime in ns>" ("0:0:0" if the run has no files).
+    """
+    files = glob.glob(os.path.join(partition_dir(store_dir, table, params), "*.parquet"))
+    return file_signature(files)
+
+
+def file_signature(files):
+    """
+    Get the signature of a list of files (see `table_signature`).
+    """
+    stats = [os.stat(f) for f in files]
+    if not stats:
+        return "0:0:0"
+    return f"{len(stats)}:{sum(s.st_size for s in stats)}:{max(s.st_mtime_ns for s in stats)}"
+
+
+def list_runs(store_dir, table="growth_rates"):
+    """
+    List the runs (unique partition values) of a table in the store without reading any data.
+    """
+    table_dir = os.path.join(store_dir, table)
+    dataset = ds.dataset(table_dir, format="parquet",
+                         partitioning=ds.partitioning(PARTITION_SCHEMA, flavor="hive"))
+    runs = [ds.get_partition_keys(fragment.partition_expression) for fragment in dataset.get_fragments()]
+    return pd.DataFrame(runs, columns=PARTITION_COLUMNS).drop_duplicates().reset_index(drop=True)
+
+
+def load_legacy_run(run_fp):
+    """
+    Load the growth rates, exchanges and annotations of a growth_* folder or .zip.
+    """
+    tables = {}
+    if run_fp.endswith(".zip"):
+        with zipfile.ZipFile(run_fp) as zf:
+            names = zf.namelist()
+            for table in RESULT_TABLES + ["annotations"]:
+                if f"{table}.csv" in names:
+                    with zf.open(f"{table}.csv") as fh:
+                        tables[table] = pd.read_csv(fh)
+    else:
+        for table in RESULT_TABLES + ["annotations"]:
+            table_fp = os.path.join(run_fp, f"{table}.csv")
+            if os.path.exists(table_fp):
+                tables[table] = pd.read_csv(table_fp)
+    return tables
+
+
+def import_growth_folders(growth_dir, store_dir):
+    """
+    Convert existing growth_* folders (or .zip files where there is no folder) into the store.
+    """
+    runs = {}
+    for run_fp in sorted(glob.glob(os.path.join(growth_dir, "growth_*"))):
+        name = Path(run_fp).name.replace(".zip", "")
+        if name not in runs or os.path.isdir(run_fp):
+            runs[name] = run_fp
+
+    n_imported = 0
+    for name, run_fp in runs.items():
+        match = LEGACY_NAME.match(name)
+        if match is None:
+            print(f"Skipping {run_fp}: name does not follow growth_<subject>_<model_db>_<solver>_<diet>_<tradeoff>")
+            continue
+        params = match.groupdict()
+        params["tradeoff"] = int(params["tradeoff"]) / 10
+        tables = load_legacy_run(run_fp)
+        for table in RESULT_TABLES:
+            if table in tables:
+                write_table(tables[table], store_dir, table, params)
+        if "annotations" in tables:
+            write_annotations(tables["annotations"], store_dir, params["model_db"])
+        n_imported += 1
+    print(f"Imported {n_imported} runs from {growth_dir} into {store_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partitioned Parquet store for MICOM growth results")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Convert existing growth_* folders into the store")
+    import_parser.add_argument("--growth_dir", default="../data/growth_rates/", help="Folder with growth_* results")
+    import_parser.add_argument("--store_dir", default="../data/results_store/", help="Root folder of the store")
+
+    query_parser = subparsers.add_parser("query", help="Read a result table filtered on run parameters")
+    query_parser.add_argument("--store_dir", default="../data/results_store/", help="Root folder of the store")
+    query_parser.add_argument("--table", default="growth_rates", choices=RESULT_TABLES, help="Table to read")
+    for col in PARTITION_COLUMNS:
+        query_parser.add_argument(f"--{col}", nargs="+", default=None, help=f"Keep only these {col} values")
+    query_parser.add_argument("--out_fp", default=None, help="Save the result as .csv or .parquet (default: print)")
+
+    args = parser.parse_args()
+
+    if args.command == "import":
+        import_growth_folders(args.growth_dir, args.store_dir)
+    else:
+        df = read_table(args.store_dir, args.table, **{col: getattr(args, col) for col in PARTITION_COLUMNS})
+        if args.out_fp is None:
+            print(df)
+        elif args.out_fp.endswith(".parquet"):
+            df.to_parquet(args.out_fp, index=False)
+        else:
+            df.to_csv(args.out_fp, index=False)
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Grow With Per-Sample Timeouts and Fallback Solvers
+--------------------------------------------------
+
+Purpose:
+`micom.workflows.grow` hands every sample to a process pool and waits for all of them,
+so a single pathological sample (e.g. gurobi with presolve=True stuck on a numerically
+difficult model) holds up the whole batch. This module runs every sample in its own
+process with a wall-clock budget. A sample that exceeds its budget or fails to solve is
+retried with the next solver/settings in a fallback chain (e.g. gurobi -> hybrid -> osqp
+with relaxed tolerances) and is marked failed, with its last status, once the chain is
+exhausted. Each growth rate row records the solver and attempt that produced it.
+
+Workflow:
+1. Build the attempt chain from the primary solver and the fallback solvers.
+2. Start up to `threads` samples at once, each in a fresh (spawned) process.
+3. Kill any attempt that runs longer than `sample_timeout` seconds and queue the next one.
+4. Collect the growth rates, exchange fluxes and annotations of successful attempts.
+5. Return the combined `GrowthResults` and a log with one row per attempt.
+
+Inputs:
+- A manifest and model folder from `build()` and a medium (as for `micom.workflows.grow`).
+
+Outputs:
+- `GrowthResults` with extra `attempt_solver` and `attempt` columns in `growth_rates`.
+- An attempts log (sample_id, attempt, solver, presolve, atol, status, wall_time).
+
+This module is used by simulate_growth_rates_edited.py when `--sample_timeout` or
+`--results_store` is set (results are then streamed to the store sample by sample).
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import sys
+import time
+import pickle
+import logging
+from tempfile import TemporaryDirectory
+from multiprocessing import get_context
+import pandas as pd
+from micom import load_pickle
+from micom.annotation import annotate_metabolites_from_exchanges
+from micom.media import minimal_medium
+from micom.workflows.media import process_medium
+from micom.workflows.results import GrowthResults
+
+from telemetry import span, solver_stats
+
+logger = logging.getLogger(__name__)
+
+DIRECTION = pd.Series(["import", "export"], index=[0, 1])
+STRATEGY_ARGS = {
+    "none": {"fluxes": True, "pfba": False},
+    "minimal imports": {"fluxes": False, "pfba": False},
+    "pFBA": {"fluxes": True, "pfba": True},
+}
+# exit codes of an attempt process
+EXIT_OK = 0
+EXIT_INFEASIBLE = 3
+
+
+def build_attempts(solver, fallback_solvers=("hybrid", "osqp"), relaxed_tolerance=1e-4, solver_threads=None):
+    """
+    Build the chain of solver settings tried for each sample.
+
+    The first attempt uses the primary solver with presolve (the current default in
+    simulate_growth_rates_edited.py). Every fallback uses presolve and relaxed tolerances.
+
+    Parameters:
+    solver (str): Primary solver used in build() (e.g. gurobi).
+    fallback_solvers (list of str): Solvers to try, in order, after the primary one.
+    relaxed_tolerance (float): atol/rtol used for the fallback attempts.
+    solver_threads (int, optional): Threads for gurobi/cplex in each worker (default: solver default).
+
+    Returns:
+    list of dict: One dict per attempt with solver, presolve, atol, rtol and threads.
+    """
+    attempts = [{"solver": solver, "presolve": True, "atol": None, "rtol": None, "threads": solver_threads}]
+    for fallback in fallback_solvers:
+        attempts.append({"solver": fallback, "presolve": True,
+                         "atol": relaxed_tolerance, "rtol": relaxed_tolerance,
+                         "threads": solver_threads})
+    return attempts
+
+
+def set_solver_threads(com, threads):
+    """
+    Limit the threads used by the solver of a community (gurobi and cplex only).
+
+    Both solvers use every core by default, which oversubscribes the host when several
+    samples are solved in parallel.
+    """
+    interface = com.solver.interface.__name__
+    if "gurobi" in interface:
+        com.solver.problem.Params.Threads = threads
+    elif "cplex" in interface:
+        com.solver.problem.parameters.threads.set(threads)
+
+
+def _grow_attempt(args):
+    """
+    Solve a single sample with one set of solver settings and pickle the raw result.
+
+    Runs inside its own process. Mirrors `micom.workflows.grow._growth`, but can switch
+    the solver of the pickled community and passes the time budget to the solver.
+    """
+    p, tradeoff, medium, weights, strategy, attempt, timeout, out_fp = args
+    com = load_pickle(p)
+
+    if attempt["solver"] is not None and attempt["solver"] not in str(com.solver.interface.__name__):
+        com.solver = attempt["solver"]
+    if attempt.get("threads"):
+        set_solver_threads(com, attempt["threads"])
+    if timeout is not None:
+        # a soft limit, so well-behaved solvers return before they are killed
+        com.solver.configuration.timeout = max(1, int(timeout))
+    if attempt["presolve"]:
+        com.solver.configuration.presolve = attempt["presolve"]
+    atol = attempt["atol"] or com.solver.configuration.tolerances.feasibility
+    rtol = attempt["rtol"] or com.solver.configuration.tolerances.feasibility
+
+    ex_ids = [r.id for r in com.exchanges]
+    com.medium = medium[medium.index.isin(ex_ids)]
+
+    solve_args = STRATEGY_ARGS[strategy].copy()
+    solve_args["atol"] = atol
+    solve_args["rtol"] = rtol
+    solve_args["fraction"] = tradeoff
+    with span("solve sample", stage="grow", sample=com.id, tradeoff=tradeoff, strategy=strategy) as fields:
+        try:
+            sol = com.cooperative_tradeoff(**solve_args)
+            rates = sol.members
+            rates["taxon"] = rates.index
+            rates["tradeoff"] = tradeoff
+            rates["sample_id"] = com.id
+        except Exception:
+            fields.update(solver_stats(com))
+            sys.exit(EXIT_INFEASIBLE)
+        fields.update(solver_stats(com), n_taxa=len(com.taxa))
+
+        if strategy == "minimal imports":
+            med = minimal_medium(com, exchanges=None, community_growth=sol.growth_rate,
+                                 min_growth=rates.growth_rate.drop("medium"), solution=True,
+                                 weights=weights, atol=atol, rtol=rtol)
+            if med is None:
+                sys.exit(EXIT_INFEASIBLE)
+            sol = med["solution"]
+
+    exs = list({r.global_id for r in com.internal_exchanges + com.exchanges})
+    fluxes = sol.fluxes.loc[:, exs].copy()
+    fluxes["sample_id"] = com.id
+    fluxes["tolerance"] = atol
+    anns = annotate_metabolites_from_exchanges(com)
+    with open(out_fp, "wb") as fh:
+        pickle.dump({"growth": rates, "exchanges": fluxes, "annotations": anns}, fh)
+
+
+def tidy_sample_result(result):
+    """
+    Convert the raw result of one sample into `GrowthResults` tables, as `grow()` does.
+
+    Parameters:
+    result (dict): Raw growth, exchanges and annotations of a single sample.
+
+    Returns:
+    GrowthResults: Growth rates, exchange fluxes (long format) and annotations of the sample.
+    """
+    growth = result["growth"]
+    growth = growth[growth.taxon != "medium"]
+    exchanges = result["exchanges"]
+    exchanges["taxon"] = exchanges.index.values
+    exchanges = exchanges.melt(id_vars=["taxon", "sample_id", "tolerance"],
+                               var_name="reaction", value_name="flux").dropna(subset=["flux"])
+    abundance = growth[["taxon", "sample_id", "abundance"]]
+    exchanges = pd.merge(exchanges, abundance, on=["taxon", "sample_id"], how="outer")
+    anns = result["annotations"].drop_duplicates(subset=["reaction"])
+    anns.index = anns.reaction
+    exchanges = pd.merge(exchanges, anns[["metabolite"]], on="reaction", how="left")
+    exchanges["direction"] = DIRECTION[(exchanges.flux > 0.0).astype(int)].values
+    exchanges = exchanges[exchanges.flux.abs() > exchanges.tolerance]
+    return GrowthResults(growth, exchanges, anns)
+
+
+def grow_with_timeouts(manifest, model_folder, medium, tradeoff,
+                       attempts, sample_timeout, threads=1,
+                       strategy="minimal imports", weights=None, on_result=None):
+    """
+    Simulate growth like `micom.workflows.grow`, with a per-sample time budget and fallbacks.
+
+    Parameters:
+    manifest (pandas.DataFrame): The manifest as returned by `build()`.
+    model_folder (str): The folder in which to find the files mentioned in the manifest.
+    medium (pandas.DataFrame): Growth medium with columns "reaction" and "flux".
+    tradeoff (float): Cooperative tradeoff value.
+    attempts (list of dict): Attempt chain from `build_attempts`.
+    sample_timeout (float): Wall-clock budget per attempt in seconds (None for no limit).
+    threads (int): Number of samples solved at the same time.
+    strategy (str): Flux strategy, one of "minimal imports", "pFBA" or "none".
+    weights (str, optional): Weights for the minimal import rates (see `grow`).
+    on_result (callable, optional): Called as on_result(sample_id, GrowthResults) as soon as a
+        sample is solved. If given, results are not kept in memory and None is returned instead.
+
+    Returns:
+    tuple: (GrowthResults or None, attempts log as pandas.DataFrame)
+    """
+    if strategy not in STRATEGY_ARGS:
+        raise ValueError(f"`{strategy}` is not a valid strategy. Must be one of {', '.join(STRATEGY_ARGS)}!")
+    samples = manifest.sample_id.unique()
+    paths = {s: os.path.join(model_folder, manifest[manifest.sample_id == s].file.iloc[0]) for s in samples}
+    medium = process_medium(medium, samples)
+    ctx = get_context("spawn")
+
+    pending = [(s, 0) for s in samples]
+    running = {}
+    log = []
+    results = []
+    with TemporaryDirectory(prefix="micom_ts_") as tmp_dir:
+        while pending or running:
+            while pending and len(running) < threads:
+                s, i = pending.pop(0)
+                out_fp = os.path.join(tmp_dir, f"{s}_{i}.pickle")
+                args = [paths[s], tradeoff, medium.flux[medium.sample_id == s], weights,
+                        strategy, attempts[i], sample_timeout, out_fp]
+                proc = ctx.Process(target=_grow_attempt, args=(args,))
+                proc.start()
+                running[proc] = (s, i, out_fp, time.perf_counter())
+
+            time.sleep(0.1)
+            for proc, (s, i, out_fp, start) in list(running.items()):
+                elapsed = time.perf_counter() - start
+                if proc.is_alive():
+                    if sample_timeout is None or elapsed <= sample_timeout:
+                        continue
+                    proc.terminate()
+                    proc.join()
+                    status = "timeout"
+                else:
+                    proc.join()
+                    if proc.exitcode == EXIT_OK and os.path.exists(out_fp):
+                        status = "optimal"
+                    elif proc.exitcode == EXIT_INFEASIBLE:
+                        status = "infeasible"
+                    else:
+                        status = f"error (exit code {proc.exitcode})"
+                del running[proc]
+
+                attempt = attempts[i]
+                log.append({"sample_id": s, "attempt": i + 1, "solver": attempt["solver"],
+                            "presolve": attempt["presolve"], "atol": attempt["atol"],
+                            "status": status, "wall_time": elapsed})
+                if status == "optimal":
+                    with open(out_fp, "rb") as fh:
+                        sample_result = tidy_sample_result(pickle.load(fh))
+                    os.remove(out_fp)
+                    sample_result.growth_rates["attempt_solver"] = attempt["solver"]
+                    sample_result.growth_rates["attempt"] = i + 1
+                    if on_result is not None:
+                        on_result(s, sample_result)
+                    else:
+                        results.append(sample_result)
+                elif i + 1 < len(attempts):
+                    print(f"Sample {s}: attempt {i + 1} with {attempt['solver']} ended with status "
+                          f"'{status}' after {elapsed:.1f}s, retrying with {attempts[i + 1]['solver']}...")
+                    pending.append((s, i + 1))
+                else:
+                    print(f"Sample {s}: all {len(attempts)} attempts failed (last status '{status}').")
+
+    log = pd.DataFrame(log)
+    final = log.groupby("sample_id").tail(1)
+    failed = final[final["status"] != "optimal"]
+    if len(failed) == len(samples):
+        raise RuntimeError("All samples failed or timed out with every solver in the fallback chain.")
+    if on_result is not None:
+        return None, log
+
+    growth = pd.concat([r.growth_rates for r in results], ignore_index=True)
+    exchanges = pd.concat([r.exchanges for r in results], ignore_index=True)
+    anns = pd.concat([r.annotations for r in results]).drop_duplicates(subset=["reaction"])
+    anns.index = anns.reaction
+    return GrowthResults(growth, exchanges, anns), log
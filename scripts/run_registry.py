@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Run Registry with Canonical Input Hashes
+----------------------------------------
+
+Purpose:
+Run parameters used to live only in output names like `growth_F01_agora1_gurobi_vmhavg_05`,
+which renaming_script.py had to rewrite after the fact, and nothing stopped a sweep from
+re-running a configuration that was already done. This registry records every simulation
+under a canonical hash of its inputs: the sha256 of the feature table, taxonomy, model
+database and diet artifacts, the solver, tradeoff, cutoff options and the code version
+(sha256 of the simulation scripts plus the micom version). The parameters are stored as
+columns next to the hash and the outputs as paths, so the catalog never depends on names.
+
+simulate_growth_rates_edited.py checks the registry first (`--run_registry`): if a run with
+the same hash is done and its outputs still exist, it returns those outputs immediately
+instead of building and growing again (`--rerun` forces a new run).
+
+Workflow:
+1. `run_parameters` hashes the input artifacts (file hashes are cached by path, size and
+   modification time, so large model databases are read once) and collects the options.
+2. `run_hash` hashes the canonical JSON of the parameters.
+3. `find_run` returns a done run with existing outputs; `start_run` and `finish_run` record
+   a new run, its outcome (done, or skipped when no sample passes the coverage check) and
+   its outputs. The output destination is part of the hash, so asking for the results in
+   another place runs again instead of returning the old paths.
+
+Inputs:
+- Nothing but the registry file; runs are added by simulate_growth_rates_edited.py.
+
+Outputs:
+- `<registry_db>` (SQLite): `runs` (run_hash, subject_id, model_db, solver, diet, tradeoff,
+  parameters, outputs, status, started, finished) and `file_hashes`.
+
+Usage:
+    python simulate_growth_rates_edited.py ... --run_registry ../data/run_registry.sqlite
+    python run_registry.py list --registry_db ../data/run_registry.sqlite --subject_id F01 --solver gurobi
+    python run_registry.py show --registry_db ../data/run_registry.sqlite 3f2a9c
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+from importlib.metadata import version, PackageNotFoundError
+import pandas as pd
+
+from diet_registry import DATA_DIR, file_sha256
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_REGISTRY_DB = os.path.join(DATA_DIR, "run_registry.sqlite")
+# scripts whose changes can change the results of a run
+CODE_FILES = ["simulate_growth_rates_edited.py", "grow_helpers.py", "estimate_model_coverage.py", "adaptive_cutoff.py",
+              "robust_grow.py", "fast_medium.py", "diet_registry.py"]
+LABEL_COLUMNS = ["subject_id", "model_db", "solver", "diet", "tradeoff"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_hash TEXT PRIMARY KEY,
+    subject_id TEXT,
+    model_db TEXT,
+    solver TEXT,
+    diet TEXT,
+    tradeoff REAL,
+    parameters TEXT NOT NULL,
+    outputs TEXT,
+    status TEXT NOT NULL DEFAULT 'running',
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS runs_params ON runs (subject_id, model_db, solver, diet, tradeoff);
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    sha256 TEXT
+);
+"""
+
+
+def connect(registry_db):
+    """
+    Open the registry database (created if needed) with a generous lock timeout.
+    """
+    con = sqlite3.connect(registry_db, timeout=60, isolation_level=None)
+    con.row_factory = sqlite3.Row
+    con.executescript(SCHEMA)
+    return con
+
+
+def cached_file_sha256(con, fp):
+    """
+    Get the sha256 of a file, recomputing it only if its size or modification time changed.
+    """
+    path = os.path.abspath(fp)
+    stat = os.stat(path)
+    row = con.execute("SELECT size, mtime, sha256 FROM file_hashes WHERE path = ?", (path,)).fetchone()
+    if row is not None and row["size"] == stat.st_size and row["mtime"] == stat.st_mtime:
+        return row["sha256"]
+    sha256 = file_sha256(path)
+    con.execute("INSERT OR REPLACE INTO file_hashes (path, size, mtime, sha256) VALUES (?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime, sha256))
+    return sha256
+
+
+def code_version():
+    """
+    Hash the simulation scripts (CODE_FILES) together with the installed micom version.
+    """
+    digest = hashlib.sha256()
+    for name in CODE_FILES:
+        with open(os.path.join(SCRIPT_DIR, name), "rb") as fh:
+            digest.update(name.encode() + b"\0" + fh.read())
+    try:
+        micom_version = version("micom")
+    except PackageNotFoundError:
+        micom_version = "unknown"
+    return f"{digest.hexdigest()[:16]}+micom-{micom_version}"
+
+
+def run_parameters(registry_db, feature_table_fp, taxonomy_fp, model_fp, diet_fp, solver, tradeoff, **options):
+    """
+    Collect the canonical parameters of a simulation.
+
+    Parameters:
+    registry_db (str): Path to the registry (holds the cached file hashes).
+    feature_table_fp, taxonomy_fp (str): The subject's QIIME2 artifacts.
+    model_fp (str): Model database (.qza/.zip).
+    diet_fp (str): Diet artifact (resolved path, see diet_registry.resolve_diet).
+    solver (str): Solver name.
+    tradeoff (float): Cooperative tradeoff.
+    **options: Other settings that change the results (cutoffs, timeouts, medium completion).
+        File options ending in `_fp` are hashed like the artifacts.
+
+    Returns:
+    dict: JSON-serializable parameters; the same inputs always give the same dict.
+    """
+    con = connect(registry_db)
+    inputs = {"feature_table": feature_table_fp, "taxonomy": taxonomy_fp, "model_db": model_fp, "diet": diet_fp}
+    params = {name: cached_file_sha256(con, fp) for name, fp in inputs.items()}
+    for name, value in sorted(options.items()):
+        if name.endswith("_fp") and value is not None:
+            value = cached_file_sha256(con, value)
+        elif isinstance(value, (list, tuple)):
+            value = list(value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = float(value)
+        params[name] = value
+    con.close()
+    params.update(solver=solver, tradeoff=float(tradeoff), code_version=code_version())
+    return params
+
+
+def run_hash(parameters):
+    """
+    Hash the canonical JSON (sorted keys, no whitespace) of the run parameters.
+    """
+    canonical = json.dumps(parameters, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def missing_outputs(outputs):
+    """
+    List the recorded output paths that no longer exist.
+    """
+    return [fp for fp in outputs.values() if fp is not None and not os.path.exists(fp)]
+
+
+def find_run(registry_db, run_hash):
+    """
+    Look up a completed run by its hash.
+
+    Returns:
+    dict or None: The registry row (parameters and outputs decoded) if the run is done and all
+    of its outputs still exist, otherwise None.
+    """
+    con = connect(registry_db)
+    row = con.execute("SELECT * FROM runs WHERE run_hash = ? AND status = 'done'", (run_hash,)).fetchone()
+    con.close()
+    if row is None:
+        return None
+    run = dict(row)
+    run["parameters"] = json.loads(run["parameters"])
+    run["outputs"] = json.loads(run["outputs"])
+    missing = missing_outputs(run["outputs"])
+    if missing:
+        print(f"Run {run_hash[:12]} is registered but its outputs are missing ({', '.join(missing)}); running again")
+        return None
+    return run
+
+
+def start_run(registry_db, run_hash, parameters, labels):
+    """
+    Record a run as running (replacing an earlier record of the same hash).
+
+    Parameters:
+    registry_db (str): Path to the registry.
+    run_hash (str): Hash from `run_hash`.
+    parameters (dict): Parameters from `run_parameters`.
+    labels (dict): subject_id, model_db, solver, diet and tradeoff as used in the results.
+    """
+    con = connect(registry_db)
+    with con:
+        con.execute("INSERT OR REPLACE INTO runs (run_hash, subject_id, model_db, solver, diet, tradeoff, "
+                    "parameters, status, started) VALUES (?, ?, ?, ?, ?, ?, ?, 'running', ?)",
+                    (run_hash, *[labels[col] for col in LABEL_COLUMNS], json.dumps(parameters, sort_keys=True),
+                     time.time()))
+    con.close()
+
+
+def finish_run(registry_db, run_hash, outputs, status="done"):
+    """
+    Record the outcome of a run and its outputs.
+
+    Parameters:
+    registry_db (str): Path to the registry.
+    run_hash (str): Hash of the run.
+    outputs (dict): Output name -> path (None for outputs the run did not write).
+    status (str): "done", or e.g. "skipped" for a run that ended early without results
+        (only done runs are returned by `find_run`).
+    """
+    con = connect(registry_db)
+    with con:
+        con.execute("UPDATE runs SET status = ?, outputs = ?, finished = ? WHERE run_hash = ?",
+                    (status, json.dumps(outputs, sort_keys=True), time.time(), run_hash))
+    con.close()
+
+
+def list_registered(registry_db, **filters):
+    """
+    List the registered runs, optionally filtered on the run labels.
+
+    Returns:
+    pandas.DataFrame: One row per run with its labels, status and outputs.
+    """
+    con = connect(registry_db)
+    runs = pd.read_sql_query("SELECT run_hash, subject_id, model_db, solver, diet, tradeoff, status, outputs, "
+                             "started, finished FROM runs ORDER BY started", con)
+    con.close()
+    for col in ("started", "finished"):
+        runs[col] = pd.to_datetime(runs[col], unit="s").dt.floor("s")
+    for col, value in filters.items():
+        if value is not None:
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            values = [float(v) for v in values] if col == "tradeoff" else [str(v) for v in values]
+            runs = runs[runs[col].isin(values)]
+    return runs.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Registry of simulation runs keyed by a hash of their inputs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = subparsers.add_parser("list", help="Print the registered runs")
+    for col in LABEL_COLUMNS:
+        list_parser.add_argument(f"--{col}", nargs="+", default=None, help=f"Keep only these {col} values")
+    show_parser = subparsers.add_parser("show", help="Print the parameters and outputs of a run")
+    show_parser.add_argument("run_hash", help="Run hash (or a unique prefix)")
+    for sub in (list_parser, show_parser):
+        sub.add_argument("--registry_db", default=DEFAULT_REGISTRY_DB, help="Path to the run registry")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        runs = list_registered(args.registry_db, **{col: getattr(args, col) for col in LABEL_COLUMNS})
+        runs["run_hash"] = runs["run_hash"].str[:12]
+        print(runs.drop(columns=["outputs"]).to_string(index=False))
+    else:
+        con = connect(args.registry_db)
+        rows = con.execute("SELECT * FROM runs WHERE run_hash LIKE ?", (args.run_hash + "%",)).fetchall()
+        con.close()
+        if len(rows) != 1:
+            parser.error(f"{len(rows)} runs match `{args.run_hash}`")
+        run = dict(rows[0])
+        run["parameters"] = json.loads(run["parameters"])
+        run["outputs"] = json.loads(run["outputs"]) if run["outputs"] else None
+        print(json.dumps(run, indent=2))
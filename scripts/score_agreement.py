@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Score Simulated vs Observed Agreement for All Parameter Combinations
+--------------------------------------------------------------------
+
+Purpose:
+micom_time_series_comparison.qmd runs `cor.test(..., method = "spearman")` once per
+(folder, taxon) group through nest()/map(), which gets slow as the number of runs grows
+and only gives Spearman at lag 0. This script scores every group in one vectorized pass:
+all (subject, model DB, solver, diet, tradeoff, taxon) series are packed into one padded
+matrix and the correlations of every group are computed with array operations.
+Permutation p-values come from batched shuffles shared by all groups of the same length.
+
+Scores per group and lag:
+- pearson_r / spearman_rho with approximate (t-distribution) p-values, as `cor.test(exact = FALSE)`.
+- pearson_perm_p / spearman_perm_p: two-sided permutation p-values.
+- sign_agreement: fraction of samples where the simulated growth rate and the observed CLR
+  change are on the same side of their own mean (growth rates are never negative, so the
+  raw signs cannot be compared).
+A lag of k pairs the simulated growth rate of a sample with the observed change k samples later.
+
+Workflow:
+1. Load the combined table (output of combine_sim_and_real_data.py).
+2. For every lag, pack the (growth_rate, clr_change_abund) pairs of each group into a matrix.
+3. Compute Pearson, Spearman (Pearson on ranks) and sign agreement for all groups.
+4. Shuffle the observed values within every group in batches to get permutation p-values.
+5. Summarize per parameter combination and rank the combinations.
+
+Inputs:
+- Combined data: the Parquet folder from combine_sim_and_real_data.py, or a .csv/.parquet file
+  with the same columns (e.g. combined_sim_real_data_50.csv).
+
+Outputs:
+- `agreement_by_taxon.csv`: scores per group and lag.
+- `agreement_by_combo.csv`: per parameter combination and lag: total_taxa, mean/median rho,
+  significant_positive_taxa, percent_significant_positive and mean_sign_agreement, ranked.
+
+Usage:
+    python score_agreement.py --combined ../data/combined_sim_real_data_50/ \
+        --out_dir ../data/agreement_scores/ --lags 0 1 2 --n_permutations 1000
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from combine_sim_and_real_data import read_combined
+
+COMBO_COLUMNS = ["subject_id", "model_db", "solver", "diet", "tradeoff"]
+# max number of values in one batch of permutations (groups x shuffles x samples)
+PERMUTATION_BATCH_VALUES = 20_000_000
+
+
+def load_combined(combined):
+    """
+    Load the combined data from a combine_sim_and_real_data.py output folder or a .csv/.parquet file.
+    """
+    if os.path.isdir(combined):
+        return read_combined(combined)
+    if combined.endswith(".parquet"):
+        return pd.read_parquet(combined)
+    return pd.read_csv(combined)
+
+
+def pack_groups(df, group_columns, lag=0):
+    """
+    Pack the paired series of every group into left-aligned, NaN-padded matrices.
+
+    Parameters:
+    df (pandas.DataFrame): Combined data with sample_id, growth_rate and clr_change_abund.
+    group_columns (list of str): Columns that define a group (one series per group).
+    lag (int): Pair the growth rate of sample i with the observed change of sample i + lag
+        (samples of the group's run, i.e. of all rows sharing the non-taxon group columns).
+
+    Returns:
+    tuple: (groups DataFrame, X, Y, valid) where X/Y are (groups x samples) matrices of simulated
+    and observed values with the valid pairs of each row first, and valid marks those pairs.
+    """
+    df = df.sort_values(group_columns + ["sample_id"])
+    grouped = df.groupby(group_columns, sort=False, observed=True)
+    g = grouped.ngroup().to_numpy()
+    # position on the run's sample grid (not within the group), so a taxon missing on some days
+    # keeps its gaps and a lag always pairs samples `lag` sampling steps apart
+    run_columns = [c for c in group_columns if c != "taxon"]
+    samples = df.groupby(run_columns, sort=False, observed=True)["sample_id"] if run_columns else df["sample_id"]
+    pos = samples.rank(method="dense").to_numpy().astype(int) - 1
+    groups = grouped.size().reset_index()[group_columns]
+
+    n_samples = pos.max() + 1
+    X = np.full((len(groups), n_samples), np.nan)
+    Y = np.full((len(groups), n_samples), np.nan)
+    X[g, pos] = df["growth_rate"].to_numpy()
+    Y[g, pos] = df["clr_change_abund"].to_numpy()
+    if lag > 0:
+        X, Y = X[:, :-lag], Y[:, lag:]
+
+    valid = ~np.isnan(X) & ~np.isnan(Y)
+    # move the valid pairs of each row to the front so shuffles stay inside them
+    order = np.argsort(~valid, axis=1, kind="stable")
+    X = np.take_along_axis(X, order, axis=1)
+    Y = np.take_along_axis(Y, order, axis=1)
+    valid = np.take_along_axis(valid, order, axis=1)
+    return groups, X, Y, valid
+
+
+def center(values, valid):
+    """
+    Subtract the row means of the valid values; invalid entries become 0.
+    """
+    n = valid.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(valid, values, 0).sum(axis=1, keepdims=True) / n
+    return np.where(valid, values - mean, 0)
+
+
+def correlate(xc, yc):
+    """
+    Row-wise Pearson correlation of centered matrices (NaN for rows without variance).
+    """
+    denom = np.sqrt((xc ** 2).sum(axis=1) * (yc ** 2).sum(axis=1))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r = (xc * yc).sum(axis=1) / denom
+    return np.where(denom > 0, r, np.nan), denom
+
+
+def approx_p_value(r, n):
+    """
+    Two-sided p-value of a correlation from the t-distribution (as cor.test with exact = FALSE).
+    """
+    from scipy.stats import t as t_dist
+
+    df = n - 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stat = r * np.sqrt(df / (1 - r ** 2))
+    p = 2 * t_dist.sf(np.abs(stat), df)
+    return np.where((df > 0) & ~np.isnan(r), p, np.nan)
+
+
+def permutation_p_values(statistics, n, n_permutations, rng):
+    """
+    Two-sided permutation p-values for the correlations of all rows at once.
+
+    Rows with the same number of valid pairs share one batch of shuffles of the observed
+    values, so each batch is a single gather and multiply over a (rows x shuffles x samples)
+    array instead of a loop over groups. Each row's p-value is still an ordinary permutation
+    p-value of that row.
+
+    Parameters:
+    statistics (list of tuple): (xc, yc, denom, r) per correlation (e.g. Pearson and Spearman),
+        with xc/yc the centered, left-aligned matrices from `center`.
+    n (numpy.ndarray): Number of valid pairs per row.
+    n_permutations (int): Number of shuffles.
+    rng (numpy.random.Generator): Random generator.
+
+    Returns:
+    list of numpy.ndarray: (1 + #|r_perm| >= |r|) / (1 + n_permutations) per row, per statistic.
+    """
+    exceed = [np.zeros(len(n)) for _ in statistics]
+    for length in np.unique(n[n > 2]):
+        rows = np.flatnonzero(n == length)
+        batch = max(1, min(n_permutations, PERMUTATION_BATCH_VALUES // (len(rows) * length)))
+        done = 0
+        while done < n_permutations:
+            size = min(batch, n_permutations - done)
+            perm = rng.permuted(np.tile(np.arange(length), (size, 1)), axis=1)
+            for k, (xc, yc, denom, r) in enumerate(statistics):
+                yp = yc[rows][:, perm]
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    r_perm = np.einsum("gi,gpi->gp", xc[rows, :length], yp) / denom[rows, None]
+                exceed[k][rows] += (np.abs(r_perm) >= np.abs(r[rows, None]) - 1e-12).sum(axis=1)
+            done += size
+    p_values = []
+    for k, (_, _, _, r) in enumerate(statistics):
+        p = (1 + exceed[k]) / (1 + n_permutations)
+        p_values.append(np.where(np.isnan(r), np.nan, p))
+    return p_values
+
+
+def score_groups(df, group_columns, lag=0, n_permutations=1000, min_samples=4, rng=None):
+    """
+    Score the agreement of simulated and observed growth for every group at one lag.
+
+    Parameters:
+    df (pandas.DataFrame): Combined data.
+    group_columns (list of str): Columns that define a group.
+    lag (int): Sample lag between simulated and observed values.
+    n_permutations (int): Shuffles for the permutation p-values (0 to skip).
+    min_samples (int): Groups with fewer valid pairs get NaN scores.
+    rng (numpy.random.Generator, optional): Random generator for the shuffles.
+
+    Returns:
+    pandas.DataFrame: One row per group with n, correlations, p-values and sign agreement.
+    """
+    from scipy.stats import rankdata
+
+    rng = rng or np.random.default_rng()
+    groups, X, Y, valid = pack_groups(df, group_columns, lag)
+    valid[valid.sum(axis=1) < min_samples] = False
+    n = valid.sum(axis=1)
+
+    scores = groups.copy()
+    scores["lag"] = lag
+    scores["n"] = n
+
+    xc, yc = center(X, valid), center(Y, valid)
+    pearson_r, pearson_denom = correlate(xc, yc)
+    # Spearman = Pearson on (average) ranks
+    rx = rankdata(np.where(valid, X, np.nan), axis=1, nan_policy="omit")
+    ry = rankdata(np.where(valid, Y, np.nan), axis=1, nan_policy="omit")
+    rxc, ryc = center(rx, valid), center(ry, valid)
+    spearman_rho, spearman_denom = correlate(rxc, ryc)
+
+    scores["pearson_r"] = pearson_r
+    scores["pearson_p"] = approx_p_value(pearson_r, n)
+    scores["spearman_rho"] = spearman_rho
+    scores["spearman_p"] = approx_p_value(spearman_rho, n)
+    if n_permutations > 0:
+        scores["pearson_perm_p"], scores["spearman_perm_p"] = permutation_p_values(
+            [(xc, yc, pearson_denom, pearson_r), (rxc, ryc, spearman_denom, spearman_rho)],
+            n, n_permutations, rng)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scores["sign_agreement"] = np.where(n > 0, ((xc * yc) > 0).sum(axis=1) / n, np.nan)
+    return scores
+
+
+def summarize_combos(scores, combo_columns, alpha=0.05):
+    """
+    Summarize taxon scores per parameter combination and rank the combinations.
+
+    Mirrors `performance_summary` in micom_time_series_comparison.qmd: combinations are ranked by
+    the percentage of taxa with a significant positive Spearman correlation, then by median rho.
+    The permutation p-value is used when available.
+    """
+    p_col = "spearman_perm_p" if "spearman_perm_p" in scores.columns else "spearman_p"
+    scored = scores.dropna(subset=["spearman_rho"]).copy()
+    scored["significant_positive"] = (scored[p_col] < alpha) & (scored["spearman_rho"] > 0)
+    grouped = scored.groupby(combo_columns + ["lag"], observed=True)
+    summary = grouped.agg(total_taxa=("spearman_rho", "size"),
+                          mean_rho=("spearman_rho", "mean"),
+                          median_rho=("spearman_rho", "median"),
+                          mean_pearson_r=("pearson_r", "mean"),
+                          significant_positive_taxa=("significant_positive", "sum"),
+                          mean_sign_agreement=("sign_agreement", "mean")).reset_index()
+    summary["percent_significant_positive"] = summary["significant_positive_taxa"] / summary["total_taxa"] * 100
+    summary = summary.sort_values(["percent_significant_positive", "median_rho"], ascending=False)
+    summary["rank"] = summary.groupby("lag").cumcount() + 1
+    return summary.reset_index(drop=True)
+
+
+def main(combined, out_dir, lags=(0,), n_permutations=1000, min_samples=4,
+         by_onset=False, alpha=0.05, seed=None):
+    start = time.perf_counter()
+    df = load_combined(combined)
+    combo_columns = COMBO_COLUMNS + (["date_vs_onset_illness"] if by_onset else [])
+    combo_columns = [c for c in combo_columns if c in df.columns]
+    group_columns = combo_columns + ["taxon"]
+    rng = np.random.default_rng(seed)
+
+    scores = pd.concat([score_groups(df, group_columns, lag, n_permutations, min_samples, rng)
+                        for lag in lags], ignore_index=True)
+    summary = summarize_combos(scores, combo_columns, alpha)
+
+    os.makedirs(out_dir, exist_ok=True)
+    scores.to_csv(os.path.join(out_dir, "agreement_by_taxon.csv"), index=False)
+    summary.to_csv(os.path.join(out_dir, "agreement_by_combo.csv"), index=False)
+    n_combos = len(summary[combo_columns].drop_duplicates())
+    print(f"Scored {len(scores)} taxon series from {n_combos} parameter combinations "
+          f"at lags {list(lags)} in {time.perf_counter() - start:.1f}s. Results saved to {out_dir}")
+    print(summary[summary["lag"] == lags[0]].head(10).to_string(index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score simulated vs observed growth agreement for all parameter combinations")
+    parser.add_argument("--combined", default="../data/combined_sim_real_data_50/",
+                        help="combine_sim_and_real_data.py output folder or a combined .csv/.parquet file")
+    parser.add_argument("--out_dir", default="../data/agreement_scores/", help="Folder for the score tables")
+    parser.add_argument("--lags", type=int, nargs="+", default=[0],
+                        help="Sample lags between simulated and observed values (e.g. 0 1 2)")
+    parser.add_argument("--n_permutations", type=int, default=1000,
+                        help="Shuffles for permutation p-values (0 to skip)")
+    parser.add_argument("--min_samples", type=int, default=4, help="Minimum paired samples per taxon")
+    parser.add_argument("--by_onset", action="store_true",
+                        help="Score before and after illness onset separately (date_vs_onset_illness)")
+    parser.add_argument("--alpha", type=float, default=0.05, help="Significance level for the summary")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for the permutations")
+    args = parser.parse_args()
+
+    main(args.combined, args.out_dir, args.lags, args.n_permutations, args.min_samples,
+         args.by_onset, args.alpha, args.seed)
@@ -23,7 +23,8 @@ For each OTU table, the script generates:
 - `<subject_id>_combined_otu.biom`: BIOM-formatted OTU table.
 - `<subject_id>_feature_table.qza`: QIIME2 FeatureTable artifact.
 - `<subject_id>_taxonomy.qza`: QIIME2 Taxonomy artifact.
-- `<subject_id>_taxonomy.tsv`: Exported taxonomy in TSV format.
+- `<subject_id>_taxonomy.tsv`: Exported taxonomy in TSV format (exported through
+  `taxonomy_exports/<subject_id>/`, so subjects can be processed in parallel).
 
 Usage:
     python silva_taxonomy_mapping.py \
@@ -57,11 +58,12 @@ Date: 01/21/2025
 # Import required libraries
 from tqdm import tqdm  # For creating progress bars
 import os  # For file and directory operations
-import subprocess  # For running shell commands
 from pathlib import Path  # For handling directory paths
 import argparse  # For command-line argument parsing
 
-def main(final_output_dir, rep_seq_path, classifier_path, qiime_output_dir):
+from telemetry import run_command  # Runs the qiime/biom commands inside telemetry spans
+
+def main(final_output_dir, rep_seq_path, classifier_path, qiime_output_dir, subject_ids=None):
     """
     Process OTU tables and map OTUs to taxonomy using QIIME2 and the SILVA database.
 
@@ -70,24 +72,31 @@ def main(final_output_dir, rep_seq_path, classifier_path, qiime_output_dir):
         - rep_seq_path (str): Path to the QIIME2 artifact for representative sequences (e.g., .qza file).
         - classifier_path (str): Path to the SILVA classifier (e.g., silva-138-99-nb-classifier.qza).
         - qiime_output_dir (str): Directory to store output files (e.g., feature tables, taxonomy, and TSV exports).
+        - subject_ids (list, optional): Only process the OTU tables of these subjects (default: all).
     """
     # Ensure the output directory exists
     Path(qiime_output_dir).mkdir(parents=True, exist_ok=True)
 
     #Check if the rep seq file is .fna and convert to .qza if needed 
     if rep_seq_path.endswith(".fna"):
-        print("Converting representative sequences to QIIME2 artifact...")
         req_seq_qza = rep_seq_path.replace(".fna", ".qza")
-        subprocess.run([
-            "qiime", "tools", "import",
-            "--type", "FeatureData[Sequence]",
-            "--input-path", rep_seq_path,
-            "--output-path", req_seq_qza
-        ], check=True)
+        if not os.path.exists(req_seq_qza) or os.path.getmtime(req_seq_qza) < os.path.getmtime(rep_seq_path):
+            print("Converting representative sequences to QIIME2 artifact...")
+            # imported under a temporary name and moved into place, so parallel runs never read a partial artifact
+            tmp_qza = req_seq_qza.replace(".qza", f".tmp-{os.getpid()}.qza")
+            run_command([
+                "qiime", "tools", "import",
+                "--type", "FeatureData[Sequence]",
+                "--input-path", rep_seq_path,
+                "--output-path", tmp_qza
+            ], stage="silva")
+            os.replace(tmp_qza, req_seq_qza)
         rep_seq_path = req_seq_qza
     
     # Retrieve a list of OTU files to process
     otu_files = [f for f in os.listdir(final_output_dir) if f.endswith("_combined_otu_qiime2.tsv")]
+    if subject_ids is not None:
+        otu_files = [f for f in otu_files if f.split("_")[0] in subject_ids]
 
     # Process each OTU table using a progress bar
     for otu_file in tqdm(otu_files, desc="Processing OTU Tables", unit="file"):
@@ -101,42 +110,46 @@ def main(final_output_dir, rep_seq_path, classifier_path, qiime_output_dir):
         feature_table = os.path.join(qiime_output_dir, f"{subject_id}_feature_table.qza")  # QIIME2 FeatureTable artifact
         taxonomy_output = os.path.join(qiime_output_dir, f"{subject_id}_taxonomy.qza")  # QIIME2 taxonomy artifact
         taxonomy_export = os.path.join(qiime_output_dir, f"{subject_id}_taxonomy.tsv")  # Exported taxonomy TSV file
+        # qiime always exports to taxonomy.tsv, so every subject gets its own export folder
+        # (subjects can then be mapped in parallel, e.g. one pipeline.py node per subject)
+        export_dir = os.path.join(qiime_output_dir, "taxonomy_exports", subject_id)
 
         # Step 1: Convert TSV to BIOM format
         print(f"Converting {input_tsv} to BIOM format...")
-        subprocess.run([
+        run_command([
             "biom", "convert",
             "-i", input_tsv,               # Input TSV file
             "-o", biom_file,               # Output BIOM file
             "--table-type", "OTU table",   # Specify table type
             "--to-hdf5"                    # Use HDF5 format for BIOM
-        ], check=True)
+        ], stage="silva", subject=subject_id)
 
         # Step 2: Import BIOM file as a QIIME2 FeatureTable artifact
         print(f"Importing BIOM file {biom_file} into QIIME2...")
-        subprocess.run([
+        run_command([
             "qiime", "tools", "import",
             "--type", "FeatureTable[Frequency]",  # Specify QIIME2 artifact type
             "--input-path", biom_file,            # Path to the BIOM file
             "--output-path", feature_table        # Output QIIME2 FeatureTable artifact
-        ], check=True)
+        ], stage="silva", subject=subject_id)
 
         # Step 3: Classify OTUs using the SILVA taxonomy classifier
         print(f"Classifying OTUs for subject {subject_id} using SILVA...")
-        subprocess.run([
+        run_command([
             "qiime", "feature-classifier", "classify-sklearn",
             "--i-classifier", classifier_path,    # SILVA classifier artifact
             "--i-reads", rep_seq_path,            # Representative sequences artifact
             "--o-classification", taxonomy_output  # Output taxonomy classification artifact
-        ], check=True)
+        ], stage="silva", subject=subject_id)
 
         # Step 4: Export the taxonomy classification to a TSV file
         print(f"Exporting taxonomy for subject {subject_id}...")
-        subprocess.run([
+        run_command([
             "qiime", "tools", "export",
             "--input-path", taxonomy_output,  # QIIME2 taxonomy artifact
-            "--output-path", qiime_output_dir # Export directory
-        ], check=True)
+            "--output-path", export_dir       # Per-subject export directory
+        ], stage="silva", subject=subject_id)
+        os.replace(os.path.join(export_dir, "taxonomy.tsv"), taxonomy_export)
 
         print(f"Taxonomy mapping for subject {subject_id} saved to {taxonomy_export}.")
 
@@ -169,6 +182,12 @@ if __name__ == "__main__":
         help="Directory to store QIIME2 outputs (e.g., feature tables, taxonomy, and TSV exports)."
     )
 
+    # Optional subset of subjects (e.g. one subject per pipeline.py node)
+    parser.add_argument(
+        "-l", "--subject_ids", required=False, default=None, nargs="+",
+        help="Only process the OTU tables of these subject IDs (default: all)."
+    )
+
     # parser.add_argument(
     #    "-n", "--n_jobs", required=False, default=4, type=int,
     #    help="Number of jobs to run in parallel for taxonomy classification."
@@ -183,5 +202,6 @@ if __name__ == "__main__":
         rep_seq_path=args.rep_seq_path,
         classifier_path=args.classifier_path,
         qiime_output_dir=args.qiime_output_dir,
+        subject_ids=args.subject_ids,
         # n_jobs=args.n_jobs
     )
\ No newline at end of file
@@ -1,8 +1,5 @@
 #!/usr/bin/env bash
 
-# Load diet shorthand mappings from config file
-source diet_config.sh
-
 # Define arrays of parameters
 SUBJECT_IDS=("M02")
 DIETS=("vmh_eu_average_agora.qza" "western_diet_gut_agora.qza" "vmh_high_fiber_agora.qza" "vmh_high_fat_low_carb_agora.qza")
@@ -18,11 +15,9 @@ GROWTH_OUT_DIR="../data/growth_rates/"
 SOLVER="gurobi"
 THREADS=10
 
-# Function to get diet shorthand using environment variables
+# Function to get diet shorthand from diet_registry.csv
 get_diet_shorthand() {
-    local diet_key="DIET_SHORTHAND_${1%.qza}"
-    local shorthand="${!diet_key}"
-    echo "${shorthand:-${1%.qza}}"  # Fallback: Remove .qza if not found
+    python3 diet_registry.py shorthand "$1"  # Fallback (unregistered diet): file name without .qza
 }
 
 # Loop through all combinations
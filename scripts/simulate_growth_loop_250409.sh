@@ -5,9 +5,6 @@
 ## I also want to see if redoing the simulations with no other changes produces different results
 ## e.g. will the same parameter combos be ranked the same way and will the same genera be best predicted 
 
-# Load diet shorthand mappings from config file
-source diet_config.sh
-
 # Define arrays of parameters
 SUBJECT_IDS=("M02")
 DIETS=("vmh_eu_average_agora.qza" "western_diet_gut_agora.qza" "vmh_high_fiber_agora.qza" "vmh_high_fat_low_carb_agora.qza")
@@ -24,11 +21,9 @@ ADDED_METAB_DIR="../data/added_metabolites/"
 SOLVER="gurobi"
 THREADS=10
 
-# Function to get diet shorthand using environment variables
+# Function to get diet shorthand from diet_registry.csv
 get_diet_shorthand() {
-    local diet_key="DIET_SHORTHAND_${1%.qza}"
-    local shorthand="${!diet_key}"
-    echo "${shorthand:-${1%.qza}}"  # Fallback: Remove .qza if not found
+    python3 diet_registry.py shorthand "$1"  # Fallback (unregistered diet): file name without .qza
 }
 
 # Loop through all combinations
@@ -1,70 +1,11 @@
-import micom
 import os
-import pandas as pd
-import zipfile
 from pathlib import Path 
 import argparse
-from micom.workflows import build
-from micom import Community
-from micom.qiime_formats import load_qiime_medium
-from micom.workflows import grow, save_results, complete_community_medium 
 
 # Simulate growth rates for samples at each timepoint
 # need to do this for each subject id
 
 
-def load_subject_data(subject_id, qza_dir, collapse_on='genus'):
-    """
-    Load subject data and convert it to a MICOM-compatible format.
-    Parameters:
-    subject_id (str): The identifier for the subject.
-    qza_dir (str): The directory where the QIIME2 artifact files are located.
-    collapse_on (str, optional): The taxonomic level to collapse on. Default is 'genus'.
-    Returns:
-    micom.Community: A MICOM community object created from the subject's data.
-    """
-    
-    feature_table_fp = os.path.join(qza_dir, f"{subject_id}_feature_table.qza")
-    taxonomy_fp = os.path.join(qza_dir, f"{subject_id}_taxonomy.qza")
-    subject_micom = micom.taxonomy.qiime_to_micom(feature_table_fp,
-                                                  taxonomy_fp, 
-                                                  collapse_on=collapse_on)
-    
-    return subject_micom
-
-def add_suggested_metabolites(diet_og, diet_sugg, added_metab_out="added_metabolites.csv"):
-    """
-    This function takes in the original diet and the micom suggested (completed) diet 
-    and returns a new diet that includes the suggested metabolites 
-    without removing the original ones.
-    
-    Inputs: 
-    diet_og: pandas dataframe with the original diet
-    diet_sugg: pandas dataframe with the diet from micom complete_community_medium
-    output_folder: str, optional, directory where the added metabolites .csv file will be saved
-
-    Returns:
-    diet_new: pandas dataframe with the original and new nonzero elements of suggested diet
-    """
-
-    diet_og = diet_og.reset_index(drop=True)
-    diet_sugg = diet_sugg.reset_index(drop=True)
-
-    diet_merged = pd.merge(diet_og, diet_sugg, on=['reaction', 'metabolite'], how='outer', suffixes=('_og', '_sugg'))
-    diet_merged["flux_diff"] = diet_merged["flux_sugg"] - diet_merged["flux_og"]
-    added_metabolites = diet_merged[diet_merged["flux_diff"] > 0]
-    added_metabolites = added_metabolites[["reaction", "metabolite", "global_id", "flux_sugg"]]
-    added_metabolites = added_metabolites.rename(columns={"flux_sugg": "flux"})
-    #write the added metabolites to a csv file 
-    #print added_metabolites to a csv file
-    added_metabolites.to_csv(added_metab_out, index=False)
-    print(f"Added metabolites saved to {added_metab_out}")
-    #add added_metabolites to diet_og
-    diet_new = pd.concat([diet_og, added_metabolites], ignore_index=True)
-    #reindex diet_new
-    diet_new = diet_new.reset_index(drop=True)
-    return diet_new
-
 def compute_manifest_summary(pickled_gsmm_out):
     """
     Reads the manifest.csv file generated in 'build' and computes summary statistics (mean, median, min, max, and std)
@@ -74,6 +15,8 @@ def compute_manifest_summary(pickled_gsmm_out):
     Output: 
     manifest_summary.csv saved to the same folder as the manifest.csv
     """
+    import pandas as pd
+
     # Load the manifest.csv file
     manifest_fp = os.path.join(pickled_gsmm_out, "manifest.csv")
     manifest = pd.read_csv(manifest_fp)
@@ -97,61 +40,145 @@ def compute_manifest_summary(pickled_gsmm_out):
     summary_df.to_csv(summary_csv, index=False)
     print(f"Manifest summary statistics saved to {summary_csv}")
     
-def unzip_to_folder(growth_out_fp, out_folder):
-    """
-    Unzips the growth output file to the specified folder.
-    Parameters:
-    growth_out_fp (str): The path to the growth output file.
-    out_folder (str): The folder to unzip the file to.
-    """
-    # unzip the growth output .zip file and save contents to a folder by the same name
-    with zipfile.ZipFile(growth_out_fp, 'r') as zip_ref:
-        zip_ref.extractall(out_folder)
-
-
 def main(subject_id, qza_dir, 
          model_name, model_dir,
          pickled_gsmm_out, solver, 
          threads, diet_fp, 
          tradeoff, growth_out_fp, 
-         added_metab_out_dir):
+         added_metab_out_dir, min_coverage=None,
+         max_taxa=None, max_solve_time=None, solve_time_model_fp=None,
+         sample_timeout=None, fallback_solvers=("hybrid", "osqp"), solver_threads=None,
+         results_store=None, medium_completion="milp", compare_milp=0, query_index=None,
+         run_registry=None, rerun=False):
 
+    # Added 20261019 - imported here so `--help`, argument errors and the micom-ts CLI start
+    # without loading pandas, micom and the solver interfaces
+    import pandas as pd
+    from diet_registry import resolve_diet, diet_shorthand as registered_diet_shorthand
+    from sweep_scheduler import model_shorthand
+    from run_registry import run_parameters, run_hash, find_run, start_run, finish_run
     
     model_fp = os.path.join(model_dir, model_name)
     model_extract_fp = os.path.join(model_dir, Path(model_name).stem)
 
-    subject_micom = load_subject_data(subject_id, qza_dir)
+    # Added 20261019 - skip configurations that were already run, keyed by a hash of all inputs
+    if run_registry is not None:
+        run_params = run_parameters(run_registry,
+                                    os.path.join(qza_dir, f"{subject_id}_feature_table.qza"),
+                                    os.path.join(qza_dir, f"{subject_id}_taxonomy.qza"),
+                                    model_fp, resolve_diet(diet_fp)[0], solver, tradeoff,
+                                    min_coverage=min_coverage, max_taxa=max_taxa, max_solve_time=max_solve_time,
+                                    solve_time_model_fp=solve_time_model_fp, sample_timeout=sample_timeout,
+                                    fallback_solvers=fallback_solvers if sample_timeout is not None else None,
+                                    medium_completion=medium_completion,
+                                    destination=os.path.abspath(results_store if results_store is not None
+                                                                else growth_out_fp))
+        this_run = run_hash(run_params)
+        existing = find_run(run_registry, this_run) if not rerun else None
+        if existing is not None:
+            print(f"Run {this_run[:12]} was already completed on {pd.Timestamp(existing['finished'], unit='s'):%Y-%m-%d}; "
+                  f"returning its outputs:")
+            for name, fp in existing["outputs"].items():
+                print(f"  {name}: {fp}")
+            return existing["outputs"]
+        start_run(run_registry, this_run, run_params,
+                  {"subject_id": subject_id, "model_db": model_shorthand(model_name), "solver": solver,
+                   "diet": registered_diet_shorthand(diet_fp), "tradeoff": tradeoff})
+
+    # micom and the solvers are only loaded once we know the run has to be done
+    from micom.workflows import build, grow, save_results, complete_community_medium
+    from grow_helpers import load_subject_data, add_suggested_metabolites, unzip_to_folder
+    from estimate_model_coverage import filter_covered_samples, load_model_db_manifest
+    from adaptive_cutoff import load_solve_time_model, max_taxa_for_budget, choose_sample_cutoffs, apply_sample_cutoffs
+    from robust_grow import build_attempts, grow_with_timeouts
+    from results_store import sample_writer, read_table, partition_dir
+    from fast_medium import complete_community_medium_fast, summarize_report
+    from diet_registry import load_diet
+    from query_index import register_run, register_manifest, register_added_metabolites
+
+    # Added 20261019 - structured telemetry (no-op unless MICOM_TS_TRACE is set, see telemetry.py)
+    from telemetry import span
+    labels = {"subject": subject_id, "model_db": model_shorthand(model_name), "solver": solver}
+
+    with span("load subject", stage="grow", **labels):
+        subject_micom = load_subject_data(subject_id, qza_dir)
 
-    diet_og = load_qiime_medium(diet_fp)
+    # Added 20261019 - skip samples the model database cannot represent before building
+    if min_coverage is not None:
+        subject_micom, coverage = filter_covered_samples(subject_micom, model_fp, min_coverage)
+        os.makedirs(pickled_gsmm_out, exist_ok=True)
+        coverage_csv = os.path.join(pickled_gsmm_out, "coverage_precheck.csv")
+        coverage.to_csv(coverage_csv, index=False)
+        print(f"Skipping {coverage['skipped'].sum()} of {len(coverage)} samples below {min_coverage} coverage "
+              f"(see {coverage_csv})")
+        if subject_micom.empty:
+            print(f"No samples of subject {subject_id} reach {min_coverage} coverage in {model_name}. Nothing to build.")
+            if run_registry is not None:
+                finish_run(run_registry, this_run, {"coverage_precheck": coverage_csv}, status="skipped")
+            return
+
+    # Added 20261019 - per-sample abundance cutoffs to keep each model within a size/solve time budget
+    if max_taxa is not None or max_solve_time is not None:
+        solve_time_model = load_solve_time_model(solve_time_model_fp) if solve_time_model_fp else None
+        n_max = max_taxa_for_budget(max_taxa, max_solve_time, solve_time_model)
+        # only taxa with a model in the database count against the budget (as in calibrate)
+        cutoff_plan = choose_sample_cutoffs(subject_micom, n_max, solve_time_model=solve_time_model,
+                                            db_manifest=load_model_db_manifest(model_fp))
+        subject_micom = apply_sample_cutoffs(subject_micom, cutoff_plan)
+        os.makedirs(pickled_gsmm_out, exist_ok=True)
+        cutoff_csv = os.path.join(pickled_gsmm_out, "adaptive_cutoffs.csv")
+        cutoff_plan.to_csv(cutoff_csv, index=False)
+        print(f"Adaptive cutoffs keep at most {n_max} taxa per sample; "
+              f"median dropped abundance {cutoff_plan['dropped_abundance'].median():.4f} (see {cutoff_csv})")
+
+    # Added 20261019 - parsed once per diet through the registry cache
+    diet_og = load_diet(diet_fp)
     #reindex diet_og to be row numbers [0:len(diet_og)]
     diet_og = diet_og.reset_index(drop=True)
 
     
-    manifest = build(subject_micom,
-                    out_folder=pickled_gsmm_out,
-                    model_db=model_fp,
-                    solver=solver,
-                    threads=threads)
+    with span("build", stage="grow", n_samples=subject_micom.sample_id.nunique(), **labels):
+        manifest = build(subject_micom,
+                        out_folder=pickled_gsmm_out,
+                        model_db=model_fp,
+                        solver=solver,
+                        threads=threads)
     
     compute_manifest_summary(pickled_gsmm_out)
     
-    diet_sugg = complete_community_medium(manifest, 
-                                        model_folder=pickled_gsmm_out, 
-                                        medium=diet_og, 
-                                        community_growth=0.1, 
-                                        min_growth=0.001, 
-                                        minimize_components=True,
-                                        max_import=1, 
-                                        threads=threads)
+    if medium_completion == "milp":
+        with span("complete medium", stage="grow", strategy="milp", **labels):
+            diet_sugg = complete_community_medium(manifest, 
+                                                model_folder=pickled_gsmm_out, 
+                                                medium=diet_og, 
+                                                community_growth=0.1, 
+                                                min_growth=0.001, 
+                                                minimize_components=True,
+                                                max_import=1, 
+                                                threads=threads)
+    else:
+        # Added 20261019 - LP relaxation (+ greedy rounding) instead of the MILP, checked for feasibility
+        with span("complete medium", stage="grow", strategy=medium_completion, **labels):
+            diet_sugg, completion_report = complete_community_medium_fast(manifest,
+                                                                          model_folder=pickled_gsmm_out,
+                                                                          medium=diet_og,
+                                                                          community_growth=0.1,
+                                                                          min_growth=0.001,
+                                                                          max_import=1,
+                                                                          strategy=medium_completion,
+                                                                          compare_milp=compare_milp,
+                                                                          threads=threads)
+        report_csv = os.path.join(pickled_gsmm_out, f"medium_completion_{Path(diet_fp).stem}.csv")
+        completion_report.to_csv(report_csv, index=False)
+        summarize_report(completion_report)
+        print(f"Medium completion report saved to {report_csv}")
     diet_sugg = diet_sugg.reset_index(drop=True)
 
     # Added 20250410 - Build a unique filename for the added metabolites CSV
     os.makedirs(added_metab_out_dir, exist_ok=True)
-    # Get the stem for the diet file (e.g., "western_diet_gut_agora")
-    diet_stem = Path(diet_fp).stem
-    # Get the shorthand using the environment variable set in diet_config.sh.
-    # If the environment variable is not found, default to the original diet stem.
-    diet_shorthand = os.getenv(f"DIET_SHORTHAND_{diet_stem}", diet_stem)
+    # Get the shorthand from diet_registry.csv (e.g., "wd" for western_diet_gut_agora.qza).
+    # If the diet is not registered, default to the original diet stem.
+    diet_shorthand = registered_diet_shorthand(diet_fp)
 
     # Build a unique and shorter filename using the shorthand
     added_metab_filename = f"added_metabolites_{subject_id}_{Path(model_name).stem}_{diet_shorthand}.csv"
@@ -161,13 +188,67 @@ def main(subject_id, qza_dir,
                                          diet_sugg,
                                          added_metab_out=added_metab_file)
 
-    growth = grow(manifest, pickled_gsmm_out, 
-                  medium=diet_new, tradeoff=tradeoff, 
-                  threads=threads, presolve=True)
-    save_results(growth, growth_out_fp)
+    if sample_timeout is None and results_store is None:
+        with span("grow", stage="grow", tradeoff=tradeoff, **labels):
+            growth = grow(manifest, pickled_gsmm_out, 
+                          medium=diet_new, tradeoff=tradeoff, 
+                          threads=threads, presolve=True)
+    else:
+        # Added 20261019 - per-sample time budget with fallback solvers so slow samples can't hold up the batch
+        attempts = build_attempts(solver, fallback_solvers if sample_timeout is not None else (),
+                                  solver_threads=solver_threads)
+        on_result = None
+        if results_store is not None:
+            # Added 20261019 - stream each solved sample to the Parquet store instead of holding the run in memory
+            on_result = sample_writer(results_store, subject_id, model_shorthand(model_name),
+                                      solver, diet_shorthand, tradeoff)
+        with span("grow", stage="grow", tradeoff=tradeoff, **labels):
+            growth, attempts_log = grow_with_timeouts(manifest, pickled_gsmm_out,
+                                                      medium=diet_new, tradeoff=tradeoff,
+                                                      attempts=attempts, sample_timeout=sample_timeout,
+                                                      threads=threads, on_result=on_result)
+        if growth_out_fp is not None:
+            attempts_csv = growth_out_fp.replace(".zip", "_attempts.csv")
+        else:
+            attempts_csv = os.path.join(pickled_gsmm_out, f"attempts_{diet_shorthand}_{tradeoff}.csv")
+        attempts_log.to_csv(attempts_csv, index=False)
+        print(f"Solver attempts per sample saved to {attempts_csv}")
+
+    if results_store is not None:
+        print(f"Growth results saved to {results_store}")
+    else:
+        with span("save results", stage="grow", **labels):
+            save_results(growth, growth_out_fp)
+
+        #unzip the growth output .zip file and save contents to a folder by the same name
+        unzip_to_folder(growth_out_fp, growth_out_fp.replace(".zip", ""))
 
-    #unzip the growth output .zip file and save contents to a folder by the same name
-    unzip_to_folder(growth_out_fp, growth_out_fp.replace(".zip", ""))
+    # Added 20261019 - register the run, manifest and added metabolites in the SQL query index
+    if query_index:
+        if results_store is not None:
+            growth_rates = read_table(results_store, "growth_rates", subject_id=subject_id,
+                                      model_db=model_shorthand(model_name), solver=solver,
+                                      diet=diet_shorthand, tradeoff=tradeoff)
+        else:
+            growth_rates = growth.growth_rates
+        register_run(query_index, growth_rates, subject_id, model_shorthand(model_name), solver,
+                     diet_shorthand, tradeoff, source=results_store or growth_out_fp)
+        register_manifest(query_index, os.path.join(pickled_gsmm_out, "manifest.csv"), subject_id)
+        register_added_metabolites(query_index, added_metab_file, subject_id, Path(model_name).stem, diet_shorthand)
+        print(f"Run registered in {query_index}")
+
+    outputs = {"growth_out_fp": None if results_store is not None else growth_out_fp,
+               "growth_dir": None if results_store is not None else growth_out_fp.replace(".zip", ""),
+               "results_store": None if results_store is None else
+               partition_dir(results_store, "growth_rates",
+                             {"subject_id": subject_id, "model_db": model_shorthand(model_name), "solver": solver,
+                              "diet": diet_shorthand, "tradeoff": tradeoff}),
+               "added_metabolites": added_metab_file,
+               "pickled_gsmm_out": pickled_gsmm_out}
+    if run_registry is not None:
+        finish_run(run_registry, this_run, outputs)
+        print(f"Run {this_run[:12]} recorded in {run_registry}")
+    return outputs
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Build and grow MICOM growth models")
@@ -204,19 +285,82 @@ if __name__ == "__main__":
                         type=float,
                         help="Cooperative tradeoff (value between 0-1)")
     parser.add_argument("--growth_out_fp", 
-                        required=True, 
-                        help="Path for output growth.zip from micom grow()")
+                        default=None, 
+                        help="Path for output growth.zip from micom grow() (required unless --results_store is used)")
     parser.add_argument("--added_metab_out_dir",
                         required=True, 
                         help="Directory to save the added metabolites .csv file")
+    parser.add_argument("--min_coverage",
+                        type=float,
+                        default=None,
+                        help="Skip samples whose estimated found_abundance_fraction is below this value (e.g. 0.5)")
+    parser.add_argument("--max_taxa",
+                        type=int,
+                        default=None,
+                        help="Choose a per-sample abundance cutoff that keeps at most this many taxa "
+                             "(use a separate --pickled_gsmm_out from unpruned runs)")
+    parser.add_argument("--max_solve_time",
+                        type=float,
+                        default=None,
+                        help="Choose a per-sample abundance cutoff that keeps the estimated solve time "
+                             "below this many seconds (requires --solve_time_model)")
+    parser.add_argument("--solve_time_model",
+                        default=None,
+                        help="solve_time_model.json written by adaptive_cutoff.py calibrate")
+    parser.add_argument("--sample_timeout",
+                        type=float,
+                        default=None,
+                        help="Wall-clock budget per sample and attempt in grow() (seconds); "
+                             "slow or failed samples are retried with --fallback_solvers")
+    parser.add_argument("--fallback_solvers",
+                        nargs="*",
+                        default=["hybrid", "osqp"],
+                        help="Solvers tried in order (with relaxed tolerances) after --solver fails or times out")
+    parser.add_argument("--solver_threads",
+                        type=int,
+                        default=None,
+                        help="Threads for gurobi/cplex in each grow() worker (used with --sample_timeout)")
+    parser.add_argument("--results_store",
+                        default=None,
+                        help="Stream results sample by sample to this partitioned Parquet store instead of growth.zip + unzipped folder")
+    parser.add_argument("--medium_completion",
+                        default="milp",
+                        choices=["milp", "lp", "greedy"],
+                        help="Medium completion: micom's MILP, or the faster LP relaxation with rounding (lp) "
+                             "plus greedy pruning (greedy)")
+    parser.add_argument("--compare_milp",
+                        type=int,
+                        default=0,
+                        help="With --medium_completion lp/greedy, also solve the MILP for this many samples "
+                             "and report the extra components")
+    parser.add_argument("--query_index",
+                        default="../data/query_index.sqlite",
+                        help="SQLite query index to register the run's outputs in")
+    parser.add_argument("--no_query_index",
+                        action="store_true",
+                        help="Do not register the run's outputs in the query index")
+    parser.add_argument("--run_registry",
+                        default=None,
+                        help="Run registry (e.g. ../data/run_registry.sqlite); runs whose inputs hash to a "
+                             "completed run return its outputs instead of running again")
+    parser.add_argument("--rerun",
+                        action="store_true",
+                        help="With --run_registry, run even if an identical run is already registered")
     
 
     args = parser.parse_args()
+    if args.growth_out_fp is None and args.results_store is None:
+        parser.error("one of --growth_out_fp or --results_store is required")
 
     main(args.subject_id, args.qza_dir, 
         args.model_name, args.model_dir,
         args.pickled_gsmm_out, args.solver, 
         args.threads, args.diet_fp, 
         args.tradeoff, args.growth_out_fp, 
-        args.added_metab_out_dir)
+        args.added_metab_out_dir, args.min_coverage,
+        args.max_taxa, args.max_solve_time, args.solve_time_model,
+        args.sample_timeout, args.fallback_solvers, args.solver_threads,
+        args.results_store, args.medium_completion, args.compare_milp,
+        None if args.no_query_index else args.query_index,
+        args.run_registry, args.rerun)
 
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Shared Work Queue for Simulation Sweeps
+---------------------------------------
+
+Purpose:
+Lets any number of worker processes, on any number of hosts, share one simulation sweep.
+The (subject, model database, diet, tradeoff) matrix is written once to a SQLite queue file
+on shared storage; workers claim a job, run simulate_growth_rates_edited.py for it and commit
+the result atomically. There is no broker or server: SQLite's file locking is the only
+coordination. Every claim carries a lease that the worker renews while the job runs, so
+jobs of workers that die (node crash, kill -9, walltime limit) are picked up again once
+their lease has expired.
+
+Workflow:
+1. `init`: expand the sweep matrix (same names as simulate_growth_loop.sh) into the queue.
+2. `worker`: claim the next pending (or expired) job, run it, renew the lease every
+   lease/3 seconds, record the return code, repeat until the queue is drained.
+3. `status`: show job counts by status, running jobs with their worker and lease, and failures.
+4. `reset`: put failed (or all unfinished) jobs back to pending.
+
+Jobs that share a pickled model folder are never claimed at the same time until one of
+them has finished, so every subject's models are built exactly once.
+
+Notes:
+- Start workers from the scripts/ folder (job commands use paths relative to it).
+- The queue uses SQLite's default rollback journal (not WAL) so that it works on NFS and
+  other shared file systems that support POSIX locks.
+- For a local test run several workers with `--launcher echo`, which prints each job's
+  command instead of running it.
+
+Usage:
+    python sweep_queue.py init --queue_db ../data/sweep_queue.sqlite \
+        --subject_ids F01 M01 M02 --model_names agora201_refseq216_genus_1.qza \
+        --diets vmh_eu_average_agora.qza western_diet_gut_agora.qza \
+        --tradeoffs 0.1 0.2 0.3 0.4 0.5 0.6 0.7 0.8 0.9 1.0 --solver gurobi --threads 10
+    python sweep_queue.py worker --queue_db ../data/sweep_queue.sqlite   # on every node
+    python sweep_queue.py status --queue_db ../data/sweep_queue.sqlite
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shlex
+import socket
+import sqlite3
+import argparse
+import threading
+import subprocess
+from sweep_scheduler import build_job_matrix, job_argv, pinned_env, script_env
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    subject_id TEXT,
+    model_db TEXT,
+    diet TEXT,
+    tradeoff REAL,
+    build_group TEXT,
+    argv TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_token TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    started REAL,
+    finished REAL,
+    returncode INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+CREATE INDEX IF NOT EXISTS jobs_build_group ON jobs (build_group);
+"""
+
+# a job is claimable if it is pending, or running with an expired lease, and no unexpired job
+# of the same pickled model folder is running (unless that folder has already been built)
+CLAIM_SQL = """
+SELECT job_id FROM jobs AS j
+WHERE (j.status = 'pending' OR (j.status = 'running' AND j.lease_expires < :now))
+  AND j.attempts < :max_attempts
+  AND (EXISTS (SELECT 1 FROM jobs AS d WHERE d.build_group = j.build_group AND d.status = 'done')
+       OR NOT EXISTS (SELECT 1 FROM jobs AS r WHERE r.build_group = j.build_group
+                      AND r.job_id != j.job_id AND r.status = 'running' AND r.lease_expires >= :now))
+ORDER BY j.attempts, j.rowid
+LIMIT 1
+"""
+
+
+def connect(queue_db):
+    """
+    Open the queue database (created if needed) with a generous lock timeout.
+    """
+    con = sqlite3.connect(queue_db, timeout=60, isolation_level=None)
+    con.row_factory = sqlite3.Row
+    con.executescript(SCHEMA)
+    return con
+
+
+def init_queue(queue_db, jobs, threads, extra_args=()):
+    """
+    Write the jobs of a sweep to the queue. Jobs already in the queue are left untouched.
+
+    Returns:
+    int: Number of new jobs added.
+    """
+    con = connect(queue_db)
+    rows = [(job["job_id"], job["subject_id"], job["model_db"], job["diet_short"], job["tradeoff"],
+             job["pickled_gsmm_out"], json.dumps(job_argv(job, threads, extra_args)[1:]))
+            for job in jobs.to_dict("records")]
+    con.execute("BEGIN IMMEDIATE")
+    before = con.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+    con.executemany("INSERT OR IGNORE INTO jobs (job_id, subject_id, model_db, diet, tradeoff, build_group, argv) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    after = con.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+    con.execute("COMMIT")
+    con.close()
+    return after - before
+
+
+def claim_job(con, worker, lease_seconds, max_attempts):
+    """
+    Atomically claim the next job for a worker.
+
+    Returns:
+    tuple: (job row, lease token), or (None, None) if nothing can be claimed right now.
+    """
+    now = time.time()
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        row = con.execute(CLAIM_SQL, {"now": now, "max_attempts": max_attempts}).fetchone()
+        if row is None:
+            con.execute("COMMIT")
+            return None, None
+        token = uuid.uuid4().hex
+        con.execute("UPDATE jobs SET status = 'running', worker = ?, lease_token = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, started = ?, finished = NULL, returncode = NULL WHERE job_id = ?",
+                    (worker, token, now + lease_seconds, now, row["job_id"]))
+        job = con.execute("SELECT * FROM jobs WHERE job_id = ?", (row["job_id"],)).fetchone()
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return job, token
+
+
+def renew_lease(queue_db, job_id, token, lease_seconds, stop):
+    """
+    Renew a job's lease every lease_seconds / 3 until `stop` is set (runs in a thread).
+    """
+    con = connect(queue_db)
+    while not stop.wait(lease_seconds / 3):
+        con.execute("UPDATE jobs SET lease_expires = ? WHERE job_id = ? AND lease_token = ?",
+                    (time.time() + lease_seconds, job_id, token))
+    con.close()
+
+
+def finish_job(con, job_id, token, returncode):
+    """
+    Record the result of a job, but only if this worker still holds its lease.
+
+    Returns:
+    bool: False if the lease was lost (the job was reclaimed by another worker).
+    """
+    status = "done" if returncode == 0 else "failed"
+    cur = con.execute("UPDATE jobs SET status = ?, returncode = ?, finished = ?, lease_expires = NULL "
+                      "WHERE job_id = ? AND lease_token = ?",
+                      (status, returncode, time.time(), job_id, token))
+    return cur.rowcount == 1
+
+
+def run_worker(queue_db, lease_seconds=600, max_attempts=3, max_jobs=None, idle_wait=30,
+               launcher=None, solver_threads=None):
+    """
+    Claim and run jobs until the queue has nothing left to do (or max_jobs have run).
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    env = pinned_env(solver_threads) if solver_threads else script_env()
+    con = connect(queue_db)
+    n_run = 0
+    while max_jobs is None or n_run < max_jobs:
+        job, token = claim_job(con, worker, lease_seconds, max_attempts)
+        if job is None:
+            remaining = con.execute("SELECT COUNT(*) FROM jobs WHERE attempts < ? AND "
+                                    "(status = 'pending' OR status = 'running')", (max_attempts,)).fetchone()[0]
+            if remaining == 0:
+                break
+            # other workers are running the rest (or building shared models); wait for them
+            time.sleep(idle_wait)
+            continue
+
+        argv = json.loads(job["argv"])
+        cmd = (shlex.split(launcher) if launcher else [sys.executable]) + argv
+        print(f"[{worker}] Running {job['job_id']} (attempt {job['attempts']})...", flush=True)
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=renew_lease, args=(queue_db, job["job_id"], token, lease_seconds, stop),
+                                     daemon=True)
+        heartbeat.start()
+        try:
+            returncode = subprocess.run(cmd, env=env).returncode
+        finally:
+            stop.set()
+            heartbeat.join()
+        if finish_job(con, job["job_id"], token, returncode):
+            print(f"[{worker}] {'Completed' if returncode == 0 else 'FAILED'}: {job['job_id']}", flush=True)
+        else:
+            print(f"[{worker}] Lease on {job['job_id']} was lost; result not recorded.", flush=True)
+        n_run += 1
+    con.close()
+    print(f"[{worker}] No more jobs to claim; ran {n_run} job(s).")
+
+
+def queue_status(queue_db):
+    """
+    Print job counts by status, running jobs and failures.
+    """
+    con = connect(queue_db)
+    now = time.time()
+    print("Jobs by status:")
+    for row in con.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status ORDER BY status"):
+        print(f"  {row['status']:<8} {row['n']}")
+    running = con.execute("SELECT job_id, worker, lease_expires, started FROM jobs WHERE status = 'running' "
+                          "ORDER BY started").fetchall()
+    if running:
+        print("Running:")
+        for row in running:
+            lease = row["lease_expires"] - now
+            state = f"lease {lease:.0f}s left" if lease >= 0 else f"LEASE EXPIRED {-lease:.0f}s ago"
+            print(f"  {row['job_id']} on {row['worker']}, {now - row['started']:.0f}s, {state}")
+    failed = con.execute("SELECT job_id, worker, attempts, returncode FROM jobs WHERE status = 'failed'").fetchall()
+    if failed:
+        print("Failed:")
+        for row in failed:
+            print(f"  {row['job_id']} (attempts {row['attempts']}, exit code {row['returncode']}, last worker {row['worker']})")
+    con.close()
+
+
+def reset_jobs(queue_db, all_unfinished=False):
+    """
+    Put failed jobs (or every job that is not done) back to pending with zero attempts.
+    """
+    con = connect(queue_db)
+    where = "status != 'done'" if all_unfinished else "status = 'failed'"
+    cur = con.execute(f"UPDATE jobs SET status = 'pending', attempts = 0, worker = NULL, lease_token = NULL, "
+                      f"lease_expires = NULL WHERE {where}")
+    print(f"Reset {cur.rowcount} job(s) to pending.")
+    con.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distribute a simulation sweep over workers through a shared SQLite queue")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    queue = argparse.ArgumentParser(add_help=False)
+    queue.add_argument("--queue_db", required=True, help="Path to the queue file on shared storage")
+
+    init_parser = subparsers.add_parser("init", parents=[queue], help="Write the sweep matrix to the queue")
+    init_parser.add_argument("--subject_ids", required=True, nargs="+", help="Subject IDs to simulate")
+    init_parser.add_argument("--model_names", required=True, nargs="+", help="Model database .qza files")
+    init_parser.add_argument("--diets", required=True, nargs="+", help="Diet .qza files in --diet_dir")
+    init_parser.add_argument("--tradeoffs", required=True, nargs="+", type=float, help="Cooperative tradeoff values")
+    init_parser.add_argument("--solver", default="gurobi", help="Specify solver (e.g. osqp, gurobi, cplex)")
+    init_parser.add_argument("--threads", type=int, default=1, help="Sample workers per job")
+    init_parser.add_argument("--pickled_dir", default="../data/pickled_models/", help="Parent folder for pickled models")
+    init_parser.add_argument("--diet_dir", default="../data/diets/", help="Folder containing the diet .qza files")
+    init_parser.add_argument("--growth_out_dir", default="../data/growth_rates/", help="Folder for growth_*.zip outputs")
+    init_parser.add_argument("--added_metab_dir", default="../data/added_metabolites/",
+                             help="Folder for added metabolites .csv files")
+    init_parser.add_argument("--extra_args", default="",
+                             help="Extra simulate_growth_rates_edited.py arguments, e.g. \"--sample_timeout 1800\"")
+
+    worker_parser = subparsers.add_parser("worker", parents=[queue], help="Claim and run jobs until the queue is drained")
+    worker_parser.add_argument("--lease_seconds", type=float, default=600,
+                               help="Lease length; a job is reclaimed this long after its worker stops renewing it")
+    worker_parser.add_argument("--max_attempts", type=int, default=3, help="Give up on a job after this many claims")
+    worker_parser.add_argument("--max_jobs", type=int, default=None, help="Stop after running this many jobs")
+    worker_parser.add_argument("--idle_wait", type=float, default=30,
+                               help="Seconds to wait when all remaining jobs are claimed by other workers")
+    worker_parser.add_argument("--launcher", default=None,
+                               help="Command used instead of the Python interpreter (e.g. \"echo\" for a dry run)")
+    worker_parser.add_argument("--solver_threads", type=int, default=None, help="Pin BLAS/OpenMP threads per job")
+
+    subparsers.add_parser("status", parents=[queue], help="Show the state of the queue")
+
+    reset_parser = subparsers.add_parser("reset", parents=[queue], help="Requeue failed jobs")
+    reset_parser.add_argument("--all_unfinished", action="store_true",
+                              help="Requeue every job that is not done (use only when no workers are running)")
+
+    args = parser.parse_args()
+
+    if args.command == "init":
+        jobs = build_job_matrix(args.subject_ids, args.model_names, args.diets, args.tradeoffs, args.solver,
+                                args.pickled_dir, args.diet_dir, args.growth_out_dir, args.added_metab_dir)
+        added = init_queue(args.queue_db, jobs, args.threads, shlex.split(args.extra_args))
+        print(f"Added {added} of {len(jobs)} jobs to {args.queue_db}")
+    elif args.command == "worker":
+        run_worker(args.queue_db, args.lease_seconds, args.max_attempts, args.max_jobs,
+                   args.idle_wait, args.launcher, args.solver_threads)
+    elif args.command == "status":
+        queue_status(args.queue_db)
+    else:
+        reset_jobs(args.queue_db, args.all_unfinished)
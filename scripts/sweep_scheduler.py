@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Memory- and CPU-Aware Scheduler for Simulation Sweeps
+-----------------------------------------------------
+
+Purpose:
+`simulate_growth_loop.sh` runs every (subject, diet, tradeoff) job one after another and
+passes `THREADS=10` to both `build()` and `grow()`, while BLAS and solver threads inside
+each MICOM worker are left uncontrolled (gurobi uses every core by default). This script
+runs the same sweep as a set of packed jobs: it estimates the memory of every job from the
+size of its community models, chooses how many jobs to run side by side and how many
+sample workers (`--threads`) each job gets, pins BLAS/OpenMP and solver threads, and only
+starts a job when the estimated (and observed) memory of all running jobs stays under a cap.
+
+Workflow:
+1. Expand the (subject, model database, diet, tradeoff) matrix into jobs with the same
+   output names as simulate_growth_loop.sh.
+2. Estimate per-sample memory from the model size (found taxa in an existing manifest.csv
+   or coverage table, otherwise --default_taxa).
+3. Choose the process-level (parallel jobs) vs. sample-level (threads per job) split that
+   uses the most cores without exceeding the memory cap.
+4. Launch jobs with pinned threads. Jobs sharing a pickled model folder wait for the first
+   one, so models are built once and never by two jobs at the same time.
+5. Record start/end time, return code and peak RSS of every job in `schedule_log.csv`.
+
+Inputs:
+- The same parameters as simulate_growth_loop.sh (subjects, model databases, diets, tradeoffs).
+
+Outputs:
+- growth_*.zip results from simulate_growth_rates_edited.py.
+- `schedule_log.csv`: one row per job with the chosen threads, estimated and peak memory.
+
+Usage:
+    python sweep_scheduler.py \
+        --subject_ids F01 M01 M02 \
+        --model_names agora201_refseq216_genus_1.qza \
+        --diets vmh_eu_average_agora.qza western_diet_gut_agora.qza \
+        --tradeoffs 0.1 0.3 0.5 0.7 0.9 \
+        --solver gurobi --mem_cap_gb 64 --dry_run
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import sys
+import time
+import argparse
+import itertools
+import subprocess
+from pathlib import Path
+import pandas as pd
+
+from diet_registry import diet_shorthand
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# fallback chain of simulate_growth_rates_edited.py when --fallback_solvers is not given
+DEFAULT_FALLBACK_SOLVERS = ["hybrid", "osqp"]
+# environment variables read by BLAS/OpenMP libraries used by numpy and the solvers
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                   "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"]
+
+
+def model_shorthand(model_name):
+    """
+    Get the model database label used in result names (e.g. agora201_refseq216_genus_1.qza -> agora201).
+    """
+    return Path(model_name).stem.split("_")[0]
+
+
+def tradeoff_shorthand(tradeoff):
+    """
+    Convert a tradeoff to the two-digit label used in result names (0.1 -> 01, 1.0 -> 10).
+    """
+    return f"{int(round(float(tradeoff) * 10)):02d}"
+
+
+def build_job_matrix(subject_ids, model_names, diets, tradeoffs, solver,
+                     pickled_dir="../data/pickled_models/", diet_dir="../data/diets/",
+                     growth_out_dir="../data/growth_rates/", added_metab_dir="../data/added_metabolites/"):
+    """
+    Expand the sweep parameters into one job per (subject, model database, diet, tradeoff).
+
+    Output names follow simulate_growth_loop.sh, e.g. growth_F01_agora201_gurobi_wd_03.zip.
+
+    Returns:
+    pandas.DataFrame: One row per job with its parameters and output paths.
+    """
+    jobs = []
+    for subject_id, model_name, diet, tradeoff in itertools.product(subject_ids, model_names, diets, tradeoffs):
+        db = model_shorthand(model_name)
+        run_name = f"growth_{subject_id}_{db}_{solver}_{diet_shorthand(diet)}_{tradeoff_shorthand(tradeoff)}"
+        jobs.append({"job_id": run_name,
+                     "subject_id": subject_id,
+                     "model_name": model_name,
+                     "model_db": db,
+                     "solver": solver,
+                     "diet": diet,
+                     "diet_short": diet_shorthand(diet),
+                     "tradeoff": float(tradeoff),
+                     "diet_fp": os.path.join(diet_dir, diet),
+                     "pickled_gsmm_out": os.path.join(pickled_dir, f"pickled_{subject_id}_{db}_{solver}"),
+                     "growth_out_fp": os.path.join(growth_out_dir, f"{run_name}.zip"),
+                     "added_metab_out_dir": added_metab_dir})
+    return pd.DataFrame(jobs)
+
+
+def job_argv(job, threads, extra_args=()):
+    """
+    Build the simulate_growth_rates_edited.py command line for one job.
+    """
+    # run as a module so jobs work from the scripts folder and with the installed package
+    return [sys.executable, "-m", "simulate_growth_rates_edited",
+            "--subject_id", job["subject_id"],
+            "--model_name", job["model_name"],
+            "--pickled_gsmm_out", job["pickled_gsmm_out"],
+            "--solver", job["solver"],
+            "--threads", str(threads),
+            "--diet_fp", job["diet_fp"],
+            "--tradeoff", str(job["tradeoff"]),
+            "--growth_out_fp", job["growth_out_fp"],
+            "--added_metab_out_dir", job["added_metab_out_dir"]] + list(extra_args)
+
+
+def script_env():
+    """
+    Copy of the current environment in which `python -m <script>` finds the scripts from any
+    folder (they are not top-level modules of the installed package).
+    """
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.pathsep.join([SCRIPT_DIR] + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else []))
+    return env
+
+
+def pinned_env(solver_threads=1):
+    """
+    Copy of the current environment with BLAS/OpenMP threads pinned (see `script_env`).
+    """
+    env = script_env()
+    for var in THREAD_ENV_VARS:
+        env[var] = str(solver_threads)
+    return env
+
+
+def host_resources():
+    """
+    Get the usable cores and total memory (MB) of this host.
+    """
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    mem_total_mb = None
+    with open("/proc/meminfo") as fh:
+        for line in fh:
+            if line.startswith("MemTotal:"):
+                mem_total_mb = int(line.split()[1]) / 1024
+                break
+    return cores, mem_total_mb
+
+
+def estimate_sample_taxa(job, default_taxa=100, coverage=None):
+    """
+    Estimate the largest number of taxa in any community model of a job.
+
+    Uses the manifest.csv of an existing pickled model folder, then a coverage table from
+    estimate_model_coverage.py, then default_taxa.
+    """
+    manifest_fp = os.path.join(job["pickled_gsmm_out"], "manifest.csv")
+    if os.path.exists(manifest_fp):
+        return int(pd.read_csv(manifest_fp)["found_taxa"].max())
+    if coverage is not None:
+        hits = coverage[(coverage["subject_id"] == job["subject_id"]) &
+                        (coverage["model_db"] == Path(job["model_name"]).stem)]
+        if len(hits) > 0:
+            return int(hits["found_taxa"].max())
+    return default_taxa
+
+
+def estimate_job_memory(n_taxa, threads, mem_per_taxon_mb=10, base_mem_mb=500):
+    """
+    Estimate the peak memory (MB) of one job: a base process plus one community model per worker.
+    """
+    return base_mem_mb + threads * n_taxa * mem_per_taxon_mb
+
+
+def choose_split(n_jobs, cores, mem_cap_mb, n_taxa, max_threads, mem_per_taxon_mb=10, base_mem_mb=500):
+    """
+    Choose how many jobs to run at once and how many sample workers each job gets.
+
+    Tries every threads-per-job value and keeps the one that keeps the most cores busy within
+    the memory cap; ties go to more jobs with fewer threads, since a job's sample workers sit
+    idle while its slowest sample finishes.
+
+    Parameters:
+    n_jobs (int): Number of jobs in the sweep.
+    cores (int): Usable cores on this host.
+    mem_cap_mb (float): Peak memory allowed for all running jobs.
+    n_taxa (int): Largest number of taxa per community model.
+    max_threads (int): Upper limit of workers per job (e.g. the number of samples per subject).
+
+    Returns:
+    tuple: (parallel_jobs, threads_per_job)
+    """
+    best = (1, 1)
+    best_busy = 0
+    for threads in range(1, max(1, min(cores, max_threads)) + 1):
+        job_mem = estimate_job_memory(n_taxa, threads, mem_per_taxon_mb, base_mem_mb)
+        parallel = min(n_jobs, cores // threads, int(mem_cap_mb // job_mem))
+        if parallel < 1:
+            continue
+        busy = parallel * threads
+        if busy > best_busy:
+            best, best_busy = (parallel, threads), busy
+    return best
+
+
+def process_tree_rss_mb(pid):
+    """
+    Sum the resident memory (MB) of a process and all of its descendants from /proc.
+    """
+    children = {}
+    rss = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as fh:
+                ppid = int(fh.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{entry}/statm") as fh:
+                rss[int(entry)] = int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    total = 0.0
+    stack = [pid]
+    while stack:
+        p = stack.pop()
+        total += rss.get(p, 0.0)
+        stack.extend(children.get(p, []))
+    return total
+
+
+def run_schedule(jobs, parallel, threads, mem_cap_mb, solver_threads=1, extra_args=(), poll=2.0):
+    """
+    Run jobs with at most `parallel` at once, keeping estimated and observed memory under the cap.
+
+    Jobs that share a pickled model folder run after the first job of that folder has finished.
+
+    Returns:
+    pandas.DataFrame: One row per job with timing, return code and peak RSS.
+    """
+    env = pinned_env(solver_threads)
+    pending = list(jobs.to_dict("records"))
+    built = set()
+    building = set()
+    running = {}
+    log = []
+    while pending or running:
+        observed_mb = sum(info["peak_rss_mb"] for info in running.values())
+        reserved_mb = sum(info["est_mem_mb"] for info in running.values())
+        for job in list(pending):
+            if len(running) >= parallel:
+                break
+            folder = job["pickled_gsmm_out"]
+            if folder in building:
+                continue
+            if max(reserved_mb, observed_mb) + job["est_mem_mb"] > mem_cap_mb and running:
+                break
+            pending.remove(job)
+            if folder not in built:
+                building.add(folder)
+            print(f"Starting {job['job_id']} with {threads} threads...")
+            proc = subprocess.Popen(job_argv(job, threads, extra_args), env=env)
+            running[proc] = {**job, "threads": threads, "start": time.time(), "peak_rss_mb": 0.0}
+            reserved_mb += job["est_mem_mb"]
+
+        time.sleep(poll)
+        for proc, info in list(running.items()):
+            info["peak_rss_mb"] = max(info["peak_rss_mb"], process_tree_rss_mb(proc.pid))
+            if proc.poll() is None:
+                continue
+            del running[proc]
+            building.discard(info["pickled_gsmm_out"])
+            built.add(info["pickled_gsmm_out"])
+            info["end"] = time.time()
+            info["wall_time"] = info["end"] - info["start"]
+            info["returncode"] = proc.returncode
+            status = "Completed" if proc.returncode == 0 else f"FAILED (exit code {proc.returncode})"
+            print(f"{status}: {info['job_id']} in {info['wall_time']:.0f}s, peak RSS {info['peak_rss_mb']:.0f} MB")
+            log.append(info)
+    return pd.DataFrame(log)
+
+
+def main(subject_ids, model_names, diets, tradeoffs, solver,
+         pickled_dir, diet_dir, growth_out_dir, added_metab_dir,
+         cores, mem_cap_gb, mem_per_taxon_mb, base_mem_mb,
+         default_taxa, max_threads, coverage_fp, solver_threads,
+         sample_timeout, log_fp, dry_run, fallback_solvers=None):
+    """
+    Plan and run a packed simulation sweep.
+
+    Jobs use micom's grow() unless `sample_timeout` is given; only then do they switch to the
+    fallback runner (robust_grow.py), whose solver chain is printed with the plan.
+    """
+    jobs = build_job_matrix(subject_ids, model_names, diets, tradeoffs, solver,
+                            pickled_dir, diet_dir, growth_out_dir, added_metab_dir)
+    host_cores, mem_total_mb = host_resources()
+    cores = cores or host_cores
+    mem_cap_mb = mem_cap_gb * 1024 if mem_cap_gb else 0.8 * mem_total_mb
+
+    coverage = pd.read_csv(coverage_fp) if coverage_fp else None
+    jobs["n_taxa"] = [estimate_sample_taxa(job, default_taxa, coverage) for job in jobs.to_dict("records")]
+    parallel, threads = choose_split(len(jobs), cores, mem_cap_mb, int(jobs["n_taxa"].max()),
+                                     max_threads, mem_per_taxon_mb, base_mem_mb)
+    jobs["est_mem_mb"] = [estimate_job_memory(n, threads, mem_per_taxon_mb, base_mem_mb) for n in jobs["n_taxa"]]
+
+    print(f"Host: {cores} cores, memory cap {mem_cap_mb / 1024:.1f} GB")
+    print(f"Plan: {len(jobs)} jobs, {parallel} at a time with {threads} sample workers each "
+          f"and {solver_threads or 1} solver/BLAS thread(s) per worker")
+
+    # only forward what was asked for: --sample_timeout switches the jobs to the fallback runner,
+    # which may solve slow samples with other solvers than the one in the output names
+    extra_args = []
+    if sample_timeout is not None:
+        extra_args += ["--sample_timeout", str(sample_timeout)]
+        if fallback_solvers is not None:
+            extra_args += ["--fallback_solvers"] + list(fallback_solvers)
+        chain = [solver] + list(fallback_solvers if fallback_solvers is not None else DEFAULT_FALLBACK_SOLVERS)
+        print(f"Per-sample timeout {sample_timeout:g}s; slow or failed samples are retried with "
+              f"{' -> '.join(chain)} (the solver of each sample is in the attempt_solver column)")
+    if solver_threads is not None:
+        extra_args += ["--solver_threads", str(solver_threads)]
+    if dry_run:
+        for job in jobs.to_dict("records"):
+            print(" ".join(job_argv(job, threads, extra_args)))
+        return
+
+    log = run_schedule(jobs, parallel, threads, mem_cap_mb, solver_threads or 1, extra_args)
+    log.to_csv(log_fp, index=False)
+    print(f"Schedule log saved to {log_fp}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a simulation sweep packed onto the available cores and memory")
+    parser.add_argument("--subject_ids", required=True, nargs="+", help="Subject IDs to simulate")
+    parser.add_argument("--model_names", required=True, nargs="+",
+                        help="Model database .qza files (e.g. agora201_refseq216_genus_1.qza)")
+    parser.add_argument("--diets", required=True, nargs="+", help="Diet .qza files in --diet_dir")
+    parser.add_argument("--tradeoffs", required=True, nargs="+", type=float, help="Cooperative tradeoff values")
+    parser.add_argument("--solver", default="gurobi", help="Specify solver (e.g. osqp, gurobi, cplex)")
+    parser.add_argument("--pickled_dir", default="../data/pickled_models/", help="Parent folder for pickled models")
+    parser.add_argument("--diet_dir", default="../data/diets/", help="Folder containing the diet .qza files")
+    parser.add_argument("--growth_out_dir", default="../data/growth_rates/", help="Folder for growth_*.zip outputs")
+    parser.add_argument("--added_metab_dir", default="../data/added_metabolites/",
+                        help="Folder for added metabolites .csv files")
+    parser.add_argument("--cores", type=int, default=None, help="Cores to use (default: all usable cores)")
+    parser.add_argument("--mem_cap_gb", type=float, default=None,
+                        help="Peak memory allowed for all running jobs (default: 80%% of total memory)")
+    parser.add_argument("--mem_per_taxon_mb", type=float, default=10,
+                        help="Estimated memory per taxon in a loaded community model (MB)")
+    parser.add_argument("--base_mem_mb", type=float, default=500, help="Estimated memory of a job's main process (MB)")
+    parser.add_argument("--default_taxa", type=int, default=100,
+                        help="Taxa per model assumed when no manifest or coverage table is available")
+    parser.add_argument("--max_threads", type=int, default=10,
+                        help="Maximum sample workers per job (more than the samples per subject is wasted)")
+    parser.add_argument("--coverage_fp", default=None,
+                        help="model_coverage_by_sample.csv from estimate_model_coverage.py for model size estimates")
+    parser.add_argument("--solver_threads", type=int, default=None,
+                        help="Solver threads per sample worker, passed to simulate_growth_rates_edited.py "
+                             "(BLAS threads are pinned to this or 1)")
+    parser.add_argument("--sample_timeout", type=float, default=None,
+                        help="Per-sample time budget passed to simulate_growth_rates_edited.py (seconds); "
+                             "switches the jobs to the fallback runner (default: micom grow())")
+    parser.add_argument("--fallback_solvers", nargs="*", default=None,
+                        help="Solvers tried after --solver with --sample_timeout "
+                             "(default: the simulate script's, hybrid osqp)")
+    parser.add_argument("--log_fp", default="schedule_log.csv", help="Where to save the schedule log")
+    parser.add_argument("--dry_run", action="store_true", help="Only print the plan and the commands")
+
+    args = parser.parse_args()
+
+    main(args.subject_ids, args.model_names, args.diets, args.tradeoffs, args.solver,
+         args.pickled_dir, args.diet_dir, args.growth_out_dir, args.added_metab_dir,
+         args.cores, args.mem_cap_gb, args.mem_per_taxon_mb, args.base_mem_mb,
+         args.default_taxa, args.max_threads, args.coverage_fp, args.solver_threads,
+         args.sample_timeout, args.log_fp, args.dry_run, args.fallback_solvers)
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Structured Telemetry and Profiling Hooks
+----------------------------------------
+
+Purpose:
+Progress was only reported with print(), so it was impossible to tell whether a run spent its
+time in QIIME2 subprocesses, build(), medium completion or the solver. The stages wrap their
+steps in `span(...)`, which appends one JSON line per step to a trace: name, stage, subject,
+sample, wall time, CPU time (including finished subprocesses such as qiime), peak RSS, process
+and thread, plus step fields such as the solver status and iteration count. The trace is
+converted to the Chrome trace format (chrome://tracing, Perfetto) or summarized per stage.
+
+Tracing is off unless `MICOM_TS_TRACE` names a JSONL file (`micom-ts --trace <file> ...` sets
+it). Worker processes and pipeline nodes inherit the environment and append to the same file.
+Profiling is opt-in per stage: with `MICOM_TS_PROFILE=cprofile` each matching span writes a
+`.prof` file (snakeviz, gprof2dot or flameprof turn it into a flame graph), with
+`MICOM_TS_PROFILE=py-spy` py-spy records a flame graph of the process while the span runs.
+Nested matching spans are part of the outermost one's profile.
+`MICOM_TS_PROFILE_STAGES` limits profiling to some stages (comma-separated) and
+`MICOM_TS_PROFILE_DIR` sets the output folder (default: next to the trace).
+
+Workflow:
+1. `configure(trace=..., profile=...)` (or the environment variables) switches tracing on.
+2. `with span("build", stage="grow", subject=...) as fields:` times a step; fields added to
+   the yielded dict inside the block (e.g. `fields.update(solver_stats(com))`) are recorded.
+3. `python telemetry.py chrome <trace.jsonl>` writes the Chrome trace, `summary` prints the
+   time per stage.
+
+Outputs:
+- The JSONL trace (one event per line) and optional `.prof`/`.svg` profiles.
+
+Usage:
+    micom-ts --trace ../data/traces/F01.jsonl --profile cprofile --profile_stages grow grow --subject_id F01 ...
+    python telemetry.py summary ../data/traces/F01.jsonl
+    python telemetry.py chrome ../data/traces/F01.jsonl --out ../data/traces/F01_chrome.json
+    python telemetry.py check
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import socket
+import argparse
+import resource
+import threading
+import subprocess
+from contextlib import contextmanager
+
+TRACE_ENV = "MICOM_TS_TRACE"
+PROFILE_ENV = "MICOM_TS_PROFILE"
+PROFILE_STAGES_ENV = "MICOM_TS_PROFILE_STAGES"
+PROFILE_DIR_ENV = "MICOM_TS_PROFILE_DIR"
+PROFILERS = ["cprofile", "py-spy"]
+
+# only one profiler can run in a process (a second cProfile raises from Python 3.12 on and cuts
+# the first short before), so spans nested in a profiled span are timed but not profiled
+_profiling = False
+
+
+def configure(trace=None, profile=None, profile_stages=None, profile_dir=None):
+    """
+    Switch tracing/profiling on for this process and every process it starts (through the
+    environment).
+
+    Parameters:
+    trace (str, optional): JSONL file the events are appended to.
+    profile (str, optional): "cprofile" or "py-spy".
+    profile_stages (list, optional): Only profile these stages (default: all).
+    profile_dir (str, optional): Folder for the profiles (default: next to the trace).
+    """
+    if trace is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(trace)), exist_ok=True)
+        os.environ[TRACE_ENV] = os.path.abspath(trace)
+    if profile is not None:
+        if profile not in PROFILERS:
+            raise ValueError(f"`{profile}` is not a valid profiler. Must be one of {', '.join(PROFILERS)}!")
+        os.environ[PROFILE_ENV] = profile
+    if profile_stages:
+        os.environ[PROFILE_STAGES_ENV] = ",".join(profile_stages)
+    if profile_dir is not None:
+        os.environ[PROFILE_DIR_ENV] = os.path.abspath(profile_dir)
+
+
+def _profiler_for(stage):
+    """
+    The profiler to use for a stage, or None.
+    """
+    profiler = os.environ.get(PROFILE_ENV)
+    stages = os.environ.get(PROFILE_STAGES_ENV)
+    if not profiler or (stages and stage not in stages.split(",")):
+        return None
+    return profiler
+
+
+def _profile_path(name, stage, fields, suffix):
+    trace_fp = os.environ.get(TRACE_ENV)
+    default_dir = os.path.join(os.path.dirname(trace_fp), "profiles") if trace_fp else "profiles"
+    profile_dir = os.environ.get(PROFILE_DIR_ENV, default_dir)
+    os.makedirs(profile_dir, exist_ok=True)
+    label = "_".join(str(fields[k]) for k in ("subject", "sample") if fields.get(k) is not None)
+    parts = [stage, name.replace(" ", "-"), label, str(os.getpid()), str(int(time.time() * 1000))]
+    return os.path.join(profile_dir, "_".join(p for p in parts if p) + suffix)
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB (ru_maxrss is in kB on Linux, bytes on macOS).
+    """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 ** 2 if sys.platform == "darwin" else maxrss / 1024
+
+
+def _cpu_time():
+    """
+    CPU time of this process and its finished child processes (user + system).
+    """
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def write_event(event):
+    """
+    Append one event to the trace (a single write, so processes can share the file).
+    """
+    trace_fp = os.environ.get(TRACE_ENV)
+    if not trace_fp:
+        return
+    line = json.dumps(event, default=str) + "\n"
+    with open(trace_fp, "a") as fh:
+        fh.write(line)
+
+
+def event(name, stage=None, **fields):
+    """
+    Record an instant event (e.g. a cache hit or a skipped sample).
+    """
+    if not os.environ.get(TRACE_ENV):
+        return
+    write_event({"name": name, "stage": stage or name, "ph": "i", "ts": time.time(), "pid": os.getpid(),
+                 "tid": threading.get_ident(), "host": socket.gethostname(), **fields})
+
+
+@contextmanager
+def span(name, stage=None, **fields):
+    """
+    Time a step and record it in the trace (and profile it if asked for its stage).
+
+    Parameters:
+    name (str): Name of the step (e.g. "build", "qiime tools export").
+    stage (str, optional): Stage the step belongs to (e.g. "grow"); defaults to `name`.
+    **fields: Extra fields such as subject, sample or solver.
+
+    Yields:
+    dict: The fields of the event; values added inside the block are recorded as well.
+    """
+    global _profiling
+    stage = stage or name
+    profiler = None if _profiling else _profiler_for(stage)
+    if not os.environ.get(TRACE_ENV) and profiler is None:
+        yield fields
+        return
+
+    profile, profile_fp, spy = None, None, None
+    if profiler == "cprofile":
+        import cProfile
+        profile = cProfile.Profile()
+        profile_fp = _profile_path(name, stage, fields, ".prof")
+    elif profiler == "py-spy":
+        if shutil.which("py-spy") is None:
+            print("py-spy is not installed; not profiling", file=sys.stderr)
+        else:
+            profile_fp = _profile_path(name, stage, fields, ".svg")
+            spy = subprocess.Popen(["py-spy", "record", "--pid", str(os.getpid()), "--output", profile_fp,
+                                    "--subprocesses", "--nonblocking"],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    owns_profiling = profile is not None or spy is not None
+    if owns_profiling:
+        _profiling = True
+    status, error = "ok", None
+    ts, start, cpu_start = time.time(), time.perf_counter(), _cpu_time()
+    if profile is not None:
+        profile.enable()
+    try:
+        yield fields
+    except BaseException as exc:
+        status, error = "error", f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(profile_fp)
+        if spy is not None:
+            # py-spy writes the flame graph when it is interrupted
+            spy.send_signal(signal.SIGINT)
+            spy.wait()
+        if owns_profiling:
+            _profiling = False
+        record = {"name": name, "stage": stage, "ph": "X", "ts": ts,
+                  "wall_time": time.perf_counter() - start, "cpu_time": _cpu_time() - cpu_start,
+                  "peak_rss_mb": round(peak_rss_mb(), 1), "pid": os.getpid(), "tid": threading.get_ident(),
+                  "host": socket.gethostname(), "status": status, **fields}
+        if error is not None:
+            record["error"] = error
+        if profile_fp is not None:
+            record["profile"] = profile_fp
+        write_event(record)
+
+
+def run_command(argv, stage, **fields):
+    """
+    Run a command (e.g. a qiime or biom call) with check=True inside a span named after it.
+    """
+    name = " ".join(argv[:3]) if argv[0] == "qiime" else " ".join(argv[:2])
+    with span(name, stage=stage, **fields):
+        return subprocess.run(argv, check=True)
+
+
+def solver_stats(model):
+    """
+    Status and iteration count of the last solve of a cobra/micom model, for span fields.
+
+    Returns:
+    dict: solver, solver_status and iterations (None where the interface does not report it, or
+    when micom restored the problem after the solve, as cooperative_tradeoff does).
+    """
+    solver = model.solver
+    interface = solver.interface.__name__.split(".")[-1].replace("_interface", "")
+    iterations = None
+    try:
+        problem = solver.problem
+        if interface == "gurobi":
+            iterations = int(problem.IterCount + problem.BarIterCount)
+        elif interface == "cplex":
+            iterations = int(problem.solution.progress.get_num_iterations())
+        elif interface == "glpk":
+            import swiglpk
+            iterations = int(swiglpk.glp_get_it_cnt(problem))
+        elif hasattr(problem, "info"):
+            # osqp and hybrid keep the info of the last OSQP or HiGHS solve
+            info = problem.info
+            if hasattr(info, "iter"):
+                iterations = int(info.iter)
+            else:
+                iterations = int(info.simplex_iteration_count + info.ipm_iteration_count)
+    except Exception:
+        pass
+    return {"solver": interface, "solver_status": solver.status, "iterations": iterations}
+
+
+def read_trace(trace_fp):
+    """
+    Read the events of a trace (skipping a line cut short by a killed process).
+    """
+    events = []
+    with open(trace_fp) as fh:
+        for line in fh:
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return events
+
+
+def to_chrome_trace(events):
+    """
+    Convert trace events to the Chrome trace format (open in chrome://tracing or Perfetto).
+
+    Returns:
+    dict: {"traceEvents": [...]} with one complete ("X") or instant ("i") event per span/event.
+    """
+    trace_events = []
+    for e in events:
+        args = {k: v for k, v in e.items() if k not in ("name", "stage", "ph", "ts", "wall_time", "pid", "tid")}
+        chrome = {"name": e["name"], "cat": e["stage"], "ph": e["ph"], "ts": e["ts"] * 1e6,
+                  "pid": e["pid"], "tid": e["tid"], "args": args}
+        if e["ph"] == "X":
+            chrome["dur"] = e["wall_time"] * 1e6
+        else:
+            chrome["s"] = "p"
+        trace_events.append(chrome)
+    processes = {(e["pid"], e.get("host")) for e in events}
+    for pid, host in processes:
+        trace_events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"{host} {pid}"}})
+    return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+
+def summarize_trace(events):
+    """
+    Time per stage and step: number of spans, total/max wall time, CPU time and peak RSS.
+
+    Returns:
+    pandas.DataFrame: One row per stage and step name, slowest first.
+    """
+    import pandas as pd
+    spans = pd.DataFrame([e for e in events if e["ph"] == "X"])
+    if spans.empty:
+        return spans
+    summary = spans.groupby(["stage", "name"]).agg(n=("wall_time", "size"), wall_time=("wall_time", "sum"),
+                                                   max_wall_time=("wall_time", "max"), cpu_time=("cpu_time", "sum"),
+                                                   peak_rss_mb=("peak_rss_mb", "max"),
+                                                   errors=("status", lambda s: int((s != "ok").sum())))
+    return summary.sort_values("wall_time", ascending=False).reset_index()
+
+
+def smoke_check():
+    """
+    Trace and cProfile nested spans of one stage in a temporary folder and check that both are
+    recorded and only the outer one is profiled (a nested cProfile raises on Python 3.12+).
+
+    Returns:
+    list: Problems found (empty if the check passed).
+    """
+    import glob
+    import tempfile
+    saved = {k: os.environ.get(k) for k in (TRACE_ENV, PROFILE_ENV, PROFILE_STAGES_ENV, PROFILE_DIR_ENV)}
+    problems = []
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            configure(trace=os.path.join(tmp, "trace.jsonl"), profile="cprofile", profile_stages=["check"],
+                      profile_dir=tmp)
+            with span("outer", stage="check"):
+                with span("inner", stage="check"):
+                    sum(range(1000))
+        except Exception as exc:
+            problems.append(f"nested spans failed: {type(exc).__name__}: {exc}")
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+        if not problems:
+            events = {e["name"]: e for e in read_trace(os.path.join(tmp, "trace.jsonl"))}
+            if set(events) != {"outer", "inner"}:
+                problems.append(f"expected the events outer and inner, got {sorted(events)}")
+            elif "profile" not in events["outer"] or "profile" in events["inner"]:
+                problems.append("expected a profile for the outer span only")
+            if len(glob.glob(os.path.join(tmp, "*.prof"))) != 1:
+                problems.append("expected exactly one .prof file")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert or summarize a telemetry trace, or smoke-check telemetry")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    chrome_parser = subparsers.add_parser("chrome", help="Write the trace in Chrome trace format")
+    chrome_parser.add_argument("trace", help="JSONL trace")
+    chrome_parser.add_argument("--out", default=None, help="Output JSON (default: <trace>_chrome.json)")
+    summary_parser = subparsers.add_parser("summary", help="Print the time per stage and step")
+    summary_parser.add_argument("trace", help="JSONL trace")
+    subparsers.add_parser("check", help="Smoke check of tracing and profiling (nested spans included)")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        problems = smoke_check()
+        for problem in problems:
+            print(f"FAILED: {problem}")
+        if problems:
+            sys.exit(1)
+        print("Telemetry check passed")
+        sys.exit(0)
+
+    events = read_trace(args.trace)
+    if args.command == "chrome":
+        out_fp = args.out or os.path.splitext(args.trace)[0] + "_chrome.json"
+        with open(out_fp, "w") as fh:
+            json.dump(to_chrome_trace(events), fh)
+        print(f"{len(events)} events written to {out_fp}")
+    else:
+        print(summarize_trace(events).to_string(index=False))
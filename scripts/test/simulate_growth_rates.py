@@ -1,13 +1,13 @@
-import micom
 import os
-import zipfile
-import pandas as pd
+import sys
 from pathlib import Path 
 import argparse
 from micom.workflows import build
 from micom import Community
 from micom.qiime_formats import load_qiime_medium
 from micom.workflows import grow, save_results, complete_community_medium 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from grow_helpers import load_subject_data, filter_first_n_sample_ids, add_suggested_metabolites, unzip_to_folder
 
 # Simulate growth rates for samples at each timepoint
 # need to do this for each subject id
@@ -15,76 +15,6 @@ from micom.workflows import grow, save_results, complete_community_medium
 # TO DO:
 # 1. Load the data generated by silva_taxonomy_mapping.py
 
-def load_subject_data(subject_id, qza_dir, collapse_on='genus'):
-    """
-    Load subject data and convert it to a MICOM-compatible format.
-    Parameters:
-    subject_id (str): The identifier for the subject.
-    qza_dir (str): The directory where the QIIME2 artifact files are located.
-    collapse_on (str, optional): The taxonomic level to collapse on. Default is 'genus'.
-    Returns:
-    micom.Community: A MICOM community object created from the subject's data.
-    """
-    
-    feature_table_fp = os.path.join(qza_dir, f"{subject_id}_feature_table.qza")
-    taxonomy_fp = os.path.join(qza_dir, f"{subject_id}_taxonomy.qza")
-    subject_micom = micom.taxonomy.qiime_to_micom(feature_table_fp,
-                                                  taxonomy_fp, 
-                                                  collapse_on=collapse_on)
-    
-    return subject_micom
-
-def filter_first_n_sample_ids(subject_micom, n=3):
-    # Get the first three unique sample_ids
-    first_n_ids = subject_micom["sample_id"].unique()[:n]
-    
-    # Filter the dataframe
-    filtered_subject_micom = subject_micom[subject_micom["sample_id"].isin(first_n_ids)].reset_index(drop=True)
-    
-    return filtered_subject_micom
-
-def add_suggested_metabolites(diet_og, diet_sugg, added_metab_out="added_metabolites.csv"):
-    """
-    This function takes in the original diet and the micom suggested (completed) diet 
-    and returns a new diet that includes the suggested metabolites 
-    without removing the original ones.
-    
-    Inputs: 
-    diet_og: pandas dataframe with the original diet
-    diet_sugg: pandas dataframe with the diet from micom complete_community_medium 
-    added_metab_out: path to output csv file for added metabolites
-
-    Returns:
-    diet_new: pandas dataframe with the original and new nonzero elements of suggested diet
-    """
-
-    diet_og = diet_og.reset_index(drop=True)
-    diet_sugg = diet_sugg.reset_index(drop=True)
-
-    diet_merged = pd.merge(diet_og, diet_sugg, on=['reaction', 'metabolite'], how='outer', suffixes=('_og', '_sugg'))
-    diet_merged["flux_diff"] = diet_merged["flux_sugg"] - diet_merged["flux_og"]
-    added_metabolites = diet_merged[diet_merged["flux_diff"] > 0]
-    added_metabolites = added_metabolites[["reaction", "metabolite", "global_id", "flux_sugg"]]
-    added_metabolites = added_metabolites.rename(columns={"flux_sugg": "flux"})
-    #print added_metabolites to a csv file
-    added_metabolites.to_csv(added_metab_out, index=False)
-    #add added_metabolites to diet_og
-    diet_new = pd.concat([diet_og, added_metabolites], ignore_index=True)
-    #reindex diet_new
-    diet_new = diet_new.reset_index(drop=True)
-    return diet_new
-
-def unzip_to_folder(growth_out_fp, out_folder):
-    """
-    Unzips the growth output file to the specified folder.
-    Parameters:
-    growth_out_fp (str): The path to the growth output file.
-    out_folder (str): The folder to unzip the file to.
-    """
-    # unzip the growth output .zip file and save contents to a folder by the same name
-    with zipfile.ZipFile(growth_out_fp, 'r') as zip_ref:
-        zip_ref.extractall(out_folder)
-
 #todo: reorder variables in main to match code and parser order
 def main(subject_id, qza_dir, 
          model_name, model_dir,
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Batch Diet Validation on One Set of Built Models
+------------------------------------------------
+
+Purpose:
+validate_medium.py builds the first samples of a subject and completes one diet per call.
+This script builds once and screens every diet in a list or folder in the same process, so
+diets that cannot support growth are dropped before launching a sweep. Each diet is first
+screened with cheap LPs (the maximal growth rate of every taxon on the unmodified diet, plus
+one joint check that all taxa reach `min_growth` together). Medium completion only runs for
+the diet/sample pairs that fail the joint check, to list the metabolites the diet is missing.
+
+Workflow:
+1. Build models for the first `n_samples` samples of the subject (once).
+2. For every sample (in parallel) and every diet:
+   a. maximize each taxon's growth rate on the diet (one LP per taxon),
+   b. check that all taxa reach `min_growth` and the community reaches `community_growth`,
+   c. if that fails, complete the diet with the LP relaxation (see ../fast_medium.py) and
+      record the added components as missing metabolites.
+3. Write the feasibility matrix, the missing metabolites and a per-diet summary.
+
+Inputs:
+- Subject feature table/taxonomy (.qza), a model database and diet .qza files
+  (`--diets` and/or `--diet_dir`; registered shorthands are accepted, see ../diet_registry.py).
+
+Outputs (in `--out_dir`):
+- `diet_feasibility.csv`: diet x sample x taxon max_growth and feasible.
+- `diet_missing_metabolites.csv`: per diet and metabolite, the samples that need it and the flux.
+- `diet_summary.csv`: per diet, feasible samples/taxa and number of missing metabolites.
+
+Usage:
+    python validate_diets.py --subject_id F01 --model_name agora201_refseq216_genus_1.qza \
+        --pickled_gsmm_out ../../data/pickled_models/test --solver gurobi --threads 10 \
+        --diet_dir ../../data/diets/
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import sys
+import glob
+import argparse
+import pandas as pd
+from micom import load_pickle
+from micom.workflows import build
+from micom.workflows.core import workflow
+from micom.workflows.media import process_medium
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from diet_registry import load_diet, diet_shorthand
+from fast_medium import medium_is_feasible, complete_medium_fast
+from grow_helpers import load_subject_data, filter_first_n_sample_ids
+
+
+def max_taxon_growth(com, medium):
+    """
+    Get the maximal growth rate of every taxon of a community on a medium (one LP per taxon).
+
+    Parameters:
+    com (micom.Community): The community model.
+    medium (pandas.Series): Import fluxes with exchange reaction IDs as index.
+
+    Returns:
+    pandas.Series: Maximal growth rate by taxon (0 if the taxon cannot grow).
+    """
+    rates = {}
+    with com:
+        com.medium = medium[medium.index.isin([r.id for r in com.exchanges])].to_dict()
+        for taxon in com.taxa:
+            com.objective = com.constraints["objective_" + taxon].expression
+            rates[taxon] = com.slim_optimize(error_value=0.0)
+    return pd.Series(rates)
+
+
+def _screen_sample(args):
+    """
+    Screen all diets for one sample (runs in a worker process, the model is loaded once).
+    """
+    sid, p, diets, community_growth, min_growth, max_import = args
+    com = load_pickle(p)
+    feasibility, joint, missing = [], [], []
+    for diet, medium in diets.items():
+        rates = max_taxon_growth(com, medium)
+        feasibility.append(pd.DataFrame({"diet": diet, "sample_id": sid, "taxon": rates.index,
+                                         "max_growth": rates.values,
+                                         "feasible": rates.values >= min_growth}))
+        ok = bool((rates >= min_growth).all()) and medium_is_feasible(com, medium, community_growth, min_growth)
+        joint.append({"diet": diet, "sample_id": sid, "jointly_feasible": ok})
+        if ok:
+            continue
+        try:
+            completed, _, _ = complete_medium_fast(com, medium, community_growth, min_growth,
+                                                   max_import, strategy="greedy")
+        except Exception:
+            joint[-1]["completion_failed"] = True
+            continue
+        for rid, flux in completed[~completed.index.isin(medium.index)].items():
+            met = list(com.reactions.get_by_id(rid).metabolites.keys())[0]
+            missing.append({"diet": diet, "sample_id": sid, "reaction": rid,
+                            "metabolite": met.id, "description": met.name, "flux": flux})
+    return pd.concat(feasibility), pd.DataFrame(joint), pd.DataFrame(missing)
+
+
+def summarize_diets(feasibility, joint, missing):
+    """
+    Summarize the screen per diet (sorted from most to least usable).
+    """
+    summary = joint.groupby("diet").agg(n_samples=("sample_id", "nunique"),
+                                        feasible_samples=("jointly_feasible", "sum")).reset_index()
+    taxa = feasibility.groupby("diet")["feasible"].agg(["size", "sum"]).reset_index()
+    taxa["infeasible_taxon_fraction"] = 1 - taxa["sum"] / taxa["size"]
+    summary = summary.merge(taxa[["diet", "infeasible_taxon_fraction"]], on="diet")
+    n_missing = missing.groupby("diet")["reaction"].nunique() if not missing.empty else pd.Series(dtype=int)
+    summary["n_missing_metabolites"] = summary["diet"].map(n_missing).fillna(0).astype(int)
+    return summary.sort_values(["feasible_samples", "infeasible_taxon_fraction", "n_missing_metabolites"],
+                               ascending=[False, True, True]).reset_index(drop=True)
+
+
+def main(subject_id, qza_dir, model_name, model_dir, pickled_gsmm_out, solver, threads,
+         diets, out_dir, n_samples=3, community_growth=0.1, min_growth=0.001, max_import=1):
+    model_fp = os.path.join(model_dir, model_name)
+    subject_micom = filter_first_n_sample_ids(load_subject_data(subject_id, qza_dir), n=n_samples)
+    manifest = build(subject_micom, out_folder=pickled_gsmm_out, model_db=model_fp,
+                     cutoff=0.0001, solver=solver, threads=threads)
+
+    samples = manifest.sample_id.unique()
+    media = {}
+    for diet_fp in diets:
+        medium = process_medium(load_diet(diet_fp).reset_index(drop=True), samples)
+        medium.loc[medium.flux < 1e-6, "flux"] = 1e-6
+        media[diet_shorthand(diet_fp)] = medium
+    args = [[s, os.path.join(pickled_gsmm_out, manifest[manifest.sample_id == s].file.iloc[0]),
+             {d: m.flux[m.sample_id == s] for d, m in media.items()},
+             community_growth, min_growth, max_import] for s in samples]
+    res = workflow(_screen_sample, args, threads=threads, description="Screening diets")
+
+    feasibility = pd.concat([r[0] for r in res], ignore_index=True)
+    joint = pd.concat([r[1] for r in res], ignore_index=True)
+    missing = pd.concat([r[2] for r in res], ignore_index=True)
+    if not missing.empty:
+        missing = (missing.groupby(["diet", "reaction", "metabolite", "description"])
+                   .agg(n_samples=("sample_id", "nunique"), max_flux=("flux", "max"))
+                   .reset_index().sort_values(["diet", "n_samples"], ascending=[True, False]))
+    summary = summarize_diets(feasibility, joint, missing)
+
+    os.makedirs(out_dir, exist_ok=True)
+    feasibility.to_csv(os.path.join(out_dir, "diet_feasibility.csv"), index=False)
+    missing.to_csv(os.path.join(out_dir, "diet_missing_metabolites.csv"), index=False)
+    summary.to_csv(os.path.join(out_dir, "diet_summary.csv"), index=False)
+    print(summary.to_string(index=False))
+    print(f"Diet validation results saved to {out_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Screen many diets on one set of built MICOM models")
+    parser.add_argument("--subject_id", required=True, help="subject ID to process")
+    parser.add_argument("--qza_dir", default="../../data/qiime_outputs/", help="Path to .qza feature table")
+    parser.add_argument("--model_dir", default="../../data/models/", help="Path to model directory")
+    parser.add_argument("--model_name", required=True, help="Name of .qza file for GSMM (e.g. agora103_genus.qza)")
+    parser.add_argument("--pickled_gsmm_out", required=True,
+                        help="Output directory for GSMM .pickle files generated during build()")
+    parser.add_argument("--solver", required=True, default="osqp", help="Specify solver (e.g. osqp, gurobi, cplex)")
+    parser.add_argument("--threads", type=int, default=1, help="Samples screened in parallel")
+    parser.add_argument("--diets", nargs="*", default=[], help="Diet .qza files or registered shorthands")
+    parser.add_argument("--diet_dir", default=None, help="Screen every .qza in this folder")
+    parser.add_argument("--n_samples", type=int, default=3, help="Number of (first) samples to build")
+    parser.add_argument("--community_growth", type=float, default=0.1, help="Minimum community growth rate")
+    parser.add_argument("--min_growth", type=float, default=0.001, help="Minimum growth rate of every taxon")
+    parser.add_argument("--max_import", type=float, default=1, help="Import rate of added components")
+    parser.add_argument("--out_dir", default="../../data/diet_validation/", help="Folder for the results")
+    args = parser.parse_args()
+
+    diets = list(args.diets)
+    if args.diet_dir is not None:
+        diets += sorted(glob.glob(os.path.join(args.diet_dir, "*.qza")))
+    if not diets:
+        parser.error("give diets with --diets and/or --diet_dir")
+
+    main(args.subject_id, args.qza_dir, args.model_name, args.model_dir, args.pickled_gsmm_out,
+         args.solver, args.threads, diets, args.out_dir, args.n_samples,
+         args.community_growth, args.min_growth, args.max_import)
@@ -0,0 +1,10 @@
+#!/bin/bash
+
+python3 validate_diets.py \
+    --subject_id F01 \
+    --model_name agora201_refseq216_genus_1.qza \
+    --pickled_gsmm_out ../../data/pickled_models/test \
+    --solver gurobi \
+    --threads 10 \
+    --diet_dir ../../data/diets/ \
+    --out_dir ../../data/diet_validation/
@@ -1,12 +1,13 @@
-import micom
 import os
-import pandas as pd
+import sys
 from pathlib import Path 
 import argparse
 from micom.workflows import build
 from micom import Community
-from micom.qiime_formats import load_qiime_medium
 from micom.workflows import grow, save_results, complete_community_medium 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from diet_registry import load_diet
+from grow_helpers import load_subject_data, filter_first_n_sample_ids
 
 # Simulate growth rates for samples at each timepoint
 # need to do this for each subject id
@@ -14,36 +15,6 @@ from micom.workflows import grow, save_results, complete_community_medium
 # TO DO:
 # 1. Load the data generated by silva_taxonomy_mapping.py
 
-def load_subject_data(subject_id, qza_dir, collapse_on='genus'):
-    """
-    Load subject data and convert it to a MICOM-compatible format.
-    Parameters:
-    subject_id (str): The identifier for the subject.
-    qza_dir (str): The directory where the QIIME2 artifact files are located.
-    collapse_on (str, optional): The taxonomic level to collapse on. Default is 'genus'.
-    Returns:
-    micom.Community: A MICOM community object created from the subject's data.
-    """
-    
-    feature_table_fp = os.path.join(qza_dir, f"{subject_id}_feature_table.qza")
-    taxonomy_fp = os.path.join(qza_dir, f"{subject_id}_taxonomy.qza")
-    subject_micom = micom.taxonomy.qiime_to_micom(feature_table_fp,
-                                                  taxonomy_fp, 
-                                                  collapse_on=collapse_on)
-    
-    return subject_micom
-
-import pandas as pd
-
-def filter_first_n_sample_ids(subject_micom, n=3):
-    # Get the first three unique sample_ids
-    first_n_ids = subject_micom["sample_id"].unique()[:n]
-    
-    # Filter the dataframe
-    filtered_subject_micom = subject_micom[subject_micom["sample_id"].isin(first_n_ids)].reset_index(drop=True)
-    
-    return filtered_subject_micom
-
 #todo: reorder variables in main to match code and parser order
 def main(subject_id, qza_dir, 
          model_name, model_dir,
@@ -60,7 +31,7 @@ def main(subject_id, qza_dir,
     #print(filtered_subject_micom)
     #agora_db = micom.qiime_formats.load_qiime_model_db(model_fp, model_extract_fp)
 
-    diet = load_qiime_medium(diet_fp)
+    diet = load_diet(diet_fp)
     #print(diet)
 
     manifest = build(filtered_subject_micom,
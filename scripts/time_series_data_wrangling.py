@@ -26,6 +26,8 @@ from scipy.interpolate import PchipInterpolator
 from pathlib import Path
 import argparse
 
+from telemetry import span
+
 # ---- Helper Functions ----
 
 def biom2df(biom_table):
@@ -192,9 +194,11 @@ def main(input_biom_path, metadata_path, output_dir, final_output_dir, subject_i
     Path(final_output_dir).mkdir(parents=True, exist_ok=True)
 
     print("Loading BIOM table and metadata...")
-    myotubiom = load_table(input_biom_path)
-    mymeta = pd.read_csv(metadata_path)
-    mybiom = biom2df(myotubiom)
+    with span("load biom", stage="wrangle") as fields:
+        myotubiom = load_table(input_biom_path)
+        mymeta = pd.read_csv(metadata_path)
+        mybiom = biom2df(myotubiom)
+        fields.update(n_otus=mybiom.shape[0], n_samples=mybiom.shape[1])
 
     output_interp_bioms = {}
     output_avg_subject_meta = {}
@@ -202,9 +206,11 @@ def main(input_biom_path, metadata_path, output_dir, final_output_dir, subject_i
 
     for subject in subject_ids:
         print(f"Processing data for subject {subject}...")
-        subject_metadata, subject_biom = meta_biom_filter(mymeta, mybiom, subject)
-        avg_subject_meta, avg_subject_biom = avg_sample_by_day(subject_metadata, subject_biom)
-        subject_interp_biom = interp_missing_day(avg_subject_meta, avg_subject_biom)
+        with span("average and interpolate", stage="wrangle", subject=subject) as fields:
+            subject_metadata, subject_biom = meta_biom_filter(mymeta, mybiom, subject)
+            avg_subject_meta, avg_subject_biom = avg_sample_by_day(subject_metadata, subject_biom)
+            subject_interp_biom = interp_missing_day(avg_subject_meta, avg_subject_biom)
+            fields.update(n_days=len(avg_subject_biom), n_interpolated=len(subject_interp_biom))
 
         subject_interp_biom.to_csv(f"{output_dir}{subject}_interp_biom.csv")
         avg_subject_biom.to_csv(f"{output_dir}{subject}_avg_biom.csv")
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Adaptive Cooperative Tradeoff Search
+------------------------------------
+
+Purpose:
+simulate_growth_loop.sh grows every subject/diet at all ten tradeoffs (0.1 ... 1.0), even
+though only the tradeoff that best matches the observed dynamics is used downstream. This
+script searches for that tradeoff instead. The agreement between simulated growth rates and
+actual CLR changes is treated as a function of the tradeoff, and golden-section search picks
+the next tradeoff to grow from the scores so far. The search first runs on an evenly spaced
+subset of the samples (cheap grow runs), then refines on the full series only inside the
+bracket left around the optimum, and stops once the bracket is narrower than `--tol`.
+
+Workflow:
+1. Build (or reuse) the subject's pickled models and complete the diet once.
+2. Coarse phase: golden-section search over [min_tradeoff, max_tradeoff] growing only a subset
+   of samples, until the bracket is narrower than `--coarse_tol`.
+3. Fine phase: golden-section search on the full series inside the coarse bracket until it is
+   narrower than `--tol`.
+4. Each evaluation filters prevalent taxa, joins the actual CLR changes and scores agreement
+   (see combine_sim_and_real_data.py and score_agreement.py). The metric is maximized.
+
+Inputs:
+- Same model/diet inputs as simulate_growth_rates_edited.py.
+- Actual CLR growth rates: `<actual_dir>/<subject>_clr_actual_growth_rates_by_genus.csv`.
+
+Outputs:
+- `tradeoff_search_<subject>_<model_db>_<diet>.csv`: one row per grow run (phase, tradeoff,
+  number of samples, metric, wall time) in `--out_dir`.
+- Full-series runs are saved to `--results_store` (if given), so they can be combined as usual.
+
+With the defaults (coarse_tol 0.1, tol 0.05) the search uses ~7 subset runs and 3-4 full runs
+per subject/diet instead of 10 full runs.
+
+Usage:
+    python tradeoff_search.py --subject_id F01 --model_name agora201_refseq216_genus_1.qza \
+        --pickled_gsmm_out ../data/pickled_models/pickled_F01_agora201_gurobi --solver gurobi \
+        --threads 10 --diet_fp ../data/diets/western_diet_gut_agora.qza \
+        --results_store ../data/results_store/
+
+Author: Laurie Lyon
+Date: 10/19/2026
+"""
+
+import os
+import time
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from grow_helpers import load_subject_data, add_suggested_metabolites
+from combine_sim_and_real_data import load_actual_clr, filter_prevalent, combine_run
+from score_agreement import score_groups
+from results_store import write_results
+from sweep_scheduler import model_shorthand
+from diet_registry import load_diet, diet_shorthand
+
+INVPHI = (np.sqrt(5) - 1) / 2
+METRICS = ["median_rho", "mean_rho", "percent_significant_positive"]
+
+
+def subset_samples(sample_ids, fraction):
+    """
+    Pick an evenly spaced subset of the (time-ordered) samples.
+
+    Parameters:
+    sample_ids (list): Sample IDs (epoch times).
+    fraction (float): Fraction of samples to keep (at least 5 samples are kept).
+
+    Returns:
+    list: The selected sample IDs in time order.
+    """
+    ordered = sorted(sample_ids, key=float)
+    n_keep = min(len(ordered), max(5, int(round(len(ordered) * fraction))))
+    idx = np.unique(np.round(np.linspace(0, len(ordered) - 1, n_keep)).astype(int))
+    return [ordered[i] for i in idx]
+
+
+def agreement_metric(growth_rates, subject_id, actual_clr, metric="median_rho",
+                     prevalence_threshold=0.5, lag=0, alpha=0.05):
+    """
+    Score how well one run's growth rates follow the actual CLR changes.
+
+    Parameters:
+    growth_rates (pandas.DataFrame): growth_rates table of a grow run.
+    subject_id (str): Subject of the run.
+    actual_clr (pandas.DataFrame): Output of `load_actual_clr` for the subject.
+    metric (str): "median_rho", "mean_rho" (Spearman across taxa) or "percent_significant_positive".
+    prevalence_threshold (float): Minimum taxon prevalence (as in combine_sim_and_real_data.py).
+    lag (int): Sample lag between simulated and observed values.
+    alpha (float): Significance level for percent_significant_positive.
+
+    Returns:
+    float: The metric (higher is better; NaN if no taxon could be scored).
+    """
+    combined = combine_run(filter_prevalent(growth_rates, prevalence_threshold), subject_id, actual_clr)
+    scores = score_groups(combined, ["taxon"], lag=lag, n_permutations=0).dropna(subset=["spearman_rho"])
+    if scores.empty:
+        return np.nan
+    if metric == "median_rho":
+        return scores["spearman_rho"].median()
+    if metric == "mean_rho":
+        return scores["spearman_rho"].mean()
+    significant_positive = (scores["spearman_p"] < alpha) & (scores["spearman_rho"] > 0)
+    return significant_positive.mean() * 100
+
+
+def golden_section_search(objective, lower, upper, tol, resolution=0.01):
+    """
+    Maximize a function of the tradeoff with golden-section search.
+
+    Tradeoffs are rounded to `resolution`, and `objective` should cache its values, so a
+    tradeoff is never grown twice.
+
+    Parameters:
+    objective (callable): Maps a tradeoff to a score (NaN is treated as the worst score).
+    lower, upper (float): Search interval.
+    tol (float): Stop once the bracket is narrower than this.
+    resolution (float): Precision of the evaluated tradeoffs.
+
+    Returns:
+    tuple: (best tradeoff of the final bracket's ends and interior points, best score,
+    (bracket lower, bracket upper))
+    """
+    def snap(x):
+        return round(round(x / resolution) * resolution, 10)
+
+    def f(x):
+        value = objective(x)
+        return -np.inf if np.isnan(value) else value
+
+    a, b = lower, upper
+    c, d = snap(b - INVPHI * (b - a)), snap(a + INVPHI * (b - a))
+    fc, fd = f(c), f(d)
+    while (b - a) > tol and d > c:
+        if fc >= fd:
+            b, d, fd = d, c, fc
+            c = snap(b - INVPHI * (b - a))
+            fc = f(c)
+        else:
+            a, c, fc = c, d, fd
+            d = snap(a + INVPHI * (b - a))
+            fd = f(d)
+    # the optimum can sit at an end of the range (e.g. tradeoff 1.0), which the interior points never reach
+    candidates = [(c, fc), (d, fd), (snap(a), f(snap(a))), (snap(b), f(snap(b)))]
+    best, best_score = max(candidates, key=lambda candidate: candidate[1])
+    return best, best_score, (a, b)
+
+
+def main(subject_id, qza_dir, model_name, model_dir, pickled_gsmm_out, solver, threads,
+         diet_fp, added_metab_out_dir, actual_dir, out_dir, results_store=None,
+         metric="median_rho", min_tradeoff=0.1, max_tradeoff=1.0, coarse_tol=0.1, tol=0.05,
+         subset_fraction=0.3, prevalence_threshold=0.5):
+    from micom.workflows import build, grow, complete_community_medium
+
+    model_fp = os.path.join(model_dir, model_name)
+    model_db = model_shorthand(model_name)
+    diet_short = diet_shorthand(diet_fp)
+
+    subject_micom = load_subject_data(subject_id, qza_dir)
+    manifest = build(subject_micom, out_folder=pickled_gsmm_out, model_db=model_fp,
+                     solver=solver, threads=threads)
+
+    diet_og = load_diet(diet_fp).reset_index(drop=True)
+    diet_sugg = complete_community_medium(manifest, model_folder=pickled_gsmm_out, medium=diet_og,
+                                          community_growth=0.1, min_growth=0.001,
+                                          minimize_components=True, max_import=1,
+                                          threads=threads).reset_index(drop=True)
+    os.makedirs(added_metab_out_dir, exist_ok=True)
+    added_metab_file = os.path.join(added_metab_out_dir,
+                                    f"added_metabolites_{subject_id}_{Path(model_name).stem}_{diet_short}.csv")
+    diet_new = add_suggested_metabolites(diet_og, diet_sugg, added_metab_out=added_metab_file)
+
+    actual_clr = load_actual_clr(subject_id, actual_dir)
+    subset = subset_samples(manifest.sample_id.unique(), subset_fraction)
+    phases = {"coarse": manifest[manifest.sample_id.isin(subset)], "fine": manifest}
+    log = []
+
+    def evaluate(phase, tradeoff):
+        # reuse earlier runs of the same phase and tradeoff
+        for row in log:
+            if row["phase"] == phase and np.isclose(row["tradeoff"], tradeoff):
+                return row[metric]
+        start = time.perf_counter()
+        growth = grow(phases[phase], pickled_gsmm_out, medium=diet_new, tradeoff=tradeoff,
+                      threads=threads, presolve=True)
+        score = agreement_metric(growth.growth_rates, subject_id, actual_clr, metric, prevalence_threshold)
+        if phase == "fine" and results_store is not None:
+            write_results(growth, results_store, subject_id, model_db, solver, diet_short, tradeoff)
+        log.append({"phase": phase, "tradeoff": tradeoff, "n_samples": phases[phase].sample_id.nunique(),
+                    metric: score, "wall_time": time.perf_counter() - start})
+        print(f"[{phase}] tradeoff {tradeoff:.2f}: {metric} = {score:.4f} "
+              f"({log[-1]['n_samples']} samples, {log[-1]['wall_time']:.0f}s)")
+        return score
+
+    coarse_best, _, (a, b) = golden_section_search(lambda x: evaluate("coarse", x),
+                                                   min_tradeoff, max_tradeoff, coarse_tol)
+    print(f"Coarse search on {len(subset)} samples: best tradeoff {coarse_best:.2f}, "
+          f"refining in [{a:.2f}, {b:.2f}] on all samples")
+    best, best_score, _ = golden_section_search(lambda x: evaluate("fine", x), a, b, tol)
+
+    os.makedirs(out_dir, exist_ok=True)
+    log_csv = os.path.join(out_dir, f"tradeoff_search_{subject_id}_{model_db}_{diet_short}.csv")
+    pd.DataFrame(log).to_csv(log_csv, index=False)
+    n_full = sum(row["phase"] == "fine" for row in log)
+    print(f"Best tradeoff for {subject_id} / {diet_short}: {best:.2f} ({metric} = {best_score:.4f}) "
+          f"after {len(log) - n_full} subset runs and {n_full} full runs. Log saved to {log_csv}")
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search the cooperative tradeoff that best matches observed growth")
+    parser.add_argument("--subject_id", required=True, help="subject ID to process")
+    parser.add_argument("--qza_dir", default="../data/qiime_outputs/", help="Path to .qza feature table")
+    parser.add_argument("--model_name", required=True, help="Model database file name")
+    parser.add_argument("--model_dir", default="../data/models/", help="Directory with model databases")
+    parser.add_argument("--pickled_gsmm_out", required=True, help="Folder for the pickled models")
+    parser.add_argument("--solver", required=True, help="Solver for build() and grow()")
+    parser.add_argument("--threads", type=int, default=1, help="Threads for build() and grow()")
+    parser.add_argument("--diet_fp", required=True, help="Path to the diet .qza")
+    parser.add_argument("--added_metab_out_dir", default="../data/added_metabolites/",
+                        help="Folder for the added metabolites CSV")
+    parser.add_argument("--actual_dir", default="../data/actual_growth_rates_genus_clr/",
+                        help="Folder with <subject>_clr_actual_growth_rates_by_genus.csv files")
+    parser.add_argument("--out_dir", default="../data/tradeoff_search/", help="Folder for the search log")
+    parser.add_argument("--results_store", default=None, help="Save the full-series runs to this results store")
+    parser.add_argument("--metric", default="median_rho", choices=METRICS, help="Agreement metric to maximize")
+    parser.add_argument("--min_tradeoff", type=float, default=0.1, help="Lower end of the search interval")
+    parser.add_argument("--max_tradeoff", type=float, default=1.0, help="Upper end of the search interval")
+    parser.add_argument("--coarse_tol", type=float, default=0.1, help="Bracket width that ends the subset phase")
+    parser.add_argument("--tol", type=float, default=0.05, help="Bracket width that ends the search")
+    parser.add_argument("--subset_fraction", type=float, default=0.3,
+                        help="Fraction of (evenly spaced) samples used in the subset phase")
+    parser.add_argument("--prevalence_threshold", type=float, default=0.5, help="Minimum taxon prevalence")
+    args = parser.parse_args()
+
+    main(args.subject_id, args.qza_dir, args.model_name, args.model_dir, args.pickled_gsmm_out,
+         args.solver, args.threads, args.diet_fp, args.added_metab_out_dir, args.actual_dir,
+         args.out_dir, args.results_store, args.metric, args.min_tradeoff, args.max_tradeoff,
+         args.coarse_tol, args.tol, args.subset_fraction, args.prevalence_threshold)